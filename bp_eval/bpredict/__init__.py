@@ -16,7 +16,14 @@
 #
 
 from .runner import *
+from .trace import *
 from .basepredictor import *
 from .utils import *
+from .tracestore import *
+from .checkpoint import *
+from .sweep import *
+from .results import *
+from .vectorized import *
+from .analysis import *
 from .statistics import *
 from .predictors import *
@@ -0,0 +1,288 @@
+#
+# Copyright 2019 Alexander Fasching
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+Analyze the mispredictions in recorded traces.
+
+All functions accept a TraceReader, the trace list of a predictor or a tuple
+with the address, outcome and prediction columns. Traces are processed chunk
+by chunk, and the branches of every chunk are grouped by address or table
+index with NumPy, so the memory only depends on the number of distinct
+branches and not on the length of the trace.
+"""
+
+__all__ = ('BranchStats', 'AliasingStats', 'branch_stats', 'hard_branches',
+           'windowed_misprediction_rate', 'aliasing_stats')
+
+import collections
+
+import numpy as np
+
+from .tracestore import TraceReader
+from .vectorized import CHUNK_SIZE, global_histories
+
+
+def _trace_chunks(trace, chunk_size=CHUNK_SIZE):
+    """Yield (addrs, taken, preds) arrays of int64 addresses and boolean
+    outcomes and predictions for every chunk of a trace.
+    """
+    if isinstance(trace, TraceReader):
+        for addrs, taken, preds in trace.chunks():
+            yield addrs.astype(np.int64), taken, preds
+        return
+
+    if isinstance(trace, tuple):
+        addrs, taken, preds = (np.asarray(c) for c in trace)
+    else:
+        # List of (branch_addr, taken, pred) tuples
+        columns = np.array(trace, dtype=np.int64).reshape(-1, 3)
+        addrs, taken, preds = columns.T
+
+    for start in range(0, len(addrs), chunk_size):
+        end = start + chunk_size
+        yield (addrs[start:end].astype(np.int64),
+               taken[start:end].astype(bool), preds[start:end].astype(bool))
+
+
+def _group_sums(keys, *weights):
+    """Return the unique keys and the number of elements and the sums of
+    the weights for each of them.
+    """
+    if len(keys) == 0:
+        empty = np.zeros(0, dtype=np.int64)
+        return (empty, ) * (len(weights) + 2)
+
+    # Branch addresses are usually close to each other, so they are counted
+    # with an offset instead of sorting them
+    low = int(keys.min())
+    if int(keys.max()) - low < 4 * len(keys):
+        offsets = keys - low
+        counts = np.bincount(offsets)
+        used = np.nonzero(counts)[0]
+        sums = [counts[used]]
+        for w in weights:
+            sums.append(np.bincount(offsets, weights=w)[used]
+                        .astype(np.int64))
+        return (used + low, ) + tuple(sums)
+
+    unique, inverse = np.unique(keys, return_inverse=True)
+    sums = [np.bincount(inverse, minlength=len(unique))]
+    for w in weights:
+        sums.append(np.bincount(inverse, weights=w,
+                                minlength=len(unique)).astype(np.int64))
+    return (unique, ) + tuple(sums)
+
+
+_BranchStatsBase = collections.namedtuple(
+        'BranchStats', 'addrs executions taken mispredictions')
+
+
+class BranchStats(_BranchStatsBase):
+    """Arrays with the address, the number of executions, the number of
+    taken outcomes and the number of mispredictions of every branch.
+    """
+    __slots__ = ()
+
+    @property
+    def misprediction_rate(self):
+        return self.mispredictions / self.executions
+
+    @property
+    def bias(self):
+        """Fraction of the executions in which the branch was taken."""
+        return self.taken / self.executions
+
+    def __len__(self):
+        return len(self.addrs)
+
+    def select(self, indices):
+        """Return the statistics of the branches at the given positions."""
+        return BranchStats(*(column[indices] for column in self))
+
+
+def branch_stats(trace):
+    """Count the executions, taken outcomes and mispredictions of every
+    branch address.
+
+    :return: BranchStats sorted by address.
+    """
+    parts = []
+    for addrs, taken, preds in _trace_chunks(trace):
+        parts.append(_group_sums(addrs, taken, taken != preds))
+
+    if not parts:
+        empty = np.zeros(0, dtype=np.int64)
+        return BranchStats(empty, empty, empty, empty)
+
+    # Merge the counts of the chunks, which are much shorter than the chunks
+    columns = [np.concatenate(c) for c in zip(*parts)]
+    unique, inverse = np.unique(columns[0], return_inverse=True)
+    sums = [np.bincount(inverse, weights=c, minlength=len(unique))
+            .astype(np.int64) for c in columns[1:]]
+    return BranchStats(unique, *sums)
+
+
+def hard_branches(trace, n=10, key='mispredictions', min_executions=1):
+    """Return the n branches that are hardest to predict.
+
+    :param trace: trace or BranchStats computed before.
+    :param key: 'mispredictions' sorts by the number of mispredictions and
+        'misprediction_rate' by the rate.
+    :param min_executions: ignore branches executed less often, which is
+        useful when sorting by the rate.
+    :return: BranchStats of the branches, the hardest one first.
+    """
+    stats = trace if isinstance(trace, BranchStats) else branch_stats(trace)
+    stats = stats.select(np.nonzero(stats.executions >= min_executions)[0])
+
+    # Stable sort, so branches with equal values stay ordered by address
+    order = np.argsort(-getattr(stats, key), kind='stable')
+    return stats.select(order[:n])
+
+
+def windowed_misprediction_rate(trace, window):
+    """Compute the misprediction rate of consecutive windows of branches.
+    The last window contains the remaining branches and may be shorter.
+
+    :param window: number of branches per window.
+    :return: float array with the rate of every window.
+    """
+    branches = []
+    mispredictions = []
+    start = 0
+    for addrs, taken, preds in _trace_chunks(trace):
+        windows = (np.arange(start, start + len(addrs)) // window)
+        first = start // window
+        windows -= first
+
+        counts = np.bincount(windows)
+        wrong = np.bincount(windows, weights=taken != preds)
+        if branches and first == len(branches) - 1:
+            # The chunk continues the last window of the previous one
+            branches[-1] += counts[0]
+            mispredictions[-1] += wrong[0]
+            counts, wrong = counts[1:], wrong[1:]
+
+        branches.extend(counts.tolist())
+        mispredictions.extend(wrong.tolist())
+        start += len(addrs)
+
+    return np.array(mispredictions) / np.array(branches, dtype=float)
+
+
+AliasingStats = collections.namedtuple(
+        'AliasingStats', 'entries shared_entries accesses collisions '
+                         'collision_mispredictions branches_per_entry')
+AliasingStats.__doc__ = """Aliasing in a table of a predictor.
+
+entries is the number of table entries used and shared_entries the number of
+entries used by more than one branch. collisions is the number of accesses
+to an entry whose previous access was by a different branch, and
+collision_mispredictions how many of them were mispredicted. The array
+branches_per_entry contains the number of distinct branches of every used
+entry."""
+
+
+def _unique_pairs(entries, addrs):
+    """Return the distinct (entry, address) pairs of two arrays, sorted by
+    entry. The pairs are packed into one integer with the number of the
+    address among the distinct ones, which sorts faster than two keys.
+    """
+    branches, ids = np.unique(addrs, return_inverse=True)
+    keys = np.unique((entries << 32) | ids.astype(np.int64))
+    return keys >> 32, branches[keys & 0xffffffff]
+
+
+def aliasing_stats(trace, index_fnc, histlength=None):
+    """Compute how often branches share the entries of a predictor table.
+
+    :param index_fnc: function returning the table indices for an array of
+        branch addresses, for example the _get_index method of the
+        Local2BitPredictor or the perceptron predictors.
+    :param histlength: if given, the index function is called with the
+        addresses and the global histories of this length, like the
+        _table_index method of the GSharePredictor. The history starts with
+        zeros at the beginning of the trace.
+    :return: AliasingStats.
+    """
+    ghr = 0
+    accesses = 0
+    collisions = 0
+    collision_mispredictions = 0
+    # Distinct (entry, address) pairs and the ones of the chunks since they
+    # were merged the last time
+    pairs = (np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64))
+    pending = [pairs]
+    npending = 0
+
+    # Address of the last access of every entry, -1 for unused entries
+    last = np.zeros(0, dtype=np.int64)
+
+    for addrs, taken, preds in _trace_chunks(trace):
+        if histlength is None:
+            indices = index_fnc(addrs)
+        else:
+            histories, ghr = global_histories(taken, ghr, histlength)
+            indices = index_fnc(addrs, histories)
+        indices = np.asarray(indices, dtype=np.int64)
+        if len(indices) == 0:
+            continue
+
+        size = int(indices.max()) + 1
+        if size > len(last):
+            last = np.concatenate(
+                    (last, np.full(size - len(last), -1, dtype=np.int64)))
+
+        # Order the accesses by entry and time, so the previous access of
+        # an entry is the previous element unless it's the first one
+        order = np.argsort(indices, kind='stable')
+        sindices = indices[order]
+        saddrs = addrs[order]
+        first = np.ones(len(order), dtype=bool)
+        first[1:] = sindices[1:] != sindices[:-1]
+
+        previous = np.empty_like(saddrs)
+        previous[1:] = saddrs[:-1]
+        previous[first] = last[sindices[first]]
+        collided = (previous != saddrs) & (previous != -1)
+
+        accesses += len(order)
+        collisions += int(np.count_nonzero(collided))
+        wrong = taken[order] != preds[order]
+        collision_mispredictions += int(np.count_nonzero(collided & wrong))
+
+        ends = np.ones(len(order), dtype=bool)
+        ends[:-1] = first[1:]
+        last[sindices[ends]] = saddrs[ends]
+
+        # Skip the accesses repeating the previous one of the same entry
+        # before merging the distinct (entry, branch) pairs
+        distinct = first | (previous != saddrs)
+        pending.append((sindices[distinct], saddrs[distinct]))
+        npending += np.count_nonzero(distinct)
+        if npending > max(len(pairs[0]), 4 * CHUNK_SIZE):
+            pairs = _unique_pairs(*map(np.concatenate, zip(*pending)))
+            pending = [pairs]
+            npending = 0
+
+    pairs = _unique_pairs(*map(np.concatenate, zip(*pending)))
+
+    entries, branches_per_entry = np.unique(pairs[0], return_counts=True)
+    return AliasingStats(len(entries),
+                         int(np.count_nonzero(branches_per_entry > 1)),
+                         accesses, collisions, collision_mispredictions,
+                         branches_per_entry)
@@ -19,6 +19,10 @@ __all__ = ('BasePredictor', 'RecordSettings')
 
 import enum
 
+import numpy as np
+
+from .tracestore import TraceWriter, TraceReader
+
 class RecordSettings(enum.IntEnum):
     NONE = 0
     CONDITIONAL = 1
@@ -33,9 +37,16 @@ class BasePredictor(object):
 
     :param record_trace: the branch address and taken/not-taken is recorded and
         can be accessed via the trace property.
+    :param trace_path: stream the recorded branches to a columnar trace file
+        instead of keeping them in memory. The trace property returns a
+        TraceReader once close_trace was called.
     """
 
-    trace = property(lambda self: self._trace)
+    def __new__(cls, *args, **kwargs):
+        self = super(BasePredictor, cls).__new__(cls)
+        # Arguments of the constructor, which are stored with the results
+        self._init_args = (args, kwargs)
+        return self
 
     def __init__(self, **kwargs):
         self._base_histories = dict()
@@ -44,13 +55,30 @@ class BasePredictor(object):
         self._record_trace = kwargs.get('record_trace', 0)
         self._trace = []
 
+        self._trace_path = kwargs.get('trace_path')
+        self._trace_writer = None
+        if self._trace_path is not None and self._record_trace:
+            self._trace_writer = TraceWriter(self._trace_path)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        # Open trace files can't be pickled
+        state['_trace_writer'] = None
+        return state
+
+    @property
+    def trace(self):
+        if self._trace_path is not None and self._record_trace:
+            return TraceReader(self._trace_path)
+        return self._trace
+
     def _next_key(self):
         self._base_history_cnt = (self._base_history_cnt & 0xFFFF) + 1
         return self._base_history_cnt
 
     def _base_lookup(self, tid, branch_addr, bp_history_index):
-        assert bp_history_index == 0
-        key = self._next_key()
+        # The simulator allocates the history index in newer protocol versions
+        key = bp_history_index or self._next_key()
         bp_history = dict(conditional=True, _index=key)
         self._base_histories[key] = bp_history
         pred = self.lookup(tid, branch_addr, bp_history)
@@ -58,8 +86,7 @@ class BasePredictor(object):
         return pred or False, key
 
     def _base_uncond_branch(self, tid, branch_addr, bp_history_index):
-        assert bp_history_index == 0
-        key = self._next_key()
+        key = bp_history_index or self._next_key()
         bp_history = dict(conditional=False, _index=key)
         self._base_histories[key] = bp_history
         self.uncond_branch(tid, branch_addr, bp_history)
@@ -83,7 +110,10 @@ class BasePredictor(object):
 
             if (cond and record_cond) or (not cond and record_uncond):
                 pred = bp_history.get('_prediction', 1)
-                self._trace.append((branch_addr, taken, int(pred)))
+                if self._trace_writer is not None:
+                    self._trace_writer.append(branch_addr, taken, pred)
+                else:
+                    self._trace.append((branch_addr, taken, int(pred)))
 
         self.update(tid, branch_addr, taken, bp_history, squashed)
         if not squashed:
@@ -95,9 +125,34 @@ class BasePredictor(object):
         self.squash(tid, bp_history)
         del self._base_histories[bp_history_index]
 
+    def simulate_trace(self, addrs, outcomes):
+        """Predict and update a sequence of committed conditional branches
+        one after another, like the AtomicSimpleCPU does. Table based
+        predictors override this with a vectorized implementation. The
+        branches are not recorded in the trace.
+
+        :param addrs: branch addresses.
+        :param outcomes: outcomes of the branches.
+        :return: boolean array with the predictions.
+        """
+        predictions = np.zeros(len(addrs), dtype=bool)
+        for i, (addr, taken) in enumerate(zip(addrs, outcomes)):
+            addr = int(addr)
+            taken = int(taken)
+            bp_history = dict(conditional=True)
+            predictions[i] = bool(self.lookup(0, addr, bp_history))
+            self.update(0, addr, taken, bp_history, False)
+        return predictions
+
     def reset_trace(self):
         self.trace = []
 
+    def close_trace(self):
+        """Finish the trace file if the trace is streamed to a file."""
+        if self._trace_writer is not None:
+            self._trace_writer.close()
+            self._trace_writer = None
+
     ###########################################################################
     # The following methods should be overridden.                             #
     ###########################################################################
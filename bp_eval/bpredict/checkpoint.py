@@ -0,0 +1,173 @@
+#
+# Copyright 2019 Alexander Fasching
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+Simulate the warm-up of a benchmark once and start every following run from
+a checkpoint.
+
+Checkpoints are taken with the AtomicSimpleCPU after a given number of
+instructions and stored in a cache directory under a hash of the benchmark,
+the instruction count and the simulator binary. Runners restore them with
+the checkpoint argument, which makes their instruction limit and statistics
+count from the checkpoint on.
+"""
+
+__all__ = ('Checkpoint', 'CheckpointCache')
+
+import collections
+import hashlib
+import os
+import shutil
+import tempfile
+
+from .runner import (CPUType, ExternalRunner, InternalRunner,
+                     FullSystemRunner)
+
+
+# Benchmark name in the checkpoint directory names of gem5
+BENCH_NAME = 'bpredict'
+
+CPU_NAMES = {
+    CPUType.MINOR_CPU: 'MinorCPU',
+    CPUType.ATOMIC_SIMPLE_CPU: 'AtomicSimpleCPU',
+}
+
+
+def _update_file(h, path):
+    with open(path, 'rb') as fp:
+        for block in iter(lambda: fp.read(2**20), b''):
+            h.update(block)
+
+
+def _update_program(h, prog, args, stdin):
+    """Hash a benchmark binary, its arguments and its input files."""
+    _update_file(h, prog)
+    for arg in args:
+        h.update(repr(arg).encode())
+        if os.path.isfile(str(arg)):
+            _update_file(h, str(arg))
+    h.update(repr(stdin).encode())
+
+
+def _update_simulator(h):
+    """Hash the size and modification time of the gem5 binary, so a rebuilt
+    simulator invalidates all cached results.
+    """
+    if os.path.exists(ExternalRunner.gem5path):
+        st = os.stat(ExternalRunner.gem5path)
+        h.update(repr((st.st_size, st.st_mtime_ns)).encode())
+
+
+_CheckpointBase = collections.namedtuple('Checkpoint', 'directory bench insts')
+
+
+class Checkpoint(_CheckpointBase):
+    """A checkpoint taken after insts instructions. gem5 stores it in the
+    subdirectory cpt.<bench>.<insts> of directory.
+    """
+    __slots__ = ()
+
+    @property
+    def path(self):
+        return os.path.join(self.directory,
+                            'cpt.%s.%d' % (self.bench, self.insts))
+
+    def take_options(self):
+        """Return the script options taking this checkpoint."""
+        return ['--checkpoint-dir', self.directory, '--bench', self.bench,
+                '--take-checkpoints', str(self.insts), '--at-instruction']
+
+    def restore_options(self, cputype):
+        """Return the script options restoring this checkpoint. The CPU is
+        restored as the given type instead of switching after the restore.
+        """
+        return ['--checkpoint-dir', self.directory, '--bench', self.bench,
+                '--checkpoint-restore', str(self.insts), '--at-instruction',
+                '--restore-with-cpu', CPU_NAMES[cputype]]
+
+
+class CheckpointCache(object):
+    """Directory of checkpoints, which are only simulated if missing.
+
+    :param directory: directory with the cached checkpoints.
+    """
+    def __init__(self, directory):
+        self.directory = directory
+
+    def get(self, prog, insts, args=None):
+        """Return the checkpoint of a syscall emulation benchmark after insts
+        instructions. Benchmarks reading from stdin are not supported, since
+        the input can't be rewound when restoring.
+        """
+        args = tuple(args or ())
+        h = hashlib.sha256(b'se')
+        _update_program(h, prog, args, None)
+        h.update(repr(insts).encode())
+        _update_simulator(h)
+
+        def take(checkpoint):
+            runner = InternalRunner('', prog, args=args,
+                                    options=checkpoint.take_options())
+            runner.run()
+            return runner
+
+        return self._get(h.hexdigest(), insts, take)
+
+    def get_fs(self, scriptcode, insts):
+        """Return the checkpoint of a full system run of scriptcode after
+        insts instructions. Runs restoring it have to use the same script.
+        """
+        h = hashlib.sha256(b'fs')
+        h.update(scriptcode.encode())
+        h.update(repr(insts).encode())
+        _update_simulator(h)
+
+        def take(checkpoint):
+            runner = FullSystemRunner(scriptcode,
+                                      options=checkpoint.take_options())
+            runner.run()
+            return runner
+
+        return self._get(h.hexdigest(), insts, take)
+
+    def _get(self, key, insts, take):
+        directory = os.path.join(self.directory, key)
+        checkpoint = Checkpoint(directory, BENCH_NAME, insts)
+        if os.path.isdir(checkpoint.path):
+            return checkpoint
+
+        # Simulate into a temporary directory first, so an interrupted run
+        # doesn't leave a broken checkpoint in the cache.
+        os.makedirs(self.directory, exist_ok=True)
+        tmpdir = tempfile.mkdtemp(dir=self.directory, suffix='.tmp')
+        try:
+            tmpcheckpoint = checkpoint._replace(directory=tmpdir)
+            runner = take(tmpcheckpoint)
+            if not os.path.isdir(tmpcheckpoint.path):
+                raise RuntimeError('No checkpoint after %d instructions:\n%s'
+                                   % (insts, runner.stderr))
+
+            try:
+                os.rename(tmpdir, directory)
+            except OSError:
+                # Another process stored the same checkpoint in the meantime
+                if not os.path.isdir(checkpoint.path):
+                    raise
+        finally:
+            shutil.rmtree(tmpdir, ignore_errors=True)
+
+        return checkpoint
@@ -17,7 +17,13 @@
 
 __all__ = ('GSelectPredictor', )
 
+from array import array
+
+import numpy as np
+
 from ..basepredictor import BasePredictor
+from ..vectorized import (COUNTER_NEXT, simulate_counters, global_histories,
+                          trace_chunks)
 
 
 class GSelectPredictor(BasePredictor):
@@ -31,7 +37,7 @@ class GSelectPredictor(BasePredictor):
         self._histmask = 2**histlength - 1
         self._addrmask = 2**addrlength - 1
 
-        self._table = [3 for _ in range(2**(histlength + addrlength))]
+        self._table = array('B', [3]) * 2**(histlength + addrlength)
         self._ghr = 0
 
     def lookup(self, tid, branch_addr, bp_history):
@@ -43,13 +49,30 @@ class GSelectPredictor(BasePredictor):
             return
 
         index = self._get_index(branch_addr)
-        if taken:
-            self._table[index] = min(self._table[index] + 1, 3)
-        else:
-            self._table[index] = max(self._table[index] - 1, 0)
+        self._table[index] = COUNTER_NEXT[taken][self._table[index]]
 
         self._ghr = ((self._ghr << 1) | taken) & self._histmask
 
-    def _get_index(self, branch_addr):
+    def simulate_trace(self, addrs, outcomes):
+        """The predictor is also updated by unconditional branches, so they
+        have to be part of the trace to get the same results as in gem5.
+        """
+        table = np.frombuffer(self._table, dtype=np.uint8)
+        predictions = [np.zeros(0, dtype=bool)]
+        for chunk_addrs, chunk_outcomes in trace_chunks(addrs, outcomes):
+            histories, self._ghr = global_histories(
+                    chunk_outcomes, self._ghr, self._histlength)
+            indices = self._table_index(chunk_addrs, histories)
+            predictions.append(
+                    simulate_counters(table, indices, chunk_outcomes))
+        return np.concatenate(predictions)
+
+    def _table_index(self, branch_addr, history):
+        """Index of the counter of a branch with the given global history.
+        Also works with arrays of addresses and histories.
+        """
         addrbits = (branch_addr >> 2) & self._addrmask
-        return (addrbits << self._histlength) | self._ghr
+        return (addrbits << self._histlength) | history
+
+    def _get_index(self, branch_addr):
+        return self._table_index(branch_addr, self._ghr)
@@ -17,7 +17,14 @@
 
 __all__ = ('GSharePredictor', )
 
+from array import array
+
+import numpy as np
+
 from ..basepredictor import BasePredictor
+from ..utils import SpeculativeHistory
+from ..vectorized import (COUNTER_NEXT, simulate_counters, global_histories,
+                          trace_chunks)
 
 
 class GSharePredictor(BasePredictor):
@@ -26,21 +33,20 @@ class GSharePredictor(BasePredictor):
         super(GSharePredictor, self).__init__(**kwargs)
 
         self._histlength = histlength
-        self._table = [3 for _ in range(2**histlength)]
-        self._ghr = 0
-        self._spec = []
+        self._table = array('B', [3]) * 2**histlength
+        self._history = SpeculativeHistory(histlength)
         self._mask = 2**histlength - 1
 
     def lookup(self, tid, branch_addr, bp_history):
         index = self._get_spec_index(branch_addr)
         p = self._table[index] >= 2
-        self._spec.append(p)
+        self._history.push(p)
         return p
 
     def btb_update(self, tid, branch_addr, bp_history):
         """Set the outcome of the last speculative prediction to not taken."""
         if bp_history['conditional']:
-            self._spec[-1] = 0
+            self._history.replace(0)
 
     def squash(self, tid, bp_history):
         """Squashing starts at the tip of the current path, so we remove the
@@ -48,26 +54,38 @@ class GSharePredictor(BasePredictor):
         """
         # TODO: This is only called for the MinorCPU?
         if bp_history['conditional']:
-            self._spec.pop()
+            self._history.pop()
 
     def update(self, tid, branch_addr, taken, bp_history, squashed):
         if squashed or not bp_history['conditional']:
             return
 
         index = self._get_index(branch_addr)
-        if taken:
-            self._table[index] = min(self._table[index] + 1, 3)
-        else:
-            self._table[index] = max(self._table[index] - 1, 0)
+        self._table[index] = COUNTER_NEXT[taken][self._table[index]]
+
+        self._history.commit(taken)
 
-        self._ghr = ((self._ghr << 1) | taken) & self._mask
-        self._spec.pop(0)
+    def simulate_trace(self, addrs, outcomes):
+        assert not self._history, 'Branches in flight'
+        table = np.frombuffer(self._table, dtype=np.uint8)
+        predictions = [np.zeros(0, dtype=bool)]
+        for chunk_addrs, chunk_outcomes in trace_chunks(addrs, outcomes):
+            histories, ghr = global_histories(
+                    chunk_outcomes, self._history.committed, self._histlength)
+            self._history.reset(ghr)
+            indices = self._table_index(chunk_addrs, histories)
+            predictions.append(
+                    simulate_counters(table, indices, chunk_outcomes))
+        return np.concatenate(predictions)
+
+    def _table_index(self, branch_addr, history):
+        """Index of the counter of a branch with the given global history.
+        Also works with arrays of addresses and histories.
+        """
+        return ((branch_addr >> 2) ^ history) & self._mask
 
     def _get_index(self, branch_addr):
-        return ((branch_addr // 4) ^ self._ghr) & self._mask
+        return self._table_index(branch_addr, self._history.committed)
 
     def _get_spec_index(self, branch_addr):
-        n = len(self._spec)
-        th = sum(2**(n - i - 1) * t for i, t in enumerate(self._spec))
-        ghr = ((self._ghr << n) | th) & self._mask
-        return ((branch_addr // 4) ^ ghr) & self._mask
+        return self._table_index(branch_addr, self._history.value)
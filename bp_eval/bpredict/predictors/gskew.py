@@ -17,7 +17,14 @@
 
 __all__ = ('GSkewPredictor', )
 
+from array import array
+
+import numpy as np
+
 from ..basepredictor import BasePredictor
+from ..utils import SpeculativeHistory
+from ..vectorized import (COUNTER_NEXT, simulate_counters, global_histories,
+                          trace_chunks)
 
 
 class HashFunctions(object):
@@ -59,16 +66,12 @@ class GSkewPredictor(BasePredictor):
         self._hash_fncs = hash_fncs
         self._npreds = len(hash_fncs)
 
-        self._tables = [[3 for _ in range(2**histlength)] for _ in hash_fncs]
-        self._ghr = 0
+        self._tables = [array('B', [3]) * 2**histlength for _ in hash_fncs]
+        self._history = SpeculativeHistory(histlength)
         self._mask = 2**histlength - 1
-        self._spec_history = []
 
     def lookup(self, tid, branch_addr, bp_history):
-
-        n = len(self._spec_history)
-        th = sum(2**(n - i - 1) * t for i, t in enumerate(self._spec_history))
-        ghr = ((self._ghr << n) | th) & self._mask
+        ghr = self._history.value
 
         predictions = []
         for i, hash_fnc in enumerate(self._hash_fncs):
@@ -76,13 +79,13 @@ class GSkewPredictor(BasePredictor):
             predictions.append(self._tables[i][index] >= 2)
 
         p = sum(predictions) >= self._npreds / 2
-        self._spec_history.append(p)
+        self._history.push(p)
         return p
 
     def btb_update(self, tid, branch_addr, bp_history):
         """Set the outcome of the last speculative prediction to not taken."""
         if bp_history['conditional']:
-            self._spec_history[-1] = 0
+            self._history.replace(0)
 
     def squash(self, tid, bp_history):
         """Squashing starts at the tip of the current path, so we remove the
@@ -90,19 +93,35 @@ class GSkewPredictor(BasePredictor):
         """
         # TODO: This is only called for the MinorCPU?
         if bp_history['conditional']:
-            self._spec_history.pop()
+            self._history.pop()
 
     def update(self, tid, branch_addr, taken, bp_history, squashed):
         if squashed or not bp_history['conditional']:
             return
 
         for i, hash_fnc in enumerate(self._hash_fncs):
-            index = hash_fnc(branch_addr & self._mask, self._ghr)
-            if taken:
-                self._tables[i][index] = min(self._tables[i][index] + 1, 3)
-            else:
-                self._tables[i][index] = max(self._tables[i][index] - 1, 0)
+            index = hash_fnc(branch_addr & self._mask,
+                             self._history.committed)
+            table = self._tables[i]
+            table[index] = COUNTER_NEXT[taken][table[index]]
 
-        self._spec_history.pop(0)
+        self._history.commit(taken)
 
-        self._ghr = ((self._ghr << 1) | taken) & self._mask
+    def simulate_trace(self, addrs, outcomes):
+        """The hash functions are called with arrays of addresses and
+        histories, so they must only use arithmetic and bitwise operators.
+        """
+        assert not self._history, 'Branches in flight'
+        tables = [np.frombuffer(t, dtype=np.uint8) for t in self._tables]
+        predictions = [np.zeros(0, dtype=bool)]
+        for chunk_addrs, chunk_outcomes in trace_chunks(addrs, outcomes):
+            histories, ghr = global_histories(
+                    chunk_outcomes, self._history.committed, self._histlength)
+            self._history.reset(ghr)
+
+            votes = np.zeros(len(chunk_addrs), dtype=np.int64)
+            for table, hash_fnc in zip(tables, self._hash_fncs):
+                indices = hash_fnc(chunk_addrs & self._mask, histories)
+                votes += simulate_counters(table, indices, chunk_outcomes)
+            predictions.append(votes >= self._npreds / 2)
+        return np.concatenate(predictions)
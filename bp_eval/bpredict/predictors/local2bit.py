@@ -21,7 +21,12 @@ Sample implementation of the local 2-bit predictor provided by gem5.
 
 __all__ = ('Local2BitPredictor', )
 
+from array import array
+
+import numpy as np
+
 from ..basepredictor import BasePredictor
+from ..vectorized import COUNTER_NEXT, simulate_counters, trace_chunks
 
 
 class Local2BitPredictor(BasePredictor):
@@ -30,7 +35,7 @@ class Local2BitPredictor(BasePredictor):
         super(Local2BitPredictor, self).__init__(**kwargs)
 
         self._ncounters = ncounters
-        self._table = [3 for _ in range(ncounters)]
+        self._table = array('B', [3]) * ncounters
 
     def lookup(self, tid, branch_addr, bp_history):
         index = self._get_index(branch_addr)
@@ -42,10 +47,16 @@ class Local2BitPredictor(BasePredictor):
             return
 
         index = self._get_index(branch_addr)
-        if taken:
-            self._table[index] = min(self._table[index] + 1, 3)
-        else:
-            self._table[index] = max(self._table[index] - 1, 0)
+        self._table[index] = COUNTER_NEXT[taken][self._table[index]]
+
+    def simulate_trace(self, addrs, outcomes):
+        table = np.frombuffer(self._table, dtype=np.uint8)
+        predictions = [np.zeros(0, dtype=bool)]
+        for chunk_addrs, chunk_outcomes in trace_chunks(addrs, outcomes):
+            indices = (chunk_addrs >> 2) % self._ncounters
+            predictions.append(
+                    simulate_counters(table, indices, chunk_outcomes))
+        return np.concatenate(predictions)
 
     def _get_index(self, branch_addr):
         return ((branch_addr // 4) % self._ncounters)
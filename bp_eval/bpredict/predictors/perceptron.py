@@ -25,10 +25,19 @@ __all__ = ('PerceptronPredictor', 'LocalPerceptronPredictor',
 
 import numpy as np
 from ..basepredictor import BasePredictor
+from ..utils import SpeculativeHistory, SpeculativeHistoryTable
+from ..vectorized import _segments, trace_chunks
+
+
+# Number of branches simulated at once. The history windows of a chunk are
+# kept in memory.
+CHUNK_SIZE = 2**16
 
 
 class Perceptron(object):
-    """Implementation of a perceptron with optional clipping."""
+    """Implementation of a perceptron with optional clipping. The predictors
+    use a PerceptronTable, this class is kept to load old results.
+    """
     def __init__(self, length, threshold=1.0, clip=np.infty):
         self._weights = np.zeros(length + 1)
         self._weights[0] = 1.0
@@ -51,6 +60,158 @@ class Perceptron(object):
             self._weights = np.clip(diff, -self._clip, self._clip)
 
 
+class PerceptronTable(object):
+    """The weights of all perceptrons of a predictor in one integer matrix.
+    Row i contains the bias weight of perceptron i followed by the weights of
+    the history. The weights are updated in place and saturate at the clipping
+    value, which is rounded towards zero.
+    """
+    def __init__(self, nperceptrons, length, threshold=1.0, clip=np.infty):
+        if np.isinf(clip):
+            self._clip = None
+            dtype = np.int64
+        else:
+            self._clip = int(clip)
+            dtype = np.int32
+
+        self.weights = np.zeros((nperceptrons, length + 1), dtype=dtype)
+        self.weights[:, 0] = 1
+        self._threshold = threshold
+
+    def output(self, index, *histories):
+        """Compute the output of a perceptron. The histories are int8 arrays
+        of -1, 0 and 1, which are concatenated to the input of the perceptron.
+        """
+        weights = self.weights[index]
+        y = int(weights[0])
+        offset = 1
+        for history in histories:
+            end = offset + len(history)
+            y += int(np.dot(weights[offset:end], history))
+            offset = end
+        return y
+
+    def train(self, index, y, taken, *histories):
+        """Update a perceptron once the output of a branch is known.
+
+        :param y: output of the perceptron for the histories.
+        :param taken: -1 if the branch was not taken and 1 if it was taken.
+        """
+        if y * taken > 0 and abs(y) >= self._threshold:
+            return
+
+        weights = self.weights[index]
+        weights[0] += taken
+        op = np.add if taken > 0 else np.subtract
+        offset = 1
+        for history in histories:
+            end = offset + len(history)
+            op(weights[offset:end], history, out=weights[offset:end])
+            offset = end
+
+        if self._clip is not None:
+            np.minimum(weights, self._clip, out=weights)
+            np.maximum(weights, -self._clip, out=weights)
+
+    def simulate(self, indices, taken, *windows):
+        """Predict and train the perceptrons for a sequence of committed
+        branches.
+
+        :param indices: perceptron used by every branch.
+        :param taken: int8 array with -1 and 1 for the outcome of every branch.
+        :param windows: matrices with the histories of every branch.
+        :return: boolean array with the predictions.
+        """
+        predictions = np.zeros(len(indices), dtype=bool)
+        output = self.output
+        train = self.train
+        for i, (index, t) in enumerate(zip(indices.tolist(), taken.tolist())):
+            histories = [w[i] for w in windows]
+            y = output(index, *histories)
+            predictions[i] = y >= 0
+            train(index, y, t, *histories)
+        return predictions
+
+
+class HistoryBuffer(object):
+    """Circular buffers with the last outcomes of one or more histories.
+    Every value is stored twice, so the window of the last outcomes is always
+    a contiguous view, ordered from the oldest to the newest outcome.
+    """
+    def __init__(self, length, rows=1):
+        self._length = length
+        self._buffer = np.zeros((rows, 2 * length), dtype=np.int8)
+        self._pos = [0] * rows
+
+    def window(self, row=0):
+        """Return a view of the last outcomes."""
+        pos = self._pos[row]
+        return self._buffer[row, pos:pos + self._length]
+
+    def push(self, value, row=0):
+        """Append an outcome and drop the oldest one."""
+        if not self._length:
+            return
+        pos = self._pos[row]
+        self._buffer[row, pos] = value
+        self._buffer[row, pos + self._length] = value
+        self._pos[row] = (pos + 1) % self._length
+
+    def replay(self, rows, values):
+        """Push a sequence of outcomes and return the window of every row
+        before each push as matrix.
+        """
+        n = len(rows)
+        length = self._length
+        windows = np.zeros((n, length), dtype=np.int8)
+        if n == 0 or length == 0:
+            return windows
+
+        order, srows, positions, ends = _segments(rows)
+        svalues = values[order]
+        pos = np.array(self._pos)
+        initial = self._buffer[srows[:, None],
+                               pos[srows][:, None] + np.arange(length)]
+
+        # Column c of the window at position p within a row is element p + c
+        # of the initial window followed by the pushed values.
+        elements = np.arange(n)
+        for c in range(length):
+            src = positions + c
+            windows[:, c] = np.where(
+                    src < length,
+                    initial[elements, np.minimum(src, length - 1)],
+                    svalues[np.maximum(elements + c - length, 0)])
+
+        # Store the windows after the last push of every row
+        last = np.nonzero(ends)[0]
+        final = np.concatenate((windows[last, 1:],
+                                svalues[last, None]), axis=1)
+        self._buffer[srows[last], :length] = final
+        self._buffer[srows[last], length:] = final
+        pos[srows[last]] = 0
+        self._pos = pos.tolist()
+
+        result = np.empty_like(windows)
+        result[order] = windows
+        return result
+
+
+def _speculative_window(window, spec_history):
+    """Split the speculative history into the committed part of the window
+    and the predictions of the branches in flight.
+    """
+    n = min(len(spec_history), len(window))
+    if n == 0:
+        return (window, )
+    recent = np.array(spec_history.recent(n), dtype=np.int8) * 2 - 1
+    return (window[n:], recent)
+
+
+def _outcome_values(outcomes):
+    return np.where(outcomes, 1, -1).astype(np.int8)
+
+
 class PerceptronPredictor(BasePredictor):
     """A perceptron predictor with optional support for a speculative history.
     If speculation is enabled, the predictor tracks its predictions and uses
@@ -62,36 +223,35 @@ class PerceptronPredictor(BasePredictor):
         super(PerceptronPredictor, self).__init__(**kwargs)
         self._nperceptrons = nperceptrons
         self._histlength = histlength
-        self._global_history = np.zeros(histlength)
+        self._global_history = HistoryBuffer(histlength)
 
-        self._table = [Perceptron(histlength, threshold=threshold, clip=clip)
-                            for _ in range(nperceptrons)]
+        self._table = PerceptronTable(nperceptrons, histlength,
+                                      threshold=threshold, clip=clip)
 
         # The predictor tracks predictions not yet commited (update not called)
         # and bases speculative predictions based on this temporary history.
         # Assume that the speculative history is unbounded for simplicity.
         self._speculative = speculative
-        self._spec_history = []
+        self._spec_history = SpeculativeHistory(histlength)
 
     def lookup(self, tid, branch_addr, bp_history):
         index = self._get_index(branch_addr)
 
-        hist = self._global_history
+        hist = (self._global_history.window(), )
         if self._speculative:
-            tmp = np.concatenate((self._global_history, self._spec_history))
-            hist = tmp[-self._histlength:]
+            hist = _speculative_window(hist[0], self._spec_history)
 
-        p =  self._table[index].predict(hist)
+        p = self._table.output(index, *hist) >= 0
 
         if self._speculative:
-            self._spec_history.append(1 if p else -1)
+            self._spec_history.push(p)
 
         return p
 
     def btb_update(self, tid, branch_addr, bp_history):
         """Set the outcome of the last speculative prediction to not taken."""
         if bp_history['conditional'] and self._speculative:
-            self._spec_history[-1] = -1
+            self._spec_history.replace(0)
 
     def squash(self, tid, bp_history):
         """Squashing starts at the tip of the current path, so we remove the
@@ -108,16 +268,28 @@ class PerceptronPredictor(BasePredictor):
 
         index = self._get_index(branch_addr)
         t = 1 if taken else -1
-        self._table[index].update(self._global_history, t)
+        hist = self._global_history.window()
+        self._table.train(index, self._table.output(index, hist), t, hist)
 
         if self._speculative:
-            self._spec_history.pop(0)
-
-        self._global_history = np.roll(self._global_history, -1)
-        self._global_history[-1] = t
+            self._spec_history.commit(taken)
+
+        self._global_history.push(t)
+
+    def simulate_trace(self, addrs, outcomes):
+        assert not self._spec_history, 'Branches in flight'
+        predictions = [np.zeros(0, dtype=bool)]
+        for chunk_addrs, chunk_outcomes in trace_chunks(addrs, outcomes,
+                                                        CHUNK_SIZE):
+            indices = self._get_index(chunk_addrs)
+            values = _outcome_values(chunk_outcomes)
+            windows = self._global_history.replay(
+                    np.zeros(len(values), dtype=np.int64), values)
+            predictions.append(self._table.simulate(indices, values, windows))
+        return np.concatenate(predictions)
 
     def _get_index(self, branch_addr):
-        return ((branch_addr // 4) % len(self._table))
+        return ((branch_addr // 4) % self._nperceptrons)
 
 
 class LocalPerceptronPredictor(BasePredictor):
@@ -132,37 +304,37 @@ class LocalPerceptronPredictor(BasePredictor):
         super(LocalPerceptronPredictor, self).__init__(**kwargs)
         self._nperceptrons = nperceptrons
         self._histlength = histlength
-        self._histories = [np.zeros(histlength) for _ in range(nperceptrons)]
+        self._histories = HistoryBuffer(histlength, nperceptrons)
 
-        self._table = [Perceptron(histlength, threshold=threshold, clip=clip)
-                            for _ in range(nperceptrons)]
+        self._table = PerceptronTable(nperceptrons, histlength,
+                                      threshold=threshold, clip=clip)
 
         # The predictor tracks predictions not yet commited (update not called)
         # and bases speculative predictions based on this temporary history.
         # Assume that the speculative history is unbounded for simplicity.
         self._speculative = speculative
-        self._spec_history = [[] for _ in range(nperceptrons)]
+        self._spec_history = SpeculativeHistoryTable(histlength)
 
     def lookup(self, tid, branch_addr, bp_history):
         index = self._get_index(branch_addr)
 
-        hist = self._histories[index]
+        hist = (self._histories.window(index), )
         if self._speculative:
-            temphist = np.concatenate((hist, self._spec_history[index]))
-            hist = temphist[-self._histlength:]
+            spec = self._spec_history.get(index)
+            hist = _speculative_window(hist[0], spec)
+            bp_history['index'] = index
 
-        p =  self._table[index].predict(hist)
+        p = self._table.output(index, *hist) >= 0
 
         if self._speculative:
-            self._spec_history[index].append(1 if p else -1)
+            spec.push(p)
 
         return p
 
     def btb_update(self, tid, branch_addr, bp_history):
         """Set the outcome of the last speculative prediction to not taken."""
         if bp_history['conditional'] and self._speculative:
-            index = self._get_index(branch_addr)
-            self._spec_history[index][-1] = -1
+            self._spec_history[bp_history['index']].replace(0)
 
     def squash(self, tid, bp_history):
         """Squashing starts at the tip of the current path, so we remove the
@@ -170,8 +342,7 @@ class LocalPerceptronPredictor(BasePredictor):
         """
         # TODO: This is only called for the MinorCPU?
         if bp_history['conditional'] and self._speculative:
-            index = self._get_index(branch_addr)
-            self._spec_history[index].pop()
+            self._spec_history.pop(bp_history['index'])
 
     def update(self, tid, branch_addr, taken, bp_history, squashed):
         # Ignore the squashed update call or unconditional branches
@@ -180,16 +351,27 @@ class LocalPerceptronPredictor(BasePredictor):
 
         index = self._get_index(branch_addr)
         t = 1 if taken else -1
-        self._table[index].update(self._histories[index], t)
+        hist = self._histories.window(index)
+        self._table.train(index, self._table.output(index, hist), t, hist)
 
         if self._speculative:
-            self._spec_history[index].pop(0)
+            self._spec_history.commit(index, taken)
 
-        self._histories[index] = np.roll(self._histories[index], -1)
-        self._histories[index][-1] = t
+        self._histories.push(t, index)
+
+    def simulate_trace(self, addrs, outcomes):
+        assert not self._spec_history, 'Branches in flight'
+        predictions = [np.zeros(0, dtype=bool)]
+        for chunk_addrs, chunk_outcomes in trace_chunks(addrs, outcomes,
+                                                        CHUNK_SIZE):
+            indices = self._get_index(chunk_addrs)
+            values = _outcome_values(chunk_outcomes)
+            windows = self._histories.replay(indices, values)
+            predictions.append(self._table.simulate(indices, values, windows))
+        return np.concatenate(predictions)
 
     def _get_index(self, branch_addr):
-        return ((branch_addr // 4) % len(self._table))
+        return ((branch_addr // 4) % self._nperceptrons)
 
 
 
@@ -206,48 +388,45 @@ class CombinedPerceptronPredictor(BasePredictor):
         self._nperceptrons = nperceptrons
         self._local_histlength = local_histlength
         self._global_histlength = global_histlength
-        self._local_histories = [np.zeros(local_histlength)
-                                    for _ in range(nperceptrons)]
-        self._global_history = np.zeros(global_histlength)
+        self._local_histories = HistoryBuffer(local_histlength, nperceptrons)
+        self._global_history = HistoryBuffer(global_histlength)
 
         histlength = self._local_histlength + self._global_histlength
-        self._table = [Perceptron(histlength, threshold=threshold, clip=clip)
-                            for _ in range(nperceptrons)]
+        self._table = PerceptronTable(nperceptrons, histlength,
+                                      threshold=threshold, clip=clip)
 
         # The predictor tracks predictions not yet commited (update not called)
         # and bases speculative predictions based on this temporary history.
         # Assume that the speculative history is unbounded for simplicity.
         self._speculative = speculative
-        self._local_spec_history = [[] for _ in range(nperceptrons)]
-        self._global_spec_history = []
+        self._local_spec_history = SpeculativeHistoryTable(local_histlength)
+        self._global_spec_history = SpeculativeHistory(global_histlength)
 
     def lookup(self, tid, branch_addr, bp_history):
         index = self._get_index(branch_addr)
 
-        local_hist = self._local_histories[index]
-        global_hist = self._global_history
+        local_hist = (self._local_histories.window(index), )
+        global_hist = (self._global_history.window(), )
         if self._speculative:
-            tmp = np.concatenate((local_hist, self._local_spec_history[index]))
-            local_hist = tmp[-self._local_histlength:]
-            tmp = np.concatenate((global_hist, self._global_history))
-            global_hist = tmp[-self._global_histlength:]
-
-        hist = np.concatenate((local_hist, global_hist))
+            local_spec = self._local_spec_history.get(index)
+            local_hist = _speculative_window(local_hist[0], local_spec)
+            global_hist = _speculative_window(global_hist[0],
+                                              self._global_spec_history)
+            bp_history['index'] = index
 
-        p =  self._table[index].predict(hist)
+        p = self._table.output(index, *local_hist, *global_hist) >= 0
 
         if self._speculative:
-            self._global_spec_history.append(1 if p else -1)
-            self._local_spec_history[index].append(1 if p else -1)
+            self._global_spec_history.push(p)
+            local_spec.push(p)
 
         return p
 
     def btb_update(self, tid, branch_addr, bp_history):
         """Set the outcome of the last speculative prediction to not taken."""
         if bp_history['conditional'] and self._speculative:
-            index = self._get_index(branch_addr)
-            self._local_spec_history[index][-1] = -1
-            self._global_spec_history[-1] = -1
+            self._local_spec_history[bp_history['index']].replace(0)
+            self._global_spec_history.replace(0)
 
     def squash(self, tid, bp_history):
         """Squashing starts at the tip of the current path, so we remove the
@@ -255,8 +434,7 @@ class CombinedPerceptronPredictor(BasePredictor):
         """
         # TODO: This is only called for the MinorCPU?
         if bp_history['conditional'] and self._speculative:
-            index = self._get_index(branch_addr)
-            self._local_spec_history[index].pop()
+            self._local_spec_history.pop(bp_history['index'])
             self._global_spec_history.pop()
 
     def update(self, tid, branch_addr, taken, bp_history, squashed):
@@ -266,20 +444,32 @@ class CombinedPerceptronPredictor(BasePredictor):
 
         index = self._get_index(branch_addr)
 
-        hist = np.concatenate(
-                (self._local_histories[index], self._global_history))
+        local_hist = self._local_histories.window(index)
+        global_hist = self._global_history.window()
         t = 1 if taken else -1
-        self._table[index].update(hist, t)
+        y = self._table.output(index, local_hist, global_hist)
+        self._table.train(index, y, t, local_hist, global_hist)
 
         if self._speculative:
-            self._local_spec_history[index].pop(0)
-            self._global_spec_history.pop(0)
-
-        self._local_histories[index] = np.roll(self._local_histories[index],
-                                               -1)
-        self._local_histories[index][-1] = t
-        self._global_history = np.roll(self._global_history, -1)
-        self._global_history[-1] = t
+            self._local_spec_history.commit(index, taken)
+            self._global_spec_history.commit(taken)
+
+        self._local_histories.push(t, index)
+        self._global_history.push(t)
+
+    def simulate_trace(self, addrs, outcomes):
+        assert not self._global_spec_history, 'Branches in flight'
+        predictions = [np.zeros(0, dtype=bool)]
+        for chunk_addrs, chunk_outcomes in trace_chunks(addrs, outcomes,
+                                                        CHUNK_SIZE):
+            indices = self._get_index(chunk_addrs)
+            values = _outcome_values(chunk_outcomes)
+            local_windows = self._local_histories.replay(indices, values)
+            global_windows = self._global_history.replay(
+                    np.zeros(len(values), dtype=np.int64), values)
+            predictions.append(self._table.simulate(
+                    indices, values, local_windows, global_windows))
+        return np.concatenate(predictions)
 
     def _get_index(self, branch_addr):
-        return ((branch_addr // 4) % len(self._table))
+        return ((branch_addr // 4) % self._nperceptrons)
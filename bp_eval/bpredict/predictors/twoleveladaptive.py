@@ -17,7 +17,14 @@
 
 __all__ = ('TwoLevelAdaptiveTrainingPredictor', )
 
+from array import array
+
+import numpy as np
+
 from ..basepredictor import BasePredictor
+from ..utils import SpeculativeHistoryTable
+from ..vectorized import (COUNTER_NEXT, simulate_counters, local_histories,
+                          trace_chunks)
 
 
 class TwoLevelAdaptiveTrainingPredictor(BasePredictor):
@@ -37,40 +44,39 @@ class TwoLevelAdaptiveTrainingPredictor(BasePredictor):
         super(TwoLevelAdaptiveTrainingPredictor, self).__init__(**kwargs)
 
         self._phrtsize = phrtsize
-        self._phrt = [0 for _ in range(phrtsize)]
+        self._histlength = histlength
+        self._phrt = array('Q', [0]) * phrtsize
         self._mask = 2**histlength - 1
-        self._gpt = [0 for _ in range(2**histlength)]
-        self._spec = [[] for _ in range(phrtsize)]
+        self._gpt = array('B', [0]) * 2**histlength
+        self._spec = SpeculativeHistoryTable(histlength)
 
     def lookup(self, tid, branch_addr, bp_history):
         phrt_index = self._get_index(branch_addr)
 
-        spec_hist = self._spec[phrt_index]
-        n = len(self._spec[phrt_index])
-        th = sum(2**(n - i - 1) * t for i, t in enumerate(spec_hist))
-        gpt_index = ((self._phrt[phrt_index] << n) | th) & self._mask
+        spec = self._spec.get(phrt_index, self._phrt[phrt_index])
+        gpt_index = spec.value
 
-        # Store the index for the counter we used for later. We need it to
-        # update the correct counter when we know the outcome of the branch.
+        # Store the indices for the counter and the history we used for
+        # later. We need them to update the correct entries when we know the
+        # outcome of the branch or when it is squashed.
         bp_history['gpt_index'] = gpt_index
+        bp_history['phrt_index'] = phrt_index
 
         pred = self._gpt[gpt_index] >= 2
-        self._spec[phrt_index].append(pred)
+        spec.push(pred)
         return pred
 
     def btb_update(self, tid, branch_addr, bp_history):
         """Set the outcome of the last speculative prediction to not taken."""
         if bp_history['conditional']:
-            phrt_index = self._get_index(branch_addr)
-            self._spec[phrt_index][-1] = 0
+            self._spec[bp_history['phrt_index']].replace(0)
 
     def squash(self, tid, bp_history):
         """Squashing starts at the tip of the current path, so we remove the
         last element from the speculative history.
         """
         if bp_history['conditional']:
-            phrt_index = self._get_index(branch_addr)
-            self._spec[phrt_index].pop()
+            self._spec.pop(bp_history['phrt_index'])
 
     def update(self, tid, branch_addr, taken, bp_history, squashed):
         # Ignore the squashed update call or unconditional branches
@@ -79,16 +85,26 @@ class TwoLevelAdaptiveTrainingPredictor(BasePredictor):
 
         # Get the GPT entry we used earlier and update it.
         gpt_index = bp_history['gpt_index']
-        if taken:
-            self._gpt[gpt_index] = min(self._gpt[gpt_index] + 1, 3)
-        else:
-            self._gpt[gpt_index] = max(self._gpt[gpt_index] - 1, 0)
+        self._gpt[gpt_index] = COUNTER_NEXT[taken][self._gpt[gpt_index]]
 
         # Update the PHRT for the branch address and pop from the tip of the
         # speculative history
         index = self._get_index(branch_addr)
         self._phrt[index] = ((self._phrt[index] << 1) | taken) & self._mask
-        self._spec[index].pop(0)
+        self._spec.commit(index, taken)
+
+    def simulate_trace(self, addrs, outcomes):
+        assert not self._spec, 'Branches in flight'
+        phrt = np.frombuffer(self._phrt, dtype=np.uint64)
+        gpt = np.frombuffer(self._gpt, dtype=np.uint8)
+        predictions = [np.zeros(0, dtype=bool)]
+        for chunk_addrs, chunk_outcomes in trace_chunks(addrs, outcomes):
+            entries = (chunk_addrs >> 2) % self._phrtsize
+            histories = local_histories(entries, chunk_outcomes, phrt,
+                                        self._histlength)
+            predictions.append(
+                    simulate_counters(gpt, histories, chunk_outcomes))
+        return np.concatenate(predictions)
 
     def _get_index(self, branch_addr):
         return ((branch_addr // 4) % self._phrtsize)
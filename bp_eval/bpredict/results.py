@@ -0,0 +1,368 @@
+#
+# Copyright 2019 Alexander Fasching
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+Persistent store for the results of predictor runs.
+
+Every run is a row in an SQLite database with the name of the configuration,
+the predictor class, the benchmark, the instruction limit and the parameters
+of the predictor. The statistics are stored in a separate table with one row
+per value, and the recorded branches in a columnar trace file next to the
+database. Queries only read the rows they need instead of unpickling whole
+predictors and runners.
+"""
+
+__all__ = ('Run', 'ResultStore', 'predictor_params')
+
+import collections
+import contextlib
+import inspect
+import json
+import os
+import re
+import shutil
+import sqlite3
+import tempfile
+import time
+
+from .basepredictor import BasePredictor
+from .tracestore import TraceWriter, TraceReader
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    predictor TEXT NOT NULL,
+    benchmark TEXT NOT NULL,
+    maxinsts INTEGER,
+    params TEXT NOT NULL,
+    trace TEXT,
+    created REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS runs_name ON runs (name, benchmark);
+CREATE INDEX IF NOT EXISTS runs_predictor ON runs (predictor, benchmark);
+CREATE INDEX IF NOT EXISTS runs_benchmark ON runs (benchmark);
+
+CREATE TABLE IF NOT EXISTS stats (
+    run INTEGER NOT NULL REFERENCES runs (id) ON DELETE CASCADE,
+    section INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    value REAL
+);
+CREATE INDEX IF NOT EXISTS stats_run ON stats (run, name, section);
+CREATE INDEX IF NOT EXISTS stats_name ON stats (name);
+"""
+
+RUN_COLUMNS = 'id name predictor benchmark maxinsts params trace created'
+
+# Statistics of the branch predictor of the simulated CPU
+COND_PREDICTED = 'condPredicted'
+COND_INCORRECT = 'condIncorrect'
+
+
+Run = collections.namedtuple('Run', RUN_COLUMNS)
+Run.__doc__ = """A stored run. params is a dictionary with the parameters of
+the predictor and trace the name of the trace file relative to the store, or
+None if no branches were recorded."""
+
+
+def _param_value(value):
+    """Convert a predictor parameter to a JSON compatible value."""
+    if isinstance(value, BasePredictor):
+        params = predictor_params(value)
+        params['class'] = type(value).__name__
+        return params
+    if isinstance(value, (list, tuple)):
+        return [_param_value(v) for v in value]
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if hasattr(value, 'item'):
+        # NumPy scalars
+        return value.item()
+    if callable(value) and hasattr(value, '__qualname__'):
+        # Functions like the hash functions of the GSkewPredictor
+        return value.__qualname__
+    return repr(value)
+
+
+def predictor_params(predictor):
+    """Return the constructor arguments of a predictor, including the default
+    values of arguments that weren't given. The keyword arguments of the
+    BasePredictor like record_trace are left out. Nested predictors are
+    converted to dictionaries with their class in the key 'class'.
+
+    Predictors pickled before the arguments were recorded only return the
+    arguments stored in attributes with the same name, optionally with a
+    leading underscore. A ValueError is raised if one of them can't be
+    recovered.
+    """
+    signature = inspect.signature(type(predictor).__init__)
+    names = [name for name, param in signature.parameters.items()
+             if name != 'self' and param.kind not in (param.VAR_POSITIONAL,
+                                                      param.VAR_KEYWORD)]
+
+    args, kwargs = vars(predictor).get('_init_args', ((), {}))
+    try:
+        bound = signature.bind(predictor, *args, **kwargs)
+    except TypeError:
+        bound = None
+
+    params = {}
+    if bound is not None:
+        bound.apply_defaults()
+        for name in names:
+            params[name] = _param_value(bound.arguments[name])
+        return params
+
+    for name in names:
+        for attr in ('_' + name, name):
+            if attr in vars(predictor):
+                params[name] = _param_value(vars(predictor)[attr])
+                break
+        else:
+            raise ValueError('Parameter %s of %s can\'t be recovered'
+                             % (name, type(predictor).__name__))
+    return params
+
+
+def _matches(params, wanted):
+    return all(params.get(k) == v for k, v in wanted.items())
+
+
+class ResultStore(object):
+    """Database of predictor runs in a directory.
+
+    The database is opened by every method, so a store can be shared by the
+    worker processes of a pool.
+
+    :param directory: directory with the database and the trace files.
+    """
+    def __init__(self, directory):
+        self.directory = directory
+        self.path = os.path.join(directory, 'results.sqlite')
+        os.makedirs(os.path.join(directory, 'traces'), exist_ok=True)
+
+        with self._connect() as db:
+            db.executescript(SCHEMA)
+
+    @contextlib.contextmanager
+    def _connect(self):
+        """Open the database for a transaction, which is committed unless
+        an exception is raised.
+        """
+        db = sqlite3.connect(self.path, timeout=60)
+        try:
+            db.execute('PRAGMA foreign_keys = ON')
+            with db:
+                yield db
+        finally:
+            db.close()
+
+    def add(self, name, benchmark, predictor, runner, params=None,
+            trace=True):
+        """Store the result of a run.
+
+        :param name: name of the predictor configuration, like 'gshare_8'.
+        :param benchmark: name of the benchmark.
+        :param predictor: the predictor after the run.
+        :param runner: the runner, whose statistics are stored.
+        :param params: dictionary with the parameters of the predictor.
+            Defaults to the result of predictor_params.
+        :param trace: store the branches recorded by the predictor.
+        :return: the id of the run.
+        """
+        if params is None:
+            params = predictor_params(predictor)
+
+        tracefile = None
+        if trace and predictor._record_trace:
+            tracefile = self._store_trace(predictor)
+
+        row = (name, type(predictor).__name__, benchmark,
+               getattr(runner, 'maxinsts', None),
+               json.dumps(params, sort_keys=True), tracefile, time.time())
+        stats = []
+        for section, statistics in enumerate(runner.stats or ()):
+            for entry in statistics:
+                if entry.values:
+                    stats.append((section, entry.name, entry.values[0]))
+
+        with self._connect() as db:
+            cursor = db.execute('INSERT INTO runs (name, predictor, '
+                                'benchmark, maxinsts, params, trace, '
+                                'created) VALUES (?, ?, ?, ?, ?, ?, ?)', row)
+            run = cursor.lastrowid
+            db.executemany('INSERT INTO stats (run, section, name, value) '
+                           'VALUES (%d, ?, ?, ?)' % run, stats)
+        return run
+
+    def _store_trace(self, predictor):
+        """Write the trace of a predictor to a new file in the store and
+        return its name relative to the store.
+        """
+        fd, tmppath = tempfile.mkstemp(dir=os.path.join(self.directory,
+                                                        'traces'),
+                                       suffix='.tmp')
+        os.close(fd)
+        try:
+            if predictor._trace_path is not None:
+                predictor.close_trace()
+                shutil.copyfile(predictor._trace_path, tmppath)
+            else:
+                with TraceWriter(tmppath) as writer:
+                    writer.extend(predictor.trace)
+
+            tracefile = os.path.join('traces',
+                                     os.path.basename(tmppath)[:-4] +
+                                     '.trace')
+            os.replace(tmppath, os.path.join(self.directory, tracefile))
+        except BaseException:
+            os.unlink(tmppath)
+            raise
+        return tracefile
+
+    def runs(self, name=None, benchmark=None, predictor=None, maxinsts=None,
+             **params):
+        """Return the runs matching all given arguments, in the order they
+        were stored.
+
+        :param predictor: name of the predictor class.
+        :param params: values of predictor parameters, like histlength=12.
+        """
+        where, args = self._where(name, benchmark, predictor, maxinsts)
+        with self._connect() as db:
+            rows = db.execute('SELECT %s FROM runs%s ORDER BY id'
+                              % (', '.join(Run._fields), where),
+                              args).fetchall()
+        runs = [self._run(row) for row in rows]
+        return [r for r in runs if _matches(r.params, params)]
+
+    def run(self, run):
+        """Return the run with the given id."""
+        with self._connect() as db:
+            row = db.execute('SELECT %s FROM runs WHERE id = ?'
+                             % ', '.join(Run._fields), (run, )).fetchone()
+        if row is None:
+            raise KeyError(run)
+        return self._run(row)
+
+    def stats(self, run, section=0, pattern=None):
+        """Return a dictionary with the statistics of a run.
+
+        :param section: index of the statistics dump.
+        :param pattern: SQL LIKE pattern the names have to match.
+        """
+        query = 'SELECT name, value FROM stats WHERE run = ? AND section = ?'
+        args = [run, section]
+        if pattern is not None:
+            query += ' AND name LIKE ?'
+            args.append(pattern)
+        with self._connect() as db:
+            return dict(db.execute(query, args).fetchall())
+
+    def stat(self, stat, section=0, **kwargs):
+        """Return the value of a statistic for the runs matching kwargs,
+        which are the arguments of runs.
+
+        :param stat: name of the statistic. Names without a dot match the
+            last component of the full names, like 'condIncorrect'.
+        :return: list of (Run, value) tuples. Runs without the statistic
+            are left out.
+        """
+        runs = self.runs(**kwargs)
+        values = self._values([r.id for r in runs], stat, section)
+        return [(r, values[r.id]) for r in runs if r.id in values]
+
+    def misprediction_rate(self, section=0, **kwargs):
+        """Return the rate of mispredicted conditional branches of the
+        runs matching kwargs, which are the arguments of runs.
+
+        :return: list of (Run, rate) tuples.
+        """
+        runs = self.runs(**kwargs)
+        ids = [r.id for r in runs]
+        predicted = self._values(ids, COND_PREDICTED, section)
+        incorrect = self._values(ids, COND_INCORRECT, section)
+        return [(r, incorrect[r.id] / predicted[r.id]) for r in runs
+                if predicted.get(r.id) and r.id in incorrect]
+
+    def trace(self, run):
+        """Return a TraceReader for the branches of a run, or None if no
+        trace was stored.
+        """
+        if not isinstance(run, Run):
+            run = self.run(run)
+        if run.trace is None:
+            return None
+        return TraceReader(os.path.join(self.directory, run.trace))
+
+    def remove(self, run):
+        """Delete a run and its trace."""
+        if not isinstance(run, Run):
+            run = self.run(run)
+        with self._connect() as db:
+            db.execute('DELETE FROM runs WHERE id = ?', (run.id, ))
+        if run.trace is not None:
+            os.unlink(os.path.join(self.directory, run.trace))
+
+    def _values(self, ids, stat, section):
+        """Return a dictionary mapping the ids of runs to the value of a
+        statistic.
+        """
+        if '.' in stat:
+            condition, pattern = 'name = ?', stat
+        else:
+            # The last component is matched by a suffix, which can't use the
+            # index on the names. The index on the runs still applies. The
+            # wildcards of LIKE are escaped in the name.
+            condition = "name LIKE ? ESCAPE '\\'"
+            pattern = '%.' + re.sub(r'([\\%_])', r'\\\1', stat)
+
+        values = {}
+        with self._connect() as db:
+            # Stay below the limit of SQLite for the number of parameters
+            for i in range(0, len(ids), 500):
+                batch = ids[i:i + 500]
+                query = ('SELECT run, value FROM stats WHERE run IN (%s) '
+                         'AND section = ? AND %s '
+                         'ORDER BY length(name) DESC, name DESC'
+                         % (', '.join('?' * len(batch)), condition))
+                for run, value in db.execute(query,
+                                             batch + [section, pattern]):
+                    # The shortest name wins if several ones match, and
+                    # the first one in alphabetical order of equally long
+                    # names
+                    values[run] = value
+        return values
+
+    def _where(self, name, benchmark, predictor, maxinsts):
+        conditions = []
+        args = []
+        for column, value in (('name', name), ('benchmark', benchmark),
+                              ('predictor', predictor),
+                              ('maxinsts', maxinsts)):
+            if value is not None:
+                conditions.append('%s = ?' % column)
+                args.append(value)
+        if not conditions:
+            return '', args
+        return ' WHERE ' + ' AND '.join(conditions), args
+
+    def _run(self, row):
+        run = Run(*row)
+        return run._replace(params=json.loads(run.params))
@@ -31,7 +31,8 @@ import shutil
 import struct
 import enum
 
-from .statistics import Statistics
+from .statistics import parse_stats
+from .shm import SharedMemoryChannel, supported as shm_supported
 
 
 METH_UNCOND_BRANCH = 0
@@ -39,6 +40,18 @@ METH_LOOKUP        = 1
 METH_BTB_UPDATE    = 2
 METH_UPDATE        = 3
 METH_SQUASH        = 4
+METH_HELLO         = 5
+
+# Highest version of the wire protocol understood by the runner. Version 1
+# answers every message except update and squash individually. Version 2
+# only answers lookups, with a single byte, and messages are decoded in bulk.
+PROTOCOL_VERSION   = 2
+
+MSG_STRUCT = struct.Struct('=bhQQbb')
+RSP_STRUCT = struct.Struct('=bQ')
+
+# Maximum number of bytes read from the socket at once
+RECV_SIZE = 2**16
 
 # Path of the gem5 binary relative to this file
 pkgdir = os.path.abspath(os.path.dirname(__file__))
@@ -54,13 +67,26 @@ class ExternalRunner(object):
     gem5path = gem5path
 
     def __init__(self, predictor, prog, args=None, stdin=None, maxinsts=None,
-                 cputype=CPUType.ATOMIC_SIMPLE_CPU):
+                 cputype=CPUType.ATOMIC_SIMPLE_CPU, protocol=PROTOCOL_VERSION,
+                 transport='socket', wanted_stats=None, options=None,
+                 checkpoint=None):
+        if transport not in ('socket', 'shm'):
+            raise ValueError('Unknown transport')
+        if transport == 'shm' and not shm_supported():
+            raise ValueError('The shm transport is only supported on x86 '
+                             'machines, use the socket transport')
+
         self.predictor = predictor
         self.prog = prog
         self.args = args or tuple()
         self.stdin = stdin
         self.maxinsts = maxinsts
         self.cputype = cputype
+        self.protocol = protocol
+        self.transport = transport
+        self.wanted_stats = wanted_stats
+        self.options = options or tuple()
+        self.checkpoint = checkpoint
 
         self.stdout = None
         self.stderr = None
@@ -72,6 +98,7 @@ class ExternalRunner(object):
 
         outdir = tempfile.mkdtemp(prefix='gem5-')
         socket_name = os.path.join(outdir, 'gem5.socket')
+        shm_name = os.path.join(outdir, 'gem5.shm')
 
         cmd = [self.gem5path, '--outdir', outdir, sepath, '-n', '1']
 
@@ -91,18 +118,28 @@ class ExternalRunner(object):
         if self.maxinsts:
             cmd.extend(['-I', str(self.maxinsts)])
 
+        if self.checkpoint is not None:
+            cmd.extend(self.checkpoint.restore_options(self.cputype))
+        cmd.extend(self.options)
+
         # Append the configuration parameters
         config = '\n'.join([
             'branchPred = ExternalBP()',
             'branchPred.socketName = "%s"' % socket_name,
+            'branchPred.protocol = %d' % self.protocol,
+            'branchPred.transport = "%s"' % self.transport,
+            'branchPred.shmName = "%s"' % shm_name,
             'root.system.cpu[0].branchPred = branchPred',
         ])
         cmd.append(config)
 
-        # Initialize the passive socket
-        sockfd = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
-        sockfd.bind(socket_name)
-        sockfd.listen(1)
+        # Initialize the passive socket or the shared memory file
+        if self.transport == 'shm':
+            channel = SharedMemoryChannel(shm_name)
+        else:
+            sockfd = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sockfd.bind(socket_name)
+            sockfd.listen(1)
 
         # Start the simulator
         pipe = None if self.stdin is None else subprocess.PIPE
@@ -114,18 +151,88 @@ class ExternalRunner(object):
             gemproc.stdin.write(self.stdin.encode())
             gemproc.stdin.close()
 
-        # Accept the connection from the simulator
-        connfd, addr = sockfd.accept()
+        # Accept the connection from the simulator and run the predictor
+        if self.transport == 'shm':
+            self._serve_shm(channel, gemproc)
+        else:
+            connfd, addr = sockfd.accept()
+            if self._handshake(connfd) > 1:
+                self._serve_batched(connfd)
+            else:
+                self._serve(connfd)
+
+        # Cleanup
+        gemproc.wait()
+        self.predictor.close_trace()
+
+        if self.transport == 'shm':
+            channel.close()
+        else:
+            connfd.close()
+            sockfd.close()
+
+        self.stdout = gemproc.stdout.read().decode()
+        self.stderr = gemproc.stderr.read().decode()
+        self.stats = list(parse_stats(os.path.join(outdir, 'stats.txt'),
+                                      self.wanted_stats))
+
+        shutil.rmtree(outdir)
+
+    def _handshake(self, connfd):
+        """Negotiate the protocol version with the simulator. Returns the
+        version to use for the rest of the connection.
+        """
+        if self.protocol <= 1:
+            return 1
+
+        msg = self._recv_exactly(connfd, MSG_STRUCT.size)
+        info = MSG_STRUCT.unpack(msg)
+        assert info[0] == METH_HELLO
+
+        version = min(info[2], PROTOCOL_VERSION)
+        connfd.sendall(RSP_STRUCT.pack(version, 0))
+        return version
+
+    def _recv_exactly(self, connfd, size):
+        data = b''
+        while len(data) < size:
+            chunk = connfd.recv(size - len(data))
+            assert chunk
+            data += chunk
+        return data
+
+    def _dispatch(self, frames, respond):
+        """Pass decoded messages of protocol version 2 to the predictor.
+        Predictions of lookups are passed to respond as 0 or 1.
+        """
+        predictor = self.predictor
+
+        for meth, tid, addr, index, taken, squashed in frames:
+            if meth == METH_UPDATE:
+                predictor._base_update(tid, addr, taken, index, squashed)
+            elif meth == METH_LOOKUP:
+                pred, _ = predictor._base_lookup(tid, addr, index)
+                respond(1 if pred else 0)
+            elif meth == METH_UNCOND_BRANCH:
+                predictor._base_uncond_branch(tid, addr, index)
+            elif meth == METH_BTB_UPDATE:
+                predictor._base_btb_update(tid, addr, index)
+            elif meth == METH_SQUASH:
+                predictor._base_squash(tid, index)
+            else:
+                raise ValueError('Unknown method %d' % meth)
+
+    def _serve(self, connfd):
+        """Answer every message individually (protocol version 1)."""
         connfp = connfd.makefile(mode='rwb')
 
-        # Run the predictor
         while True:
-            msg = connfp.read(21)
+            msg = connfp.read(MSG_STRUCT.size)
             if not msg:
                 break
-            assert len(msg) == 21
+            assert len(msg) == MSG_STRUCT.size
 
-            info = struct.unpack('=bhQQbb', msg)
+            info = MSG_STRUCT.unpack(msg)
             if info[0] == METH_UNCOND_BRANCH:
                 results = self.predictor._base_uncond_branch(info[1], info[2],
                                                              info[3])
@@ -142,28 +249,61 @@ class ExternalRunner(object):
             elif info[0] == METH_SQUASH:
                 results = self.predictor._base_squash(info[1], info[3])
 
-            #print(info)
             if results is not None:
-                rsp = struct.pack('=bQ', *results)
+                rsp = RSP_STRUCT.pack(*results)
                 connfp.write(rsp)
                 connfp.flush()
 
-        # Cleanup
-        gemproc.wait()
+        connfp.close()
 
-        connfd.close()
-        sockfd.close()
+    def _serve_batched(self, connfd):
+        """Decode all buffered messages at once and only answer lookups
+        (protocol version 2). The simulator allocates the history indices, so
+        all other messages are fire-and-forget.
+        """
+        size = MSG_STRUCT.size
+        pending = bytearray()
+        rsp = bytearray()
 
-        self.stdout = gemproc.stdout.read().decode()
-        self.stderr = gemproc.stderr.read().decode()
-        self.stats = []
-        with open(os.path.join(outdir, 'stats.txt')) as fp:
-            for section in fp.read().split('Begin Simulation Statistics'):
-                stats = Statistics(section)
-                if stats.rows:
-                    self.stats.append(stats)
+        while True:
+            data = connfd.recv(RECV_SIZE)
+            if not data:
+                break
+            pending += data
 
-        shutil.rmtree(outdir)
+            # Only decode complete messages and keep the rest for later
+            end = len(pending) - len(pending) % size
+            frames = MSG_STRUCT.iter_unpack(bytes(pending[:end]))
+            del pending[:end]
+
+            self._dispatch(frames, rsp.append)
+
+            # The simulator blocks on the last lookup, so all responses of a
+            # batch are sent together.
+            if rsp:
+                connfd.sendall(rsp)
+                del rsp[:]
+
+        assert not pending
+
+    def _serve_shm(self, channel, gemproc):
+        """Run the predictor on the shared memory rings. The protocol is the
+        same as version 2 of the socket transport.
+        """
+        while True:
+            frames = channel.requests()
+            if frames is None:
+                # Check the new requests again after the simulator exited,
+                # because they could have arrived before it did.
+                if channel.closed or gemproc.poll() is not None:
+                    frames = channel.requests()
+                    if frames is None:
+                        break
+                else:
+                    channel.wait()
+                    continue
+
+            self._dispatch(frames, channel.respond)
 
 
 class InternalRunner(object):
@@ -171,13 +311,17 @@ class InternalRunner(object):
     gem5path = gem5path
 
     def __init__(self, setup_code, prog, args=None, stdin=None, maxinsts=None,
-                 cputype=CPUType.ATOMIC_SIMPLE_CPU):
+                 cputype=CPUType.ATOMIC_SIMPLE_CPU, wanted_stats=None,
+                 options=None, checkpoint=None):
         self.setup_code = setup_code
         self.prog = prog
         self.args = args or tuple()
         self.stdin = stdin
         self.maxinsts = maxinsts
         self.cputype = cputype
+        self.wanted_stats = wanted_stats
+        self.options = options or tuple()
+        self.checkpoint = checkpoint
 
         self.stdout = None
         self.stderr = None
@@ -207,6 +351,10 @@ class InternalRunner(object):
         if self.maxinsts:
             cmd.extend(['-I', str(self.maxinsts)])
 
+        if self.checkpoint is not None:
+            cmd.extend(self.checkpoint.restore_options(self.cputype))
+        cmd.extend(self.options)
+
         # Append the setup code
         cmd.append(self.setup_code)
 
@@ -225,12 +373,8 @@ class InternalRunner(object):
 
         self.stdout = gemproc.stdout.read().decode()
         self.stderr = gemproc.stderr.read().decode()
-        self.stats = []
-        with open(os.path.join(outdir, 'stats.txt')) as fp:
-            for section in fp.read().split('Begin Simulation Statistics'):
-                stats = Statistics(section)
-                if stats.rows:
-                    self.stats.append(stats)
+        self.stats = list(parse_stats(os.path.join(outdir, 'stats.txt'),
+                                      self.wanted_stats))
 
         shutil.rmtree(outdir)
 
@@ -240,10 +384,14 @@ class FullSystemRunner(object):
     gem5path = gem5path
 
     def __init__(self, scriptcode, cputype=CPUType.ATOMIC_SIMPLE_CPU,
-                 maxinsts=None):
+                 maxinsts=None, wanted_stats=None, options=None,
+                 checkpoint=None):
         self.scriptcode = scriptcode
         self.cputype = cputype
         self.maxinsts = maxinsts
+        self.wanted_stats = wanted_stats
+        self.options = options or tuple()
+        self.checkpoint = checkpoint
 
         self.stdout = None
         self.stderr = None
@@ -274,6 +422,10 @@ class FullSystemRunner(object):
         if self.maxinsts:
             cmd.extend(['-I', str(self.maxinsts)])
 
+        if self.checkpoint is not None:
+            cmd.extend(self.checkpoint.restore_options(self.cputype))
+        cmd.extend(self.options)
+
         # Start the simulator
         m5path = '/dist/m5/system:%s/../toolchain/m5_system_2.0b3' % pkgdir
         imgpath = ('%s/../toolchain/m5_system_2.0b3/disks/linux-parsec.img'
@@ -291,12 +443,8 @@ class FullSystemRunner(object):
 
         self.stdout = gemproc.stdout.read().decode()
         self.stderr = gemproc.stderr.read().decode()
-        self.stats = []
-        with open(os.path.join(outdir, 'stats.txt')) as fp:
-            for section in fp.read().split('Begin Simulation Statistics'):
-                stats = Statistics(section)
-                if stats.rows:
-                    self.stats.append(stats)
+        self.stats = list(parse_stats(os.path.join(outdir, 'stats.txt'),
+                                      self.wanted_stats))
         with open(os.path.join(outdir, 'system.terminal')) as fp:
             self.terminal = fp.read()
 
@@ -137,7 +137,8 @@ if len(args) > 1:
 multiprocesses = []
 numThreads = 1
 
-if options.bench:
+# --bench also names checkpoints, the workload is given by --cmd then
+if options.bench and not options.cmd:
     apps = options.bench.split("-")
     if len(apps) != options.num_cpus:
         print("number of benchmarks not equal to set num_cpus!")
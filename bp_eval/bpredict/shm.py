@@ -0,0 +1,208 @@
+#
+# Copyright 2018 Alexander Fasching
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+Shared memory transport between ExternalBP and the ExternalRunner. The file
+contains a request ring written by gem5 and a response ring written by the
+predictor. The layout has to match ExternalBPShmHeader in
+src/cpu/pred/external_bp.hh.
+
+Python can't issue memory fences, so the rings rely on the memory model of
+x86, where loads aren't reordered with other loads and stores aren't
+reordered with older loads. On weaker models like the one of AArch64, the
+entries could be read before the head that publishes them, and the tail could
+release them before they were read. The transport is only available on x86.
+"""
+
+__all__ = ('SharedMemoryChannel', 'supported')
+
+import ctypes
+import mmap
+import os
+import platform
+import struct
+import time
+
+
+SHM_MAGIC = 0x52504247
+SHM_VERSION = 1
+
+# Offsets of the header fields in bytes
+OFF_MAGIC = 0
+OFF_CLOSED = 24
+OFF_REQ = 64
+OFF_RSP = 320
+OFF_HEAD = 0
+OFF_TAIL = 64
+OFF_SEQ = 128
+OFF_WAITERS = 132
+
+DATA_OFFSET = 1024
+
+# Requests are the 21 byte messages of the socket transport padded to 24 bytes
+REQ_STRUCT = struct.Struct('=bhQQbb3x')
+HEADER_STRUCT = struct.Struct('=7I')
+
+# Number of polls before the predictor goes to sleep
+SPIN_COUNT = 1024
+
+# Upper bound for a single sleep in seconds. Python can't issue memory fences,
+# so a wakeup might get lost and we have to poll again.
+SLEEP_TIME = 0.001
+
+FUTEX_WAIT = 0
+FUTEX_WAKE = 1
+SYS_FUTEX = {'x86_64': 202, 'i686': 240, 'i386': 240}
+
+# Machines with the memory model of x86
+X86_MACHINES = frozenset(('x86_64', 'amd64', 'i386', 'i486', 'i586', 'i686'))
+
+
+def supported():
+    """Check if the rings are safe without memory fences on this machine."""
+    return platform.machine().lower() in X86_MACHINES
+
+
+class _Timespec(ctypes.Structure):
+    _fields_ = [('tv_sec', ctypes.c_long), ('tv_nsec', ctypes.c_long)]
+
+
+class SharedMemoryChannel(object):
+    """Single-producer single-consumer rings in a memory mapped file.
+
+    :param path: file to create. It must not exist yet.
+    :param req_capacity: number of entries in the request ring.
+    :param rsp_capacity: number of entries in the response ring.
+    """
+    def __init__(self, path, req_capacity=2**16, rsp_capacity=2**8):
+        assert req_capacity & (req_capacity - 1) == 0
+        assert rsp_capacity & (rsp_capacity - 1) == 0
+        if not supported():
+            raise RuntimeError('The shared memory transport is not supported '
+                               'on %s' % platform.machine())
+
+        self.path = path
+        self._req_capacity = req_capacity
+        self._rsp_capacity = rsp_capacity
+        self._rsp_offset = DATA_OFFSET + req_capacity * REQ_STRUCT.size
+        size = self._rsp_offset + rsp_capacity
+
+        fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_EXCL, 0o600)
+        try:
+            os.ftruncate(fd, size)
+            self._mm = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+
+        HEADER_STRUCT.pack_into(self._mm, OFF_MAGIC, SHM_MAGIC, SHM_VERSION,
+                                req_capacity, rsp_capacity, REQ_STRUCT.size,
+                                DATA_OFFSET, 0)
+
+        # Aligned accesses through these views are single loads and stores
+        self._view = memoryview(self._mm)
+        self._u64 = self._view[:DATA_OFFSET].cast('Q')
+        self._u32 = self._view[:DATA_OFFSET].cast('I')
+
+        self._futex_nr = SYS_FUTEX.get(platform.machine())
+        if self._futex_nr is not None:
+            self._libc = ctypes.CDLL(None, use_errno=True)
+            self._req_seq = ctypes.c_uint32.from_buffer(
+                    self._mm, OFF_REQ + OFF_SEQ)
+            self._rsp_seq = ctypes.c_uint32.from_buffer(
+                    self._mm, OFF_RSP + OFF_SEQ)
+            self._timeout = _Timespec(0, int(SLEEP_TIME * 1e9))
+
+    @property
+    def closed(self):
+        """True once gem5 destroyed the predictor."""
+        return self._u32[OFF_CLOSED // 4] != 0
+
+    def requests(self):
+        """Return an iterator over all pending requests and mark them as
+        consumed. The tuples have the same layout as the socket messages.
+        Returns None if there are no pending requests.
+        """
+        head = self._u64[(OFF_REQ + OFF_HEAD) // 8]
+        tail = self._u64[(OFF_REQ + OFF_TAIL) // 8]
+        if head == tail:
+            return None
+
+        # Copy the entries, so the ring can be reused while we decode them.
+        # The pending entries wrap around at most once.
+        size = REQ_STRUCT.size
+        start = tail & (self._req_capacity - 1)
+        count = min(head - tail, self._req_capacity - start)
+        end = DATA_OFFSET + (start + count) * size
+        data = self._view[DATA_OFFSET + start * size:end].tobytes()
+        if count < head - tail:
+            end = DATA_OFFSET + (head - tail - count) * size
+            data += self._view[DATA_OFFSET:end].tobytes()
+
+        self._u64[(OFF_REQ + OFF_TAIL) // 8] = head
+        return REQ_STRUCT.iter_unpack(data)
+
+    def respond(self, pred):
+        """Send the prediction of a lookup to gem5."""
+        head = self._u64[(OFF_RSP + OFF_HEAD) // 8]
+        while head - self._u64[(OFF_RSP + OFF_TAIL) // 8] >= \
+                self._rsp_capacity:
+            time.sleep(0)
+
+        self._mm[self._rsp_offset + (head & (self._rsp_capacity - 1))] = \
+                1 if pred else 0
+        self._u64[(OFF_RSP + OFF_HEAD) // 8] = head + 1
+
+        if self._futex_nr is not None and \
+                self._u32[(OFF_RSP + OFF_WAITERS) // 4]:
+            self._u32[(OFF_RSP + OFF_SEQ) // 4] += 1
+            self._futex(self._rsp_seq, FUTEX_WAKE, 2**31 - 1, None)
+
+    def wait(self):
+        """Spin and then sleep until requests are available or a timeout
+        expires. The caller has to check for new requests afterwards.
+        """
+        head_index = (OFF_REQ + OFF_HEAD) // 8
+        tail = self._u64[(OFF_REQ + OFF_TAIL) // 8]
+        for _ in range(SPIN_COUNT):
+            if self._u64[head_index] != tail:
+                return
+
+        waiters_index = (OFF_REQ + OFF_WAITERS) // 4
+        self._u32[waiters_index] = 1
+        seq = self._u32[(OFF_REQ + OFF_SEQ) // 4]
+        if self._u64[head_index] == tail and not self.closed:
+            if self._futex_nr is None:
+                time.sleep(SLEEP_TIME)
+            else:
+                self._futex(self._req_seq, FUTEX_WAIT, seq, self._timeout)
+        self._u32[waiters_index] = 0
+
+    def close(self):
+        """Unmap and delete the file."""
+        if self._futex_nr is not None:
+            del self._req_seq
+            del self._rsp_seq
+        self._u64.release()
+        self._u32.release()
+        self._view.release()
+        self._mm.close()
+        os.unlink(self.path)
+
+    def _futex(self, word, op, val, timeout):
+        timeout = ctypes.byref(timeout) if timeout is not None else None
+        self._libc.syscall(self._futex_nr, ctypes.byref(word), op, val,
+                           timeout, None, 0)
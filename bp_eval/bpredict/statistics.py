@@ -15,48 +15,257 @@
 # along with this program. If not, see <http://www.gnu.org/licenses/>.
 #
 
-from collections import namedtuple
+from bisect import bisect_left
+from collections import namedtuple, OrderedDict
 import re
+import struct
 
-__all__ = ('Statistics', )
+import numpy as np
+
+__all__ = ('Statistics', 'parse_stats', 'read_binary_stats')
 
 Entry = namedtuple('Entry', ['name', 'values', 'description'])
 
+BEGIN_MARKER = 'Begin Simulation Statistics'
+END_MARKER = 'End Simulation Statistics'
+
+BINARY_MAGIC = b'gem5stat'
+BINARY_VERSION = 1
+
+# Characters with a special meaning in regular expressions
+_METACHARS = frozenset('.^$*+?{}[]\\|()')
+
+
+def _convert_value(s):
+    s = s.strip()
+    if s.endswith('%'):
+        return float(s[:-1]) / 100
+
+    try:
+        return int(s)
+    except ValueError:
+        return float(s)
+
+
+def _convert_row(row):
+    try:
+        firstpart, comment = row.split('#')
+        comment = comment.strip()
+
+        name, valstr = firstpart.split(maxsplit=1)
+        values = tuple(_convert_value(s) for s in valstr.split())
+
+        return Entry(name, values, comment)
+
+    except ValueError:
+        return None
+
+
+def _has_alternatives(pattern):
+    """Check if a pattern contains a group or an alternation outside of
+    character sets, so not every match has to start with the same text.
+    """
+    i = 0
+    in_set = False
+    while i < len(pattern):
+        c = pattern[i]
+        if c == '\\':
+            i += 1
+        elif in_set:
+            in_set = c != ']'
+        elif c == '[':
+            in_set = True
+            # A ']' right after '[' or '[^' is part of the set
+            if pattern[i + 1:i + 2] == '^':
+                i += 1
+            if pattern[i + 1:i + 2] == ']':
+                i += 1
+        elif c in '|(':
+            return True
+        i += 1
+    return False
+
+
+def _literal_prefix(pattern):
+    """Return the literal text every match of an anchored pattern starts
+    with, or None if the pattern is not anchored at the beginning or
+    contains groups or alternations.
+    """
+    if not pattern.startswith('^') or _has_alternatives(pattern):
+        return None
+
+    prefix = []
+    i = 1
+    while i < len(pattern):
+        c = pattern[i]
+        if c == '\\' and i + 1 < len(pattern) and \
+                not pattern[i + 1].isalnum():
+            c = pattern[i + 1]
+            i += 1
+        elif c in _METACHARS:
+            # A quantifier makes the previous character optional
+            if c in '*?{' and prefix:
+                prefix.pop()
+            break
+        prefix.append(c)
+        i += 1
+    return ''.join(prefix)
+
+
 class Statistics(object):
-    """Access to gem5 results."""
+    """Access to gem5 results.
+
+    :param statstr: text of a statistics section.
+    :param rows: Entry tuples of a section that was already parsed.
+    """
     rows = property(lambda self: self._rows)
 
-    def __init__(self, statstr):
-        self._rows = (self._convert_row(r) for r in statstr.split('\n'))
-        self._rows = list(filter(None, self._rows))
+    def __init__(self, statstr=None, rows=None):
+        if rows is None:
+            rows = filter(None, (_convert_row(r) for r in statstr.split('\n')))
+        self._rows = list(rows)
+        self._build_index()
 
-    def find(self, pattern):
-        return [row for row in self.rows if re.findall(pattern, row.name)]
+    def _build_index(self):
+        self._index = dict()
+        for row in self._rows:
+            self._index.setdefault(row.name, row)
+        self._names = sorted(self._index)
+        self._found = dict()
 
-    def _convert_row(self, row):
-        try:
-            firstpart, comment = row.split('#')
-            comment = comment.strip()
+    def __getstate__(self):
+        return {'_rows': self._rows}
 
-            name, valstr = firstpart.split(maxsplit=1)
-            values = tuple(self._convert_value(s) for s in valstr.split())
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._build_index()
 
-            return Entry(name, values, comment)
+    def get(self, name, default=None):
+        """Return the row with the given name."""
+        return self._index.get(name, default)
 
-        except ValueError:
-            return None
+    def __getitem__(self, name):
+        return self._index[name]
 
-    def _convert_value(self, s):
-        s = s.strip()
-        if s.endswith('%'):
-            return float(s[:-1]) / 100
+    def __contains__(self, name):
+        return name in self._index
 
-        try:
-            return int(s)
-        except ValueError:
-            return float(s)
+    def with_prefix(self, prefix):
+        """Return the rows with names starting with prefix, sorted by name."""
+        start = bisect_left(self._names, prefix)
+        rows = []
+        for name in self._names[start:]:
+            if not name.startswith(prefix):
+                break
+            rows.append(self._index[name])
+        return rows
+
+    def find(self, pattern):
+        """Return the rows with names containing a match of the pattern.
+        Anchored patterns without groups or alternations only check the rows
+        with a matching prefix. The results are cached.
+        """
+        rows = self._found.get(pattern)
+        if rows is None:
+            prefix = _literal_prefix(pattern)
+            if prefix:
+                candidates = set(map(id, self.with_prefix(prefix)))
+                candidates = [r for r in self.rows if id(r) in candidates]
+            else:
+                candidates = self.rows
+
+            regex = re.compile(pattern)
+            rows = [row for row in candidates if regex.search(row.name)]
+            self._found[pattern] = rows
+        return list(rows)
+
+    def _convert_row(self, row):
+        return _convert_row(row)
+
+    def _convert_value(self, s):
+        return _convert_value(s)
 
     def __iter__(self):
         for row in self.rows:
             yield row
 
+
+def parse_stats(stats, wanted=None):
+    """Parse a stats.txt file section by section. Only the current section
+    is kept in memory.
+
+    :param stats: file name or file object.
+    :param wanted: optional list of patterns. Only rows with names containing
+        a match of one of them are kept. Sections without any statistics are
+        skipped before filtering, so the positions of the sections are the
+        same with and without this filter.
+    :return: generator of Statistics objects.
+    """
+    if isinstance(stats, str):
+        with open(stats) as fp:
+            yield from parse_stats(fp, wanted)
+        return
+
+    regex = None
+    if wanted is not None:
+        regex = re.compile('|'.join('(?:%s)' % p for p in wanted))
+
+    rows = []
+    nonempty = False
+    for line in stats:
+        if BEGIN_MARKER in line or END_MARKER in line:
+            if nonempty:
+                yield Statistics(rows=rows)
+            rows = []
+            nonempty = False
+            continue
+
+        if regex is not None:
+            # Check the name before converting the values
+            parts = line.split(None, 1)
+            if len(parts) < 2 or not regex.search(parts[0]):
+                if not nonempty:
+                    nonempty = _convert_row(line) is not None
+                continue
+
+        row = _convert_row(line)
+        if row is not None:
+            rows.append(row)
+            nonempty = True
+
+    if nonempty:
+        yield Statistics(rows=rows)
+
+
+def read_binary_stats(path):
+    """Read a statistics file written with --stats-file=binary://<file>.
+
+    The buckets of distributions and histograms are numbered, like
+    'system.cpu.lat::0'. Histograms grow their buckets between dumps, so
+    bucket i of a dump starts at the value of 'min_bucket' plus i times
+    'bucket_size' of the same dump.
+
+    :param path: file name.
+    :return: ordered dictionary mapping the statistic names to arrays with
+        one value per dump.
+    """
+    with open(path, 'rb') as fp:
+        magic, version, ncols = struct.unpack('<8sII', fp.read(16))
+        if magic != BINARY_MAGIC:
+            raise ValueError('%s is not a binary statistics file' % path)
+        if version != BINARY_VERSION:
+            raise ValueError('Unknown version %d of %s' % (version, path))
+
+        names = []
+        for _ in range(ncols):
+            length, = struct.unpack('<H', fp.read(2))
+            names.append(fp.read(length).decode())
+
+        # Rows start at the next multiple of 8 bytes
+        fp.seek(-fp.tell() % 8, 1)
+        data = np.fromfile(fp, dtype='<f8')
+
+    # Ignore a row that was only partially written
+    nrows = len(data) // ncols if ncols else 0
+    data = data[:nrows * ncols].reshape(nrows, ncols)
+    return OrderedDict((name, data[:, i]) for i, name in enumerate(names))
@@ -0,0 +1,246 @@
+#
+# Copyright 2019 Alexander Fasching
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+Run a grid of predictors, benchmarks and instruction limits in parallel and
+cache the results.
+
+Every point of the grid is identified by a hash of the class and the
+parameters of the predictor, the sources of the bpredict package and of the
+predictor class, the benchmark binary, its input files, the instruction
+limit and the runner settings. Results are stored in the cache
+directory under this hash, so running a sweep again only simulates points
+that changed.
+
+Benchmarks with a warm-up are simulated up to a checkpoint once, and every
+point restores that checkpoint instead of simulating the warm-up again.
+"""
+
+__all__ = ('Benchmark', 'Sweep')
+
+import collections
+import concurrent.futures
+import hashlib
+import inspect
+import itertools
+import json
+import os
+import pickle
+import tempfile
+
+from .runner import ExternalRunner
+from .checkpoint import (CheckpointCache, _update_file, _update_program,
+                         _update_simulator)
+from .results import predictor_params
+
+
+Benchmark = collections.namedtuple('Benchmark',
+                                   'name prog args stdin warmup')
+Benchmark.__new__.__defaults__ = (tuple(), None, None)
+Benchmark.__doc__ = """A benchmark program with its arguments and input.
+Arguments naming existing files are treated as inputs of the benchmark. If
+warmup is given, every run starts from a checkpoint after this many
+instructions, and its instruction limit and statistics only count the
+instructions after the checkpoint."""
+
+
+_PACKAGE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Digest of the package sources, with the sizes and modification times of the
+# files it was computed from
+_source_digest = (None, None)
+
+
+def _source_files():
+    paths = []
+    for root, dirs, files in os.walk(_PACKAGE_DIR):
+        dirs.sort()
+        paths.extend(os.path.join(root, name) for name in sorted(files)
+                     if name.endswith('.py'))
+    return paths
+
+
+def _update_sources(h):
+    """Hash the sources of the package, so changes to code shared by the
+    predictors invalidate the cached results.
+    """
+    global _source_digest
+    paths = _source_files()
+    stats = [(path, os.stat(path).st_size, os.stat(path).st_mtime_ns)
+             for path in paths]
+    if _source_digest[0] != stats:
+        sources = hashlib.sha256()
+        for path in paths:
+            sources.update(os.path.relpath(path, _PACKAGE_DIR).encode())
+            _update_file(sources, path)
+        _source_digest = (stats, sources.hexdigest())
+    h.update(_source_digest[1].encode())
+
+
+def _take_checkpoint(cache_dir, benchmark):
+    """Simulate the warm-up of a benchmark if it's not cached yet."""
+    if benchmark.stdin is not None:
+        raise ValueError('Benchmarks reading stdin can\'t be restored')
+    cache = CheckpointCache(cache_dir)
+    return cache.get(benchmark.prog, benchmark.warmup, args=benchmark.args)
+
+
+def _run_point(factory, benchmark, maxinsts, runner_kwargs, path,
+               checkpoint=None):
+    """Simulate a single point and store the result in the cache."""
+    predictor = factory()
+    runner = ExternalRunner(predictor, benchmark.prog, args=benchmark.args,
+                            stdin=benchmark.stdin, maxinsts=maxinsts,
+                            checkpoint=checkpoint, **runner_kwargs)
+    runner.run()
+
+    # Write to a temporary file first, so an interrupted run doesn't leave
+    # a broken result in the cache.
+    result = {'predictor': predictor, 'runner': runner}
+    fd, tmppath = tempfile.mkstemp(dir=os.path.dirname(path),
+                                   suffix='.tmp')
+    with os.fdopen(fd, 'wb') as fp:
+        pickle.dump(result, fp)
+    os.replace(tmppath, path)
+    return path
+
+
+class Sweep(object):
+    """Run every predictor on every benchmark with every instruction limit.
+
+    :param predictors: dictionary mapping names to predictor factories. The
+        factories are called in the worker processes, so they have to be
+        picklable.
+    :param benchmarks: list of Benchmark tuples.
+    :param maxinsts: list of instruction limits.
+    :param cache_dir: directory with the cached results.
+    :param executor: concurrent.futures executor running the simulations.
+        Defaults to a process pool with one worker per core.
+    :param runner_kwargs: additional arguments for the ExternalRunner.
+    """
+    def __init__(self, predictors, benchmarks, maxinsts, cache_dir,
+                 executor=None, **runner_kwargs):
+        self.predictors = predictors
+        self.benchmarks = benchmarks
+        self.maxinsts = maxinsts
+        self.cache_dir = cache_dir
+        self.executor = executor
+        self.runner_kwargs = runner_kwargs
+
+        # Number of points simulated and loaded from the cache by run
+        self.simulated = None
+        self.cached = None
+
+    def points(self):
+        """Return all (predictor, benchmark, maxinsts) name tuples."""
+        return list(itertools.product(sorted(self.predictors),
+                                      [b.name for b in self.benchmarks],
+                                      self.maxinsts))
+
+    def key(self, predictor, benchmark, maxinsts):
+        """Compute the cache key of a point."""
+        bench = self._benchmark(benchmark)
+        h = hashlib.sha256()
+
+        # The predictor is only constructed to get its parameters. Trace
+        # files are opened when the first branch is written.
+        pred = self.predictors[predictor]()
+        cls = type(pred)
+        h.update(('%s.%s' % (cls.__module__, cls.__qualname__)).encode())
+        h.update(json.dumps(predictor_params(pred), sort_keys=True).encode())
+        h.update(repr((pred._record_trace, pred._trace_path)).encode())
+        _update_sources(h)
+        _update_file(h, inspect.getsourcefile(cls))
+
+        _update_program(h, bench.prog, bench.args, bench.stdin)
+        h.update(repr(maxinsts).encode())
+        if bench.warmup:
+            h.update(repr(('warmup', bench.warmup)).encode())
+
+        runner_kwargs = sorted(self.runner_kwargs.items())
+        h.update(repr(runner_kwargs).encode())
+
+        _update_simulator(h)
+        return h.hexdigest()
+
+    def path(self, predictor, benchmark, maxinsts):
+        """Return the cache file of a point."""
+        key = self.key(predictor, benchmark, maxinsts)
+        return os.path.join(self.cache_dir, key + '.pickle')
+
+    def run(self):
+        """Simulate all points missing in the cache.
+
+        :return: dictionary mapping the point tuples to the results, which
+            are dictionaries with the predictor and the runner.
+        """
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+        paths = {p: self.path(*p) for p in self.points()}
+        missing = [p for p, path in paths.items()
+                   if not os.path.exists(path)]
+        self.simulated = len(missing)
+        self.cached = len(paths) - len(missing)
+
+        if missing:
+            executor = self.executor
+            if executor is None:
+                executor = concurrent.futures.ProcessPoolExecutor(
+                        max_workers=os.cpu_count())
+
+            try:
+                checkpoints = self._checkpoints(executor, missing)
+
+                futures = []
+                for point in missing:
+                    pred, bench, maxinsts = point
+                    futures.append(executor.submit(
+                            _run_point, self.predictors[pred],
+                            self._benchmark(bench), maxinsts,
+                            self.runner_kwargs, paths[point],
+                            checkpoints.get(bench)))
+                for future in concurrent.futures.as_completed(futures):
+                    future.result()
+            finally:
+                if self.executor is None:
+                    executor.shutdown()
+
+        return {p: self.load(path) for p, path in paths.items()}
+
+    def _checkpoints(self, executor, points):
+        """Take the checkpoints of the benchmarks with a warm-up in points.
+        Returns a dictionary mapping benchmark names to the checkpoints.
+        """
+        cache_dir = os.path.join(self.cache_dir, 'checkpoints')
+        names = sorted({bench for _, bench, _ in points
+                        if self._benchmark(bench).warmup})
+        futures = [executor.submit(_take_checkpoint, cache_dir,
+                                   self._benchmark(name))
+                   for name in names]
+        return {name: future.result()
+                for name, future in zip(names, futures)}
+
+    def load(self, path):
+        """Load a result from the cache."""
+        with open(path, 'rb') as fp:
+            return pickle.load(fp)
+
+    def _benchmark(self, name):
+        for benchmark in self.benchmarks:
+            if benchmark.name == name:
+                return benchmark
+        raise KeyError(name)
@@ -0,0 +1,199 @@
+#
+# Copyright 2019 Alexander Fasching
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+Record the calls of the simulator to a predictor once and replay them into
+other predictors without running gem5 again.
+
+The branch stream of the AtomicSimpleCPU doesn't depend on the predictions,
+so a replayed trace behaves exactly like a new simulation. This is not the
+case for the MinorCPU, where the predictions affect the wrong-path branches.
+"""
+
+__all__ = ('TraceRecorder', 'TraceRunner')
+
+import struct
+
+from .basepredictor import BasePredictor
+from .runner import (MSG_STRUCT, METH_UNCOND_BRANCH, METH_LOOKUP,
+                     METH_BTB_UPDATE, METH_UPDATE, METH_SQUASH)
+
+
+TRACE_MAGIC = b'BPTRACE\0'
+TRACE_VERSION = 1
+HEADER_STRUCT = struct.Struct('=8sI')
+
+# Number of messages decoded at once during a replay
+CHUNK_SIZE = 2**16
+
+
+class TraceRecorder(BasePredictor):
+    """Pass-through predictor that writes every call of the simulator to a
+    file. Each call is stored as a message of the socket protocol. For lookups
+    and unconditional branches, the history index returned to the simulator
+    is stored, so the file can be replayed independent of the protocol.
+
+    :param path: name of the trace file.
+    :param predictor: predictor answering the simulator. The BasePredictor
+        defaults are used if it is None.
+    """
+    def __init__(self, path, predictor=None, **kwargs):
+        super(TraceRecorder, self).__init__(**kwargs)
+
+        self.path = path
+        self._predictor = predictor
+        self._fp = open(path, 'wb')
+        self._fp.write(HEADER_STRUCT.pack(TRACE_MAGIC, TRACE_VERSION))
+        self._buffer = []
+
+    def _base_lookup(self, tid, branch_addr, bp_history_index):
+        if self._predictor is None:
+            pred, key = super(TraceRecorder, self)._base_lookup(
+                    tid, branch_addr, bp_history_index)
+        else:
+            pred, key = self._predictor._base_lookup(
+                    tid, branch_addr, bp_history_index)
+        self._record(METH_LOOKUP, tid, branch_addr, key, 0, 0)
+        return pred, key
+
+    def _base_uncond_branch(self, tid, branch_addr, bp_history_index):
+        if self._predictor is None:
+            pred, key = super(TraceRecorder, self)._base_uncond_branch(
+                    tid, branch_addr, bp_history_index)
+        else:
+            pred, key = self._predictor._base_uncond_branch(
+                    tid, branch_addr, bp_history_index)
+        self._record(METH_UNCOND_BRANCH, tid, branch_addr, key, 0, 0)
+        return pred, key
+
+    def _base_btb_update(self, tid, branch_addr, bp_history_index):
+        self._record(METH_BTB_UPDATE, tid, branch_addr, bp_history_index, 0, 0)
+        if self._predictor is None:
+            return super(TraceRecorder, self)._base_btb_update(
+                    tid, branch_addr, bp_history_index)
+        return self._predictor._base_btb_update(
+                tid, branch_addr, bp_history_index)
+
+    def _base_update(self, tid, branch_addr, taken, bp_history_index,
+                     squashed):
+        self._record(METH_UPDATE, tid, branch_addr, bp_history_index, taken,
+                     squashed)
+        if self._predictor is None:
+            return super(TraceRecorder, self)._base_update(
+                    tid, branch_addr, taken, bp_history_index, squashed)
+        return self._predictor._base_update(
+                tid, branch_addr, taken, bp_history_index, squashed)
+
+    def _base_squash(self, tid, bp_history_index):
+        self._record(METH_SQUASH, tid, 0, bp_history_index, 0, 0)
+        if self._predictor is None:
+            return super(TraceRecorder, self)._base_squash(
+                    tid, bp_history_index)
+        return self._predictor._base_squash(tid, bp_history_index)
+
+    def close_trace(self):
+        super(TraceRecorder, self).close_trace()
+        if self._predictor is not None:
+            self._predictor.close_trace()
+
+    def close(self):
+        """Write the remaining messages and close the file."""
+        self._flush()
+        self._fp.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _record(self, meth, tid, branch_addr, index, taken, squashed):
+        self._buffer.append((meth, tid, branch_addr, index, int(taken),
+                             int(squashed)))
+        if len(self._buffer) >= CHUNK_SIZE:
+            self._flush()
+
+    def _flush(self):
+        pack = MSG_STRUCT.pack
+        self._fp.write(b''.join(pack(*msg) for msg in self._buffer))
+        self._buffer = []
+
+
+class TraceRunner(object):
+    """Replay a trace written by the TraceRecorder into a predictor.
+
+    After running, cond_predicted contains the number of committed conditional
+    branches and cond_incorrect the number of those with a wrong direction.
+    Different from the condIncorrect statistic of gem5, wrong targets are not
+    counted.
+    """
+    def __init__(self, predictor, path):
+        self.predictor = predictor
+        self.path = path
+
+        self.cond_predicted = None
+        self.cond_incorrect = None
+
+    def run(self):
+        predictor = self.predictor
+        size = MSG_STRUCT.size
+
+        # Direction of the branches in flight. BTB misses turn a taken
+        # prediction into a not-taken one, like in the BPredUnit.
+        predictions = dict()
+        cond_predicted = 0
+        cond_incorrect = 0
+
+        with open(self.path, 'rb') as fp:
+            magic, version = HEADER_STRUCT.unpack(fp.read(HEADER_STRUCT.size))
+            if magic != TRACE_MAGIC or version != TRACE_VERSION:
+                raise ValueError('%s is not a branch trace' % self.path)
+
+            while True:
+                data = fp.read(CHUNK_SIZE * size)
+                if not data:
+                    break
+                if len(data) % size:
+                    raise ValueError('Truncated trace %s' % self.path)
+
+                for meth, tid, addr, index, taken, squashed in \
+                        MSG_STRUCT.iter_unpack(data):
+                    if meth == METH_UPDATE:
+                        predictor._base_update(tid, addr, taken, index,
+                                               squashed)
+                        if not squashed and index in predictions:
+                            cond_predicted += 1
+                            if predictions.pop(index) != bool(taken):
+                                cond_incorrect += 1
+                    elif meth == METH_LOOKUP:
+                        pred, _ = predictor._base_lookup(tid, addr, index)
+                        predictions[index] = bool(pred)
+                    elif meth == METH_UNCOND_BRANCH:
+                        predictor._base_uncond_branch(tid, addr, index)
+                    elif meth == METH_BTB_UPDATE:
+                        predictor._base_btb_update(tid, addr, index)
+                        if index in predictions:
+                            predictions[index] = False
+                    elif meth == METH_SQUASH:
+                        predictor._base_squash(tid, index)
+                        predictions.pop(index, None)
+                    else:
+                        raise ValueError('Unknown method %d' % meth)
+
+        predictor.close_trace()
+        self.cond_predicted = cond_predicted
+        self.cond_incorrect = cond_incorrect
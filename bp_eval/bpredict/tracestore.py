@@ -0,0 +1,215 @@
+#
+# Copyright 2019 Alexander Fasching
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+Columnar storage for recorded branch traces.
+
+The file starts with a header, followed by chunks of branches. Each chunk
+contains the branch addresses as uint64, the outcomes and the predictions as
+bit-packed booleans, optionally compressed with zlib. The index at the end of
+the file contains the position of every column of every chunk. Uncompressed
+columns are accessed through numpy.memmap, so traces larger than the memory
+can be analyzed chunk by chunk.
+"""
+
+__all__ = ('TraceWriter', 'TraceReader')
+
+import array
+import struct
+import zlib
+
+import numpy as np
+
+
+MAGIC = b'BPCOLTR\0'
+VERSION = 1
+
+# magic, version, compression, chunk size, number of chunks, number of
+# branches, offset of the index
+HEADER_STRUCT = struct.Struct('<8sIIIIQQ')
+HEADER_SIZE = 64
+
+# number of branches followed by offset and length of the three columns
+INDEX_STRUCT = struct.Struct('<I4x6Q')
+
+COMPRESSION_NONE = 0
+COMPRESSION_ZLIB = 1
+
+
+class TraceWriter(object):
+    """Write branches to a columnar trace file.
+
+    :param path: name of the file.
+    :param chunk_size: number of branches per chunk.
+    :param compress: compress the chunks with zlib. Compressed columns can't
+        be memory mapped.
+    """
+    def __init__(self, path, chunk_size=2**20, compress=True):
+        assert chunk_size % 8 == 0
+
+        self.path = path
+        self._chunk_size = chunk_size
+        self._compress = compress
+        self._index = []
+        self._count = 0
+
+        self._addrs = array.array('Q')
+        self._taken = bytearray()
+        self._preds = bytearray()
+
+        # The file is created when the first chunk or the index is written,
+        # so constructing a predictor doesn't truncate an existing trace
+        self._fp = None
+
+    def append(self, branch_addr, taken, pred):
+        """Add a single branch."""
+        self._addrs.append(branch_addr)
+        self._taken.append(1 if taken else 0)
+        self._preds.append(1 if pred else 0)
+        if len(self._addrs) >= self._chunk_size:
+            self._write_chunk()
+
+    def extend(self, trace):
+        """Add (branch_addr, taken, pred) tuples, for example the trace list
+        of a predictor.
+        """
+        for branch_addr, taken, pred in trace:
+            self.append(branch_addr, taken, pred)
+
+    def close(self):
+        """Write the last chunk and the index."""
+        self._open()
+        if self._addrs:
+            self._write_chunk()
+
+        self._align()
+        index_offset = self._fp.tell()
+        for entry in self._index:
+            self._fp.write(INDEX_STRUCT.pack(*entry))
+
+        compression = COMPRESSION_ZLIB if self._compress else COMPRESSION_NONE
+        self._fp.seek(0)
+        self._fp.write(HEADER_STRUCT.pack(MAGIC, VERSION, compression,
+                                          self._chunk_size, len(self._index),
+                                          self._count, index_offset))
+        self._fp.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _open(self):
+        if self._fp is None:
+            self._fp = open(self.path, 'wb')
+            self._fp.write(bytes(HEADER_SIZE))
+
+    def _write_chunk(self):
+        self._open()
+        count = len(self._addrs)
+        addrs = np.frombuffer(self._addrs, dtype=np.uint64).astype('<u8')
+        taken = np.packbits(np.frombuffer(self._taken, dtype=np.uint8))
+        preds = np.packbits(np.frombuffer(self._preds, dtype=np.uint8))
+
+        entry = [count]
+        for column in (addrs, taken, preds):
+            data = column.tobytes()
+            if self._compress:
+                data = zlib.compress(data, 1)
+
+            # Align the columns, so the addresses can be mapped as uint64
+            self._align()
+            entry.extend((self._fp.tell(), len(data)))
+            self._fp.write(data)
+
+        self._index.append(entry)
+        self._count += count
+
+        self._addrs = array.array('Q')
+        self._taken = bytearray()
+        self._preds = bytearray()
+
+    def _align(self):
+        self._fp.write(bytes(-self._fp.tell() % 8))
+
+
+class TraceReader(object):
+    """Read a trace written by the TraceWriter.
+
+    Iterating over the reader yields (branch_addr, taken, pred) tuples like
+    the trace list of a predictor. The chunks method provides the columns
+    as NumPy arrays.
+    """
+    def __init__(self, path):
+        self.path = path
+
+        with open(path, 'rb') as fp:
+            header = HEADER_STRUCT.unpack(fp.read(HEADER_STRUCT.size))
+            magic, version, compression, _, nchunks, count, offset = header
+            if magic != MAGIC or version != VERSION:
+                raise ValueError('%s is not a columnar trace' % path)
+            if offset == 0:
+                raise ValueError('%s was not closed properly' % path)
+
+            fp.seek(offset)
+            self._index = [INDEX_STRUCT.unpack(fp.read(INDEX_STRUCT.size))
+                           for _ in range(nchunks)]
+
+        self._compressed = compression == COMPRESSION_ZLIB
+        self._count = count
+        self._mm = np.memmap(path, dtype=np.uint8, mode='r')
+
+    def __len__(self):
+        return self._count
+
+    def __iter__(self):
+        for addrs, taken, preds in self.chunks():
+            yield from zip(addrs.tolist(), taken.tolist(), preds.tolist())
+
+    def chunks(self):
+        """Yield (addrs, taken, preds) arrays for every chunk. Uncompressed
+        addresses are read-only views of the file.
+        """
+        for count, *columns in self._index:
+            addrs = self._read(columns[0], columns[1]).view('<u8')
+            taken = self._read_bits(columns[2], columns[3], count)
+            preds = self._read_bits(columns[4], columns[5], count)
+            yield addrs, taken, preds
+
+    def columns(self):
+        """Return the addresses, outcomes and predictions of the whole trace.
+        This loads the trace into memory unless it consists of a single
+        uncompressed chunk.
+        """
+        chunks = list(self.chunks())
+        if len(chunks) == 1:
+            return chunks[0]
+        if not chunks:
+            return (np.zeros(0, dtype='<u8'), np.zeros(0, dtype=bool),
+                    np.zeros(0, dtype=bool))
+        return tuple(np.concatenate(c) for c in zip(*chunks))
+
+    def _read(self, offset, length):
+        data = self._mm[offset:offset + length]
+        if self._compressed:
+            data = np.frombuffer(zlib.decompress(data), dtype=np.uint8)
+        return data
+
+    def _read_bits(self, offset, length, count):
+        bits = np.unpackbits(self._read(offset, length), count=count)
+        return bits.view(bool)
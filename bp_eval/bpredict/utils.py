@@ -15,7 +15,11 @@
 # along with this program. If not, see <http://www.gnu.org/licenses/>.
 #
 
-__all__ = ('SaturatingCounter', 'History')
+__all__ = ('SaturatingCounter', 'History', 'SpeculativeHistory',
+           'SpeculativeHistoryTable')
+
+import collections
+import itertools
 
 
 class SaturatingCounter(object):
@@ -43,3 +47,118 @@ class History(object):
 
     def update(self, taken):
         self._value = ((self._value << 1) | taken) & ((1 << self._length) - 1)
+
+
+class SpeculativeHistory(object):
+    """History register extended by the predictions of the branches in flight.
+    The predictions are kept in a deque and the speculative register is
+    updated incrementally, so all operations take constant time regardless of
+    the number of branches in flight.
+
+    The most recent outcome is the least significant bit of the registers.
+    """
+    value = property(lambda self: self._value)
+    committed = property(lambda self: self._committed)
+
+    def __init__(self, length, committed=0):
+        self._length = length
+        self._mask = (1 << length) - 1
+        self._inflight = collections.deque()
+        self.reset(committed)
+
+    def __len__(self):
+        return len(self._inflight)
+
+    def reset(self, committed=0):
+        """Drop all branches in flight and set the committed history."""
+        self._inflight.clear()
+        self._committed = committed & self._mask
+        self._value = self._committed
+
+    def push(self, pred):
+        """Append the prediction of a new branch."""
+        pred = int(pred)
+        self._inflight.append(pred)
+        self._value = ((self._value << 1) | pred) & self._mask
+
+    def replace(self, pred):
+        """Change the prediction of the youngest branch in flight."""
+        pred = int(pred)
+        self._inflight[-1] = pred
+        self._value = ((self._value & ~1) | pred) & self._mask
+
+    def pop(self):
+        """Remove the youngest branch in flight. The bit shifted out of the
+        register by its prediction is restored from the older branches in
+        flight or from the committed history.
+        """
+        self._inflight.pop()
+        if not self._length:
+            return
+
+        n = len(self._inflight)
+        if n >= self._length:
+            bit = self._inflight[n - self._length]
+        else:
+            bit = (self._committed >> (self._length - 1 - n)) & 1
+        self._value = (self._value >> 1) | (bit << (self._length - 1))
+
+    def commit(self, taken):
+        """Remove the oldest branch in flight and add its outcome to the
+        committed history. A misprediction is also corrected in the
+        speculative register.
+        """
+        pred = self._inflight.popleft()
+        taken = int(taken)
+        self._committed = ((self._committed << 1) | taken) & self._mask
+
+        n = len(self._inflight)
+        if pred != taken and n < self._length:
+            self._value ^= 1 << n
+
+    def recent(self, n):
+        """Return the predictions of the n youngest branches in flight,
+        ordered from the oldest to the youngest.
+        """
+        return list(itertools.islice(reversed(self._inflight), n))[::-1]
+
+
+class SpeculativeHistoryTable(object):
+    """Speculative histories for the entries of a local history table. The
+    SpeculativeHistory of an entry only exists while it has branches in
+    flight.
+    """
+    def __init__(self, length):
+        self._length = length
+        self._histories = dict()
+
+    def __len__(self):
+        """Number of entries with branches in flight."""
+        return len(self._histories)
+
+    def __getitem__(self, index):
+        return self._histories[index]
+
+    def get(self, index, committed=0):
+        """Return the speculative history of an entry. It is created from the
+        committed history if the entry has no branches in flight.
+        """
+        history = self._histories.get(index)
+        if history is None:
+            history = SpeculativeHistory(self._length, committed)
+            self._histories[index] = history
+        return history
+
+    def pop(self, index):
+        """Remove the youngest branch in flight of an entry."""
+        history = self._histories[index]
+        history.pop()
+        if not history:
+            del self._histories[index]
+
+    def commit(self, index, taken):
+        """Commit the oldest branch in flight of an entry."""
+        history = self._histories[index]
+        history.commit(taken)
+        if not history:
+            del self._histories[index]
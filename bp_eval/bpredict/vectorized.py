@@ -0,0 +1,195 @@
+#
+# Copyright 2019 Alexander Fasching
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+Building blocks for simulating predictors on a whole recorded trace at once.
+
+Without speculation, the histories used for every branch only depend on the
+outcomes of the previous branches, so they can be computed upfront. The
+counters of a table are updated independently of each other, so the state of
+every counter is a prefix composition of the transition functions of all
+branches mapping to it, which is computed with a segmented parallel scan.
+"""
+
+__all__ = ('simulate_counters', 'global_histories', 'local_histories',
+           'trace_chunks')
+
+import numpy as np
+
+
+# Next value of a 2-bit saturating counter, indexed by the outcome and the
+# current value.
+COUNTER_NEXT = ((0, 0, 1, 2), (1, 2, 3, 3))
+
+
+def _make_tables():
+    """A function from counter values to counter values is encoded in one
+    byte, with the result for value v in bits 2v and 2v + 1. Returns the
+    table to apply a function to a value and the table for the composition
+    of two functions.
+    """
+    codes = np.arange(256)
+    apply = np.stack([(codes >> (2 * v)) & 3 for v in range(4)], axis=1)
+
+    compose = np.zeros((256, 256), dtype=np.uint8)
+    for b in range(256):
+        result = apply[:, apply[b]]
+        compose[:, b] = sum(result[:, v] << (2 * v) for v in range(4))
+
+    return apply.astype(np.uint8), compose
+
+_APPLY, _COMPOSE = _make_tables()
+_COUNTER_CODES = np.array([sum(v << (2 * i) for i, v in enumerate(f))
+                           for f in COUNTER_NEXT], dtype=np.uint8)
+
+# Number of branches simulated at once
+CHUNK_SIZE = 2**20
+
+
+def trace_chunks(addrs, outcomes, chunk_size=CHUNK_SIZE):
+    """Split a trace into chunks of int64 addresses and boolean outcomes."""
+    addrs = np.asarray(addrs)
+    outcomes = np.asarray(outcomes)
+    assert len(addrs) == len(outcomes)
+
+    for start in range(0, len(addrs), chunk_size):
+        end = start + chunk_size
+        yield (addrs[start:end].astype(np.int64),
+               outcomes[start:end].astype(bool))
+
+
+def _segments(keys):
+    """Sort the keys and return the permutation, the sorted keys, the position
+    of every element within its segment and a mask of the last elements.
+    """
+    n = len(keys)
+    order = np.argsort(keys, kind='stable')
+    skeys = keys[order]
+
+    starts = np.ones(n, dtype=bool)
+    starts[1:] = skeys[1:] != skeys[:-1]
+    ends = np.ones(n, dtype=bool)
+    ends[:-1] = starts[1:]
+
+    positions = np.arange(n)
+    positions -= np.maximum.accumulate(np.where(starts, positions, 0))
+    return order, skeys, positions, ends
+
+
+def simulate_counters(table, indices, outcomes):
+    """Predict and update the 2-bit counters for a sequence of branches.
+
+    :param table: uint8 array with the counter values, updated in place.
+    :param indices: index into the table for every branch.
+    :param outcomes: boolean outcome of every branch.
+    :return: boolean array with the prediction for every branch.
+    """
+    n = len(indices)
+    if n == 0:
+        return np.zeros(0, dtype=bool)
+
+    order, sindices, positions, ends = _segments(indices)
+
+    # Inclusive scan of the transition functions within every counter. After
+    # the step with distance d, every function covers the last 2d branches.
+    funcs = _COUNTER_CODES[outcomes[order].astype(np.intp)]
+    distance = 1
+    while distance <= positions.max():
+        funcs[distance:] = np.where(
+                positions[distance:] >= distance,
+                _COMPOSE[funcs[distance:], funcs[:-distance]],
+                funcs[distance:])
+        distance *= 2
+
+    # The counter value before a branch is the result of all previous ones
+    initial = table[sindices]
+    values = initial.copy()
+    values[1:] = np.where(positions[1:] > 0,
+                          _APPLY[funcs[:-1], initial[1:]], initial[1:])
+
+    last = np.nonzero(ends)[0]
+    table[sindices[last]] = _APPLY[funcs[last], initial[last]]
+
+    predictions = np.empty(n, dtype=bool)
+    predictions[order] = values >= 2
+    return predictions
+
+
+def global_histories(outcomes, ghr, length):
+    """Compute the global history register before every branch.
+
+    :param outcomes: boolean outcome of every branch.
+    :param ghr: history register before the first branch. The most recent
+        outcome is the least significant bit.
+    :param length: number of bits of the history register.
+    :return: int64 array with the histories and the register after the last
+        branch.
+    """
+    n = len(outcomes)
+    if n == 0:
+        return np.zeros(0, dtype=np.int64), ghr
+
+    # Prepend the outcomes stored in the initial register, oldest first
+    previous = [(ghr >> (length - 1 - i)) & 1 for i in range(length)]
+    extended = np.concatenate((np.array(previous, dtype=np.int64),
+                               outcomes.astype(np.int64)))
+
+    histories = np.zeros(n, dtype=np.int64)
+    for k in range(1, length + 1):
+        histories |= extended[length - k:length - k + n] << (k - 1)
+
+    mask = (1 << length) - 1
+    ghr = ((int(histories[-1]) << 1) | int(outcomes[-1])) & mask
+    return histories, ghr
+
+
+def local_histories(entries, outcomes, registers, length):
+    """Compute the local history register before every branch.
+
+    :param entries: index of the history register of every branch.
+    :param outcomes: boolean outcome of every branch.
+    :param registers: array with the history registers, updated in place.
+    :param length: number of bits of the history registers.
+    :return: int64 array with the histories.
+    """
+    n = len(entries)
+    if n == 0:
+        return np.zeros(0, dtype=np.int64)
+
+    order, sentries, positions, ends = _segments(entries)
+    soutcomes = outcomes[order].astype(np.int64)
+    initial = registers[sentries].astype(np.int64)
+
+    # Bit k - 1 is the outcome of the k-th previous branch using the same
+    # register, or a bit of the initial register for the first branches.
+    histories = np.zeros(n, dtype=np.int64)
+    elements = np.arange(n)
+    for k in range(1, length + 1):
+        recorded = soutcomes[np.maximum(elements - k, 0)]
+        shift = np.maximum(k - positions - 1, 0)
+        stored = (initial >> shift) & 1
+        bits = np.where(positions >= k, recorded, stored)
+        histories |= bits << (k - 1)
+
+    mask = (1 << length) - 1
+    last = np.nonzero(ends)[0]
+    registers[sentries[last]] = \
+            ((histories[last] << 1) | soutcomes[last]) & mask
+
+    result = np.empty(n, dtype=np.int64)
+    result[order] = histories
+    return result
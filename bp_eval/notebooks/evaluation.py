@@ -1,18 +1,18 @@
 #!/usr/bin/env python
 # coding: utf-8
 
-import pickle
-import os
 import concurrent.futures
 import matplotlib.pyplot as plt
 import numpy as np
 
 from bpredict import *
+from bpredict import analysis
 
 benchmarks = []
+store = ResultStore('results')
 
 
-def run_blackscholes(predictor_factory, output_dir, max_insts):
+def run_blackscholes(predictor_factory, name, max_insts):
     # Run the Blackscholes benchmark
     benchmark = '../benchmarks/blackscholes/blackscholes'
     args = (1, '../benchmarks/blackscholes/inputs/small.input', '/dev/null')
@@ -21,12 +21,10 @@ def run_blackscholes(predictor_factory, output_dir, max_insts):
     blackscholes_runner = ExternalRunner(blackscholes_pred, benchmark, args=args, maxinsts=max_insts)
     blackscholes_runner.run()
 
-    result = {'predictor': blackscholes_pred, 'runner': blackscholes_runner}
-    with open(os.path.join(output_dir, 'blackscholes.pickle'), 'wb') as fp:
-        pickle.dump(result, fp)
+    store.add(name, 'blackscholes', blackscholes_pred, blackscholes_runner)
 
 
-def run_picosat(predictor_factory, output_dir, max_insts):
+def run_picosat(predictor_factory, name, max_insts):
     # Run the PicoSAT benchmark
     benchmark = '../benchmarks/picosat/picosat'
     args = ('../benchmarks/picosat/inputs/uuf200-01.cnf', )
@@ -35,11 +33,9 @@ def run_picosat(predictor_factory, output_dir, max_insts):
     picosat_runner = ExternalRunner(picosat_pred, benchmark, args=args, maxinsts=max_insts)
     picosat_runner.run()
 
-    result = {'predictor': picosat_pred, 'runner': picosat_runner}
-    with open(os.path.join(output_dir, 'picosat.pickle'), 'wb') as fp:
-        pickle.dump(result, fp)
+    store.add(name, 'picosat', picosat_pred, picosat_runner)
 
-def run_sjeng(predictor_factory, output_dir, max_insts):
+def run_sjeng(predictor_factory, name, max_insts):
     # Run the Sjeng benchmark
     benchmark = '../benchmarks/sjeng/sjeng'
     stdin = '\n'.join([
@@ -52,11 +48,9 @@ def run_sjeng(predictor_factory, output_dir, max_insts):
     sjeng_runner = ExternalRunner(sjeng_pred, benchmark, stdin=stdin, maxinsts=max_insts)
     sjeng_runner.run()
 
-    result = {'predictor': sjeng_pred, 'runner': sjeng_runner}
-    with open(os.path.join(output_dir, 'sjeng.pickle'), 'wb') as fp:
-        pickle.dump(result, fp)
+    store.add(name, 'sjeng', sjeng_pred, sjeng_runner)
 
-def run_sha256(predictor_factory, output_dir, max_insts):
+def run_sha256(predictor_factory, name, max_insts):
     # Run the SHA256 benchmark
     benchmark = '../benchmarks/sha256sum/sha256sum'
     args = ('../benchmarks/sha256sum/inputs/4M.bin', )
@@ -65,24 +59,20 @@ def run_sha256(predictor_factory, output_dir, max_insts):
     sha_runner = ExternalRunner(sha_pred, benchmark, args=args, maxinsts=max_insts)
     sha_runner.run()
 
-    result = {'predictor': sha_pred, 'runner': sha_runner}
-    with open(os.path.join(output_dir, 'sha.pickle'), 'wb') as fp:
-        pickle.dump(result, fp)
+    store.add(name, 'sha', sha_pred, sha_runner)
 
 
-def run_benchmarks(predictor_factory, output_dir, max_insts=int(20e6)):
-    """Run all benchmarks and save the results in the output_dir directory."""
-    try:
-        os.makedirs(output_dir)
-    except FileExistsError:
-        print('[WARNING] Directory already exists. Delete to rerun benchmark.')
+def run_benchmarks(predictor_factory, name, max_insts=int(20e6)):
+    """Run all benchmarks and save the results under name in the store."""
+    if store.runs(name=name):
+        print('[WARNING] Results already stored. Remove them to rerun benchmark.')
         return
 
     with concurrent.futures.ProcessPoolExecutor(max_workers=2) as pool:
-        pool.submit(run_blackscholes, predictor_factory, output_dir, max_insts)
-        pool.submit(run_picosat, predictor_factory, output_dir, max_insts)
-        pool.submit(run_sjeng, predictor_factory, output_dir, max_insts)
-        pool.submit(run_sha256, predictor_factory, output_dir, max_insts)
+        pool.submit(run_blackscholes, predictor_factory, name, max_insts)
+        pool.submit(run_picosat, predictor_factory, name, max_insts)
+        pool.submit(run_sjeng, predictor_factory, name, max_insts)
+        pool.submit(run_sha256, predictor_factory, name, max_insts)
 
 
 def predictor_factory():
@@ -93,7 +83,7 @@ def predictor_factory():
                                speculative=True,
                                record_trace=RecordSettings.CONDITIONAL)
 
-run_benchmarks(predictor_factory, output_dir='results/global_perceptron', max_insts=int(20e6))
+run_benchmarks(predictor_factory, name='global_perceptron', max_insts=int(20e6))
 benchmarks.append('global_perceptron')
 
 
@@ -105,7 +95,7 @@ def predictor_factory():
                                     speculative=True,
                                     record_trace=RecordSettings.CONDITIONAL)
 
-run_benchmarks(predictor_factory, output_dir='results/local_perceptron', max_insts=int(20e6))
+run_benchmarks(predictor_factory, name='local_perceptron', max_insts=int(20e6))
 benchmarks.append('local_perceptron')
 
 
@@ -119,8 +109,8 @@ for i in (9, 18, 27):
                                            speculative=True,
                                            record_trace=RecordSettings.CONDITIONAL)
 
-    out = 'results/combined_perceptron_G%d_L%d' % (36-i, i)
-    run_benchmarks(predictor_factory, output_dir=out, max_insts=int(20e6))
+    out = 'combined_perceptron_G%d_L%d' % (36-i, i)
+    run_benchmarks(predictor_factory, name=out, max_insts=int(20e6))
     benchmarks.append('combined_perceptron_G%d_L%d' % (36 - i, i))
 
 
@@ -128,7 +118,7 @@ for i in (8, 10, 12):
     def predictor_factory():
         return GSkewPredictor(histlength=i, record_trace=RecordSettings.CONDITIONAL)
 
-    run_benchmarks(predictor_factory, output_dir='results/gskew_%d' % i, max_insts=int(20e6))
+    run_benchmarks(predictor_factory, name='gskew_%d' % i, max_insts=int(20e6))
     benchmarks.append('gskew_%d' % i)
 
 
@@ -136,7 +126,7 @@ for i in (8, 10, 12):
     def predictor_factory():
         return GSharePredictor(histlength=i, record_trace=RecordSettings.CONDITIONAL)
 
-    run_benchmarks(predictor_factory, output_dir='results/gshare_%d' % i, max_insts=int(20e6))
+    run_benchmarks(predictor_factory, name='gshare_%d' % i, max_insts=int(20e6))
     benchmarks.append('gshare_%d' % i)
 
 
@@ -145,7 +135,7 @@ for i in (8, 10, 12):
         return TwoLevelAdaptiveTrainingPredictor(phrtsize=512, histlength=i,
                                                  record_trace=RecordSettings.CONDITIONAL)
 
-    run_benchmarks(predictor_factory, output_dir='results/twolevel_%d' % i, max_insts=int(20e6))
+    run_benchmarks(predictor_factory, name='twolevel_%d' % i, max_insts=int(20e6))
     benchmarks.append('twolevel_%d' % i)
 
 
@@ -156,7 +146,7 @@ def predictor_factory():
     return Combining2BitPredictor(pred_a=p1, pred_b=p2, ncounters=1024,
                                   record_trace=RecordSettings.CONDITIONAL)
 
-run_benchmarks(predictor_factory, output_dir='results/gskew_twolevel_12', max_insts=int(20e6))
+run_benchmarks(predictor_factory, name='gskew_twolevel_12', max_insts=int(20e6))
 benchmarks.append('gskew_twolevel_12')
 
 
@@ -169,7 +159,7 @@ def predictor_factory():
     return MultiHybridPredictor(predictors=[p1, p2, p3], ncounters=1024,
                                 record_trace=RecordSettings.CONDITIONAL)
 
-run_benchmarks(predictor_factory, output_dir='results/multihybrid_twolevel_static_12', max_insts=int(20e6))
+run_benchmarks(predictor_factory, name='multihybrid_twolevel_static_12', max_insts=int(20e6))
 benchmarks.append('multihybrid_twolevel_static_12')
 
 
@@ -182,7 +172,7 @@ def predictor_factory():
     return MultiHybridPredictor(predictors=[p1, p2, p3], ncounters=512,
                                 record_trace=RecordSettings.CONDITIONAL)
 
-run_benchmarks(predictor_factory, output_dir='results/multihybrid_twolevel_static_11', max_insts=int(20e6))
+run_benchmarks(predictor_factory, name='multihybrid_twolevel_static_11', max_insts=int(20e6))
 benchmarks.append('multihybrid_twolevel_static_11')
 
 
@@ -194,7 +184,7 @@ def predictor_factory():
     return Combining2BitPredictor(pred_a=p1, pred_b=p2, ncounters=1024,
                                   record_trace=RecordSettings.CONDITIONAL)
 
-run_benchmarks(predictor_factory, output_dir='results/twolevel_twobit_12', max_insts=int(20e6))
+run_benchmarks(predictor_factory, name='twolevel_twobit_12', max_insts=int(20e6))
 benchmarks.append('twolevel_twobit_12')
 
 
@@ -227,7 +217,7 @@ for name, kwargs in perceptron_args.items():
                                    speculative=True,
                                    record_trace=RecordSettings.CONDITIONAL)
 
-    run_benchmarks(predictor_factory, output_dir='results/perceptron_%s' % name, max_insts=int(20e6))
+    run_benchmarks(predictor_factory, name='perceptron_%s' % name, max_insts=int(20e6))
     benchmarks.append('perceptron_' + name)
 
 
@@ -241,7 +231,7 @@ for name, kwargs in gskew_args.items():
     def predictor_factory():
         return GSkewPredictor(**kwargs, record_trace=RecordSettings.CONDITIONAL)
 
-    run_benchmarks(predictor_factory, output_dir='results/gskew_%s' % name, max_insts=int(20e6))
+    run_benchmarks(predictor_factory, name='gskew_%s' % name, max_insts=int(20e6))
     benchmarks.append('gskew_' + name)
 
 
@@ -260,7 +250,7 @@ for name, kwargs in multihybrid_args.items():
         return MultiHybridPredictor(predictors=[p1, p2, p3], ncounters=kwargs['ncounters'],
                                     record_trace=RecordSettings.CONDITIONAL)
 
-    run_benchmarks(predictor_factory, output_dir='results/multihybrid_%s' % name, max_insts=int(20e6))
+    run_benchmarks(predictor_factory, name='multihybrid_%s' % name, max_insts=int(20e6))
     benchmarks.append('multihybrid_' + name)
 
 
@@ -271,18 +261,10 @@ branch_stats = dict()
 
 # Get the number of times a branch was executed, the misprediction rate and the bias
 def get_branch_stats(trace):
-    taken_hist = dict()
-    pred_hist = dict()
-    for addr, taken, predicted in trace:
-        if addr not in taken_hist:
-            taken_hist[addr] = []
-            pred_hist[addr] = []
-        taken_hist[addr].append(taken)
-        pred_hist[addr].append(predicted)
-
-    hists = {k: (np.array(taken_hist[k]), np.array(pred_hist[k])) for k in taken_hist}
-    stats = [(vt.size, sum(abs(vt - vp)) / vt.size, sum(vt) / vt.size) for (vt, vp) in hists.values()]
-    return sorted(stats, reverse=True)
+    stats = analysis.branch_stats(trace)
+    return sorted(zip(stats.executions.tolist(),
+                      stats.misprediction_rate.tolist(),
+                      stats.bias.tolist()), reverse=True)
 
 
 for benchmark in ('blackscholes', 'picosat', 'sjeng', 'sha'):
@@ -294,15 +276,10 @@ for benchmark in ('blackscholes', 'picosat', 'sjeng', 'sha'):
             print('Skipping', predtype)
             continue
 
-        with open(os.path.join('results', predtype, benchmark + '.pickle'), 'rb') as fp:
-            result = pickle.load(fp)
-        runner = result['runner']
-        predicted = runner.stats[0].find('condPredicted')[0].values[0]
-        incorrect = runner.stats[0].find('condIncorrect')[0].values[0]
-        misprediction_rates[benchmark][predtype] = incorrect / predicted
+        (run, rate), = store.misprediction_rate(name=predtype, benchmark=benchmark)
+        misprediction_rates[benchmark][predtype] = rate
 
-        pred = result['predictor']
-        stats = get_branch_stats(pred.trace)
+        stats = get_branch_stats(store.trace(run))
         branch_stats[benchmark][predtype] = stats
 
 
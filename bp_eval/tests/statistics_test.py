@@ -0,0 +1,42 @@
+#
+# Copyright 2019 Alexander Fasching
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+import re
+import bpredict
+
+
+names = ['system.cpu.a', 'system.cpu.branchPred.condIncorrect',
+         'system.cpu2.b', 'systemx.c', 'foo.cpu.b', 'foo|bar.d',
+         'sim_ticks', 'system]x.e']
+stats = bpredict.Statistics(rows=[bpredict.statistics.Entry(n, (i, ), '')
+                                  for i, n in enumerate(names)])
+
+patterns = [
+    '^system', '^system.cpu', '^system\\.cpu\\.', '^system|foo',
+    '^system.cpu|b$', '^(system|foo)\\.cpu', '^foo[|]bar', '^foo\\|bar',
+    '^system[]]x', '^system[^]]x', '^sys(tem)?\\.cpu', 'cpu', '^sim_',
+    '^system.cpu[0-9]*\\.', '^systemx?\\.c',
+]
+
+# Searching by prefix has to find the same rows as checking all of them,
+# also when the search is repeated and the cached result is used
+for pattern in patterns:
+    expected = [n for n in names if re.search(pattern, n)]
+    for _ in range(2):
+        found = [row.name for row in stats.find(pattern)]
+        assert found == expected, (pattern, found, expected)
+    print('%-24s %s' % (pattern, found))
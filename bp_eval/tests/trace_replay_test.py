@@ -0,0 +1,56 @@
+#
+# Copyright 2019 Alexander Fasching
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+import time
+import bpredict
+
+
+benchmark = '../benchmarks/sha256sum/sha256sum'
+args = ('../benchmarks/sha256sum/inputs/256K.bin', )
+tracefile = '/tmp/sha256sum.trace'
+sizes = [256, 512, 1024, 2048, 4096]
+
+
+# Record the branches once
+start = time.time()
+with bpredict.TraceRecorder(tracefile) as recorder:
+    runner = bpredict.ExternalRunner(recorder, benchmark, args)
+    runner.run()
+print('Recording: %f' % (time.time() - start))
+
+
+# Replay the trace for different predictor sizes
+for size in sizes:
+    start = time.time()
+    pred = bpredict.Local2BitPredictor(size)
+    runner = bpredict.TraceRunner(pred, tracefile)
+    runner.run()
+
+    print('Local2BitPredictor(%d):' % size)
+    print('    misprediction rate: %f' %
+            (runner.cond_incorrect / runner.cond_predicted))
+    print('    runtime: %f' % (time.time() - start))
+
+
+# The result should be close to the simulated one
+pred = bpredict.Local2BitPredictor(sizes[-1])
+runner = bpredict.ExternalRunner(pred, benchmark, args)
+runner.run()
+predicted = runner.stats[0].find('condPredicted')[0].values[0]
+incorrect = runner.stats[0].find('condIncorrect')[0].values[0]
+print('Simulated Local2BitPredictor(%d):' % sizes[-1])
+print('    misprediction rate: %f' % (incorrect / predicted))
@@ -58,8 +58,9 @@ import m5
 import m5.ticks as ticks
 
 sim_object_classes_by_name = {
-    cls.__name__: cls for cls in m5.objects.__dict__.itervalues()
-    if inspect.isclass(cls) and issubclass(cls, m5.objects.SimObject) }
+    cls.__name__: cls
+    for name, cls in inspect.getmembers(m5.objects, inspect.isclass)
+    if issubclass(cls, m5.objects.SimObject) }
 
 # Add some parsing functions to Param classes to handle reading in .ini
 #   file elements.  This could be moved into src/python/m5/params.py if
@@ -275,6 +275,7 @@ def define_constants(constants):
     constants.gem5_binary_fixture_name = 'gem5'
     constants.xml_filename = 'results.xml'
     constants.pickle_filename = 'results.pickle'
+    constants.durations_filename = 'durations.json'
     constants.pickle_protocol = highest_pickle_protocol
 
     # The root directory which all test names will be based off of.
@@ -497,7 +498,9 @@ def define_common_args(config):
             '-t', '--test-threads',
             action='store',
             default=1,
-            help='Number of threads to spawn to run concurrent tests with.'),
+            help='Number of cores to run concurrent test suites on. Suites'
+                 ' are run in separate processes, longest first, as long as'
+                 ' the cores and memory they need are available.'),
         Argument(
             '-v',
             action='count',
@@ -353,6 +353,9 @@ class MultiprocessingHandlerWrapper(log.Handler):
         self._handler_lock = threading.Lock()
         self._subhandlers = subhandlers
 
+        # Events of callers waiting in flush, by the id of their marker
+        self._flush_events = {}
+
     def add_handler(self, handler):
         self._handler_lock.acquire()
         self._subhandlers = (handler, ) + self._subhandlers
@@ -404,11 +407,33 @@ class MultiprocessingHandlerWrapper(log.Handler):
                 return
 
     def _handle(self, record):
+        if isinstance(record, _FlushMarker):
+            self._flush_events.pop(record.ident).set()
+            return
         self._with_handlers(lambda handler: handler.handle(record))
 
     def handle(self, record):
         self.queue.put(record)
 
+    def flush(self):
+        '''
+        Wait until the records put on the queue so far, including the ones
+        of child processes which exited already, have been handled.
+        '''
+        if self._shutdown.is_set():
+            return
+        if not hasattr(self, 'thread'):
+            self._drain()
+            return
+        event = threading.Event()
+        marker = _FlushMarker(id(event))
+        self._flush_events[marker.ident] = event
+        self.queue.put(marker)
+        # Wait with a timeout, so the wait can be interrupted.
+        while not event.wait(0.1):
+            if self._shutdown.is_set():
+                return
+
     def _close(self):
         if hasattr(self, 'thread'):
             self.thread.join()
@@ -430,6 +455,11 @@ class MultiprocessingHandlerWrapper(log.Handler):
             self._close()
 
 
+class _FlushMarker(object):
+    def __init__(self, ident):
+        self.ident = ident
+
+
 def _wrap(callback, *args, **kwargs):
     try:
         callback(*args, **kwargs)
@@ -66,6 +66,8 @@ class RunLogHandler():
         self.mp_handler.add_handler(self.result_handler)
 
     def finish_testing(self):
+        # Suites run in other processes log their results asynchronously.
+        self.mp_handler.flush()
         self.result_handler.close()
 
     def __enter__(self):
@@ -265,13 +267,19 @@ def run_schedule(test_schedule, log_handler):
                 config.config.result_path))
     log.test_log.message(terminal.separator())
 
+    # Durations of the previous runs, to start the longest suites first.
+    durations = runner.SuiteDurations(os.path.join(
+            config.config.result_path, config.constants.durations_filename))
+
     # Build global fixtures and exectute scheduled test suites.
     if config.config.test_threads > 1:
         library_runner = runner.LibraryParallelRunner(test_schedule)
         library_runner.set_threads(config.config.test_threads)
     else:
         library_runner = runner.LibraryRunner(test_schedule)
+    library_runner.set_durations(durations)
     library_runner.run()
+    durations.save()
 
     log_handler.finish_testing()
 
@@ -26,8 +26,12 @@
 #
 # Authors: Sean Wilson
 
-import multiprocessing.dummy
-import threading
+import errno
+import json
+import multiprocessing
+import os
+import select
+import time
 import traceback
 
 import helper
@@ -150,20 +154,242 @@ class SuiteRunner(RunnerPattern):
                 iter(self.testable))
 
 
+class SuiteDurations(object):
+    '''
+    Durations of the previous runs of test suites, used to schedule the
+    longest suites first. The durations are stored as a JSON object mapping
+    suite uids to seconds.
+    '''
+    def __init__(self, path=None):
+        self.path = path
+        self.durations = {}
+        if path is not None:
+            try:
+                with open(path) as f:
+                    self.durations = json.load(f)
+            except IOError as e:
+                if e.errno != errno.ENOENT:
+                    raise
+            except ValueError:
+                # A broken file only costs us a worse schedule.
+                pass
+
+    def expected(self, suite):
+        '''
+        :returns: The duration of the last run of the suite or None if it
+            wasn't run before.
+        '''
+        return self.durations.get(str(suite.uid))
+
+    def record(self, suite, duration):
+        self.durations[str(suite.uid)] = duration
+
+    def save(self):
+        if self.path is None:
+            return
+        # Other runs might have recorded suites we didn't run this time.
+        previous = SuiteDurations(self.path).durations
+        previous.update(self.durations)
+
+        helper.mkdir_p(os.path.dirname(self.path))
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(previous, f, indent=2, sort_keys=True,
+                      separators=(',', ': '))
+        os.rename(tmp, self.path)
+
+
 class LibraryRunner(SuiteRunner):
-    pass
+    def __init__(self, loaded_testable):
+        SuiteRunner.__init__(self, loaded_testable)
+        self.durations = SuiteDurations()
 
+    def set_durations(self, durations):
+        self.durations = durations
 
-class LibraryParallelRunner(RunnerPattern):
+    def test(self):
+        for suite in self.testable:
+            start = time.time()
+            suite.runner(suite).run()
+            self.durations.record(suite, time.time() - start)
+        self.testable.result = compute_aggregate_result(
+                iter(self.testable))
+
+
+def available_memory():
+    '''
+    :returns: The physical memory of the machine in MiB or None if it
+        can't be determined.
+    '''
+    try:
+        pages = os.sysconf('SC_PHYS_PAGES')
+        page_size = os.sysconf('SC_PAGE_SIZE')
+    except (ValueError, OSError, AttributeError):
+        return None
+    if pages <= 0 or page_size <= 0:
+        return None
+    return pages * page_size // (1024 * 1024)
+
+
+class SuiteScheduler(object):
+    '''
+    Runs test suites in parallel processes, limited by the cores and memory
+    the suites need.
+
+    Suites are started longest first, using the durations of their previous
+    runs, which keeps the total time short when a few suites run much longer
+    than the others. Suites without a recorded duration are assumed to take
+    the average time. Whenever a suite finishes, the longest pending suite
+    which fits into the free cores and memory is started.
+
+    Each suite runs in a forked process. The log records of the suite are
+    forwarded by the log handler like the ones of sandboxed tests, the
+    final results are sent back to update the loaded suite.
+    '''
+    def __init__(self, suites, cores, memory=None, durations=None):
+        self.suites = list(suites)
+        self.cores = max(1, cores)
+        self.memory = memory
+        self.durations = durations if durations is not None \
+                else SuiteDurations()
+
+    def _requirements(self, suite):
+        # Suites larger than the machine run alone.
+        cores = min(max(1, suite.cores), self.cores)
+        memory = suite.memory
+        if self.memory is not None:
+            memory = min(memory, self.memory)
+        return cores, memory
+
+    def schedule(self):
+        '''
+        :returns: The suites in the order they are started, longest first.
+        '''
+        expected = [self.durations.expected(suite) for suite in self.suites]
+        known = [duration for duration in expected if duration is not None]
+        default = sum(known) / len(known) if known else 0.0
+
+        # sorted is stable, suites without any durations keep their order.
+        order = sorted(range(len(self.suites)),
+                key=lambda i: -(expected[i] if expected[i] is not None
+                                else default))
+        return [self.suites[i] for i in order]
+
+    def run(self):
+        pending = self.schedule()
+        running = {}
+        free_cores = self.cores
+        free_memory = self.memory
+
+        try:
+            while pending or running:
+                for suite in list(pending):
+                    cores, memory = self._requirements(suite)
+                    fits = cores <= free_cores and (
+                            free_memory is None or memory <= free_memory)
+                    if running and not fits:
+                        continue
+                    pending.remove(suite)
+                    running[self._start(suite)] = (suite, time.time())
+                    free_cores -= cores
+                    if free_memory is not None:
+                        free_memory -= memory
+
+                ready = self._wait(running)
+                for connection in ready:
+                    suite, start = running.pop(connection)
+                    self._finish(suite, connection)
+                    self.durations.record(suite, time.time() - start)
+                    cores, memory = self._requirements(suite)
+                    free_cores += cores
+                    if free_memory is not None:
+                        free_memory += memory
+        finally:
+            for connection in running:
+                connection.process.terminate()
+                connection.process.join()
+
+    def _start(self, suite):
+        receiver, sender = multiprocessing.Pipe(duplex=False)
+        process = multiprocessing.Process(target=self._entrypoint,
+                args=(suite, sender))
+        process.start()
+        sender.close()
+
+        # Keep the process with its connection to join it when it's done.
+        connection = _SuiteConnection(receiver, process)
+        return connection
+
+    @staticmethod
+    def _entrypoint(suite, connection):
+        try:
+            suite.runner(suite).run()
+        except Exception:
+            suite.result = Result(Result.Errored, traceback.format_exc())
+        # The status and result updates were logged by this process already,
+        # the parent only needs the final values.
+        connection.send([(suite.result, suite.status)] +
+                        [(test.result, test.status) for test in suite])
+        connection.close()
+
+    @staticmethod
+    def _wait(running):
+        while True:
+            try:
+                ready, _, _ = select.select(list(running), [], [])
+                return ready
+            except select.error as e:
+                if e.args[0] != errno.EINTR:
+                    raise
+
+    @staticmethod
+    def _finish(suite, connection):
+        try:
+            results = connection.recv()
+        except EOFError:
+            results = None
+        connection.close()
+        connection.process.join()
+
+        if results is None:
+            suite.result = Result(Result.Errored,
+                    'Test suite process exited with code %s' %
+                    connection.process.exitcode)
+            suite.status = Status.Complete
+            return
+
+        (suite.metadata.result, suite.metadata.status) = results[0]
+        for test, (result, status) in zip(suite, results[1:]):
+            test.metadata.result = result
+            test.metadata.status = status
+
+
+class _SuiteConnection(object):
+    '''
+    Receiving end of the pipe to a suite process, usable with select.
+    '''
+    def __init__(self, connection, process):
+        self.connection = connection
+        self.process = process
+
+    def fileno(self):
+        return self.connection.fileno()
+
+    def recv(self):
+        return self.connection.recv()
+
+    def close(self):
+        self.connection.close()
+
+
+class LibraryParallelRunner(LibraryRunner):
     def set_threads(self, threads):
         self.threads = threads
 
-    def _entrypoint(self, suite):
-        suite.runner(suite).run()
-
     def test(self):
-        pool = multiprocessing.dummy.Pool(self.threads)
-        pool.map(lambda suite : suite.runner(suite).run(), self.testable)
+        scheduler = SuiteScheduler(self.testable, self.threads,
+                available_memory(), self.durations)
+        scheduler.run()
         self.testable.result = compute_aggregate_result(
                 iter(self.testable))
 
@@ -44,12 +44,19 @@ class TestSuite(object):
         To reduce test definition boilerplate, the :func:`init` method is
         forwarded all `*args` and `**kwargs`. This means derived classes can
         define init without boilerplate super().__init__(*args, **kwargs).
+
+    ..note::
+        The `cores` and `memory` (in MiB) the suite needs are used to
+        schedule suites running in parallel. A memory of 0 means the suite
+        doesn't reserve any memory.
     '''
     runner = runner_mod.SuiteRunner
     collector = helper.InstanceCollector()
     fixtures = []
     tests = []
     tags = set()
+    cores = 1
+    memory = 0
 
     def __new__(klass, *args, **kwargs):
         obj = super(TestSuite, klass).__new__(klass, *args, **kwargs)
@@ -57,10 +64,14 @@ class TestSuite(object):
         return obj
 
     def __init__(self, name=None, fixtures=tuple(), tests=tuple(),
-                 tags=tuple(), **kwargs):
+                 tags=tuple(), cores=None, memory=None, **kwargs):
         self.fixtures = self.fixtures + list(fixtures)
         self.tags = self.tags | set(tags)
         self.tests = self.tests + list(tests)
+        if cores is not None:
+            self.cores = cores
+        if memory is not None:
+            self.memory = memory
         if name is None:
             name = self.__class__.__name__
         self.name = name
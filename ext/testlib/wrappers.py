@@ -173,6 +173,14 @@ class LoadedSuite(LoadedTestable):
     def tags(self):
         return self.metadata.tags
 
+    @property
+    def cores(self):
+        return getattr(self.obj, 'cores', 1)
+
+    @property
+    def memory(self):
+        return getattr(self.obj, 'memory', 0)
+
 
 class LoadedLibrary(LoadedTestable):
     '''
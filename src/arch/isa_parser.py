@@ -45,6 +45,10 @@ import sys
 import re
 import string
 import inspect, traceback
+import cPickle
+import hashlib
+import multiprocessing.dummy
+import tempfile
 # get type names
 from types import *
 
@@ -341,7 +345,16 @@ bitOp1ArgRE = re.compile(r'<\s*(\w+)\s*:\s*>')
 bitOpWordRE = re.compile(r'(?<![\w\.])([\w\.]+)<\s*(\w+)\s*:\s*(\w+)\s*>')
 bitOpExprRE = re.compile(r'\)<\s*(\w+)\s*:\s*(\w+)\s*>')
 
+# Results of substBitOps, since many instructions share the same snippets
+bitOpsCache = {}
+
 def substBitOps(code):
+    try:
+        return bitOpsCache[code]
+    except KeyError:
+        pass
+
+    orig_code = code
     # first convert single-bit selectors to two-index form
     # i.e., <n> --> <n:n>
     code = bitOp1ArgRE.sub(r'<\1:\1>', code)
@@ -368,6 +381,7 @@ def substBitOps(code):
                                          match.group(1), match.group(2))
         code = code[:exprStart] + newExpr + code[match.end():]
         match = bitOpExprRE.search(code)
+    bitOpsCache[orig_code] = code
     return code
 
 
@@ -1035,19 +1049,7 @@ class OperandList(object):
     def __init__(self, parser, code):
         self.items = []
         self.bases = {}
-        # delete strings and comments so we don't match on operands inside
-        for regEx in (stringRE, commentRE):
-            code = regEx.sub('', code)
-        # search for operands
-        next_pos = 0
-        while 1:
-            match = parser.operandsRE.search(code, next_pos)
-            if not match:
-                # no more matches: we're done
-                break
-            op = match.groups()
-            # regexp groups are operand full name, base, and extension
-            (op_full, op_base, op_ext) = op
+        for (op_full, op_base, op_ext, is_dest) in parser.findOperands(code):
             # If is a elem operand, define or update the corresponding
             # vector operand
             isElem = False
@@ -1056,9 +1058,6 @@ class OperandList(object):
                 elem_op = (op_base, op_ext)
                 op_base = parser.elemToVector[op_base]
                 op_ext = '' # use the default one
-            # if the token following the operand is an assignment, this is
-            # a destination (LHS), else it's a source (RHS)
-            is_dest = (assignRE.match(code, match.end()) != None)
             is_src = not is_dest
 
             # see if we've already seen this one
@@ -1092,8 +1091,6 @@ class OperandList(object):
                     op_desc.elemExt = elem_op[1]
                     op_desc.active_elems = [elem_op]
                 self.append(op_desc)
-            # start next search after end of current match
-            next_pos = match.end()
         self.sort()
         # enumerate source & dest register operands... used in building
         # constructor later
@@ -1202,19 +1199,7 @@ class SubOperandList(OperandList):
     def __init__(self, parser, code, master_list):
         self.items = []
         self.bases = {}
-        # delete strings and comments so we don't match on operands inside
-        for regEx in (stringRE, commentRE):
-            code = regEx.sub('', code)
-        # search for operands
-        next_pos = 0
-        while 1:
-            match = parser.operandsRE.search(code, next_pos)
-            if not match:
-                # no more matches: we're done
-                break
-            op = match.groups()
-            # regexp groups are operand full name, base, and extension
-            (op_full, op_base, op_ext) = op
+        for (op_full, op_base, op_ext, is_dest) in parser.findOperands(code):
             # If is a elem operand, define or update the corresponding
             # vector operand
             if op_base in parser.elemToVector:
@@ -1231,9 +1216,6 @@ class SubOperandList(OperandList):
                 if not op_desc:
                     # if not, add a reference to it to this sub list
                     self.append(master_list.bases[op_base])
-
-            # start next search after end of current match
-            next_pos = match.end()
         self.sort()
         self.memOperand = None
         # Whether the whole PC needs to be read so parts of it can be accessed
@@ -1290,6 +1272,12 @@ commentRE = re.compile(r'(^)?[^\S\n]*/(?:\*(.*?)\*/[^\S\n]*|/[^\n]*)($)?',
 # has an array subscript.
 assignRE = re.compile(r'(\[[^\]]+\])?\s*=(?!=)', re.MULTILINE)
 
+# Regular expression objects to match identifiers which could be operands,
+# with and without an extension.  They are looked up in the operand names,
+# which is much faster than matching the operand regular expressions.
+operandWordRE = re.compile(r'\b[A-Za-z_]\w*')
+operandWithExtWordRE = re.compile(r'\b[A-Za-z_]\w*_\w+')
+
 def makeFlagConstructor(flag_list):
     if len(flag_list) == 0:
         return ''
@@ -1427,6 +1415,48 @@ def backtrace(filename_stack):
 #     minimum of disruption to existing increment code.
 #
 
+class OutputFile(object):
+    '''A generated file.  The contents are kept in memory until the whole
+    ISA description has been processed, so the files can be written at
+    once and only if they changed.'''
+    def __init__(self, name):
+        self.name = name
+        self.chunks = []
+
+    def write(self, s):
+        self.chunks.append(s)
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def contents(self):
+        return ''.join(self.chunks)
+
+def write_if_changed(filename, contents):
+    '''Write a file unless it already has the given contents, so its
+    timestamp only changes when it really needs to be rebuilt.  Returns
+    whether the file was written.'''
+    try:
+        with open(filename, 'r') as f:
+            if f.read() == contents:
+                return False
+    except IOError:
+        pass
+
+    with open(filename, 'w') as f:
+        f.write(contents)
+    return True
+
+def file_digest(filename):
+    with open(filename, 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
 class LineTracker(object):
     def __init__(self, filename, lineno=1):
         self.filename = filename
@@ -1453,10 +1483,14 @@ class LineTracker(object):
 #
 
 class ISAParser(Grammar):
-    def __init__(self, output_dir):
+    def __init__(self, output_dir, cache_dir=None):
         super(ISAParser, self).__init__()
         self.output_dir = output_dir
 
+        # Directory to cache the generated files in, keyed by the digests
+        # of the ISA description and the Python modules it used
+        self.cache_dir = cache_dir
+
         self.filename = None # for output file watermarking/scaremongering
 
         # variable to hold templates
@@ -1470,6 +1504,9 @@ class ISAParser(Grammar):
         self.files = {}
         self.splits = {}
 
+        # All generated files by name, including the top level ones.
+        self.outputs = {}
+
         # isa_name / namespace identifier from namespace declaration.
         # before the namespace declaration, None.
         self.isa_name = None
@@ -1818,8 +1855,8 @@ class ISAParser(Grammar):
         for f in self.splits.iterkeys():
             f.write('\n#endif\n')
 
-        for f in self.files.itervalues(): # close ALL the files;
-            f.close() # not doing so can cause compilation to fail
+        for f in self.files.itervalues(): # close ALL the files
+            f.close()
 
         self.write_top_level_files()
 
@@ -2507,11 +2544,83 @@ StaticInstPtr
         self.operandsWithExtRE = \
             re.compile(operandsWithExtREString, re.MULTILINE)
 
+        # Position of the operands in the alternatives of the regular
+        # expressions above, which decides between overlapping matches.
+        self.operandIndex = {}
+        for index, op in enumerate(operands):
+            self.operandIndex.setdefault(op, index)
+        self.operandExtensions = set(extensions)
+
+        # Operands and munged names found in code blocks so far
+        self.operandsCache = {}
+        self.mungedCache = {}
+
+    def splitOperand(self, word, with_ext=False):
+        '''Split an identifier into an operand name and its extension,
+        like operandsRE (or operandsWithExtRE if with_ext is True) would
+        match it.  Returns None if it isn't an operand.'''
+        best = None
+        if not with_ext:
+            index = self.operandIndex.get(word)
+            if index is not None:
+                best = (index, word, None)
+
+        pos = word.find('_')
+        while pos >= 0:
+            index = self.operandIndex.get(word[:pos])
+            if index is not None and (best is None or index < best[0]) and \
+                    word[pos + 1:] in self.operandExtensions:
+                best = (index, word[:pos], word[pos + 1:])
+            pos = word.find('_', pos + 1)
+
+        if best is None:
+            return None
+        return best[1:]
+
+    def findOperands(self, code):
+        '''Find the operands used in a code block.  Returns a tuple of
+        (full name, base name, extension, is_dest) tuples in the order the
+        operands appear.'''
+        try:
+            return self.operandsCache[code]
+        except KeyError:
+            pass
+
+        # delete strings and comments so we don't match on operands inside
+        stripped = code
+        for regEx in (stringRE, commentRE):
+            stripped = regEx.sub('', stripped)
+
+        operands = []
+        for match in operandWordRE.finditer(stripped):
+            op = self.splitOperand(match.group())
+            if op is None:
+                continue
+            # if the token following the operand is an assignment, this is
+            # a destination (LHS), else it's a source (RHS)
+            is_dest = assignRE.match(stripped, match.end()) is not None
+            operands.append((match.group(), op[0], op[1], is_dest))
+
+        operands = tuple(operands)
+        self.operandsCache[code] = operands
+        return operands
+
     def substMungedOpNames(self, code):
         '''Munge operand names in code string to make legal C++
         variable names.  This means getting rid of the type extension
         if any.  Will match base_name attribute of Operand object.)'''
-        return self.operandsWithExtRE.sub(r'\1', code)
+        try:
+            return self.mungedCache[code]
+        except KeyError:
+            pass
+
+        def munge(match):
+            op = self.splitOperand(match.group(), with_ext=True)
+            return match.group() if op is None else op[0]
+
+        munged = operandWithExtWordRE.sub(munge, code)
+        self.mungedCache[code] = munged
+        return munged
 
     def mungeSnippet(self, s):
         '''Fix up code snippets for final substitution in templates.'''
@@ -2522,16 +2631,15 @@ StaticInstPtr
 
     def open(self, name, bare=False):
         '''Open the output file for writing and include scary warning.'''
-        filename = os.path.join(self.output_dir, name)
-        f = open(filename, 'w')
-        if f:
-            if not bare:
-                f.write(ISAParser.scaremonger_template % self)
+        f = OutputFile(name)
+        if not bare:
+            f.write(ISAParser.scaremonger_template % self)
+        self.outputs[name] = f
         return f
 
     def update(self, file, contents):
-        '''Update the output file only.  Scons should handle the case when
-        the new contents are unchanged using its built-in hash feature.'''
+        '''Update the output file only.  The file is left alone when the new
+        contents are unchanged.'''
         f = self.open(file)
         f.write(contents)
         f.close()
@@ -2572,6 +2680,90 @@ StaticInstPtr
         self.fileNameStack.pop()
         return contents
 
+    def write_outputs(self, outputs):
+        '''Write the generated files, given as (name, contents) pairs.  The
+        files are independent of each other, so they are compared and
+        written in parallel.'''
+        if not os.path.isdir(self.output_dir):
+            os.makedirs(self.output_dir)
+
+        def write(output):
+            name, contents = output
+            write_if_changed(os.path.join(self.output_dir, name), contents)
+
+        pool = multiprocessing.dummy.Pool(min(len(outputs), 8) or 1)
+        try:
+            pool.map(write, outputs)
+        finally:
+            pool.close()
+            pool.join()
+
+    def cache_file(self):
+        if self.cache_dir is None:
+            return None
+        return os.path.join(self.cache_dir,
+                            self.filename.replace('/', '-') + '.pickle')
+
+    def python_dependencies(self):
+        '''Digests of the parser and the Python modules loaded from the
+        source tree, like the micro assembler and the x86 microcode, which
+        can affect the generated code besides the ISA description.'''
+        arch_dir = os.path.dirname(os.path.abspath(__file__))
+        deps = []
+        for module in sys.modules.values():
+            filename = getattr(module, '__file__', None)
+            if not filename:
+                continue
+            filename = os.path.abspath(filename)
+            if filename.endswith(('.pyc', '.pyo')):
+                filename = filename[:-1]
+            if filename.startswith(arch_dir + os.sep) and \
+                    os.path.isfile(filename):
+                deps.append((filename, file_digest(filename)))
+        return sorted(deps)
+
+    def load_cache(self, desc_digest):
+        '''Return the generated files of a previous run for the same ISA
+        description, or None if there's no such run or one of the Python
+        modules it used changed.'''
+        cache_file = self.cache_file()
+        if cache_file is None:
+            return None
+        try:
+            with open(cache_file, 'rb') as f:
+                cached_digest, deps, outputs = cPickle.load(f)
+        except (IOError, EOFError, ValueError, TypeError,
+                cPickle.UnpicklingError):
+            return None
+
+        if cached_digest != desc_digest:
+            return None
+        for filename, digest in deps:
+            try:
+                if file_digest(filename) != digest:
+                    return None
+            except IOError:
+                return None
+        return outputs
+
+    def save_cache(self, desc_digest, outputs):
+        cache_file = self.cache_file()
+        if cache_file is None:
+            return
+        if not os.path.isdir(self.cache_dir):
+            os.makedirs(self.cache_dir)
+
+        # Several builds may share the cache, so replace it atomically
+        fd, tmp = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                cPickle.dump((desc_digest, self.python_dependencies(),
+                              outputs), f, cPickle.HIGHEST_PROTOCOL)
+            os.rename(tmp, cache_file)
+        except:
+            os.unlink(tmp)
+            raise
+
     AlreadyGenerated = {}
 
     def _parse_isa_desc(self, isa_desc_file):
@@ -2596,11 +2788,24 @@ StaticInstPtr
         # do this up front.
         isa_desc = self.read_and_flatten(isa_desc_file)
 
-        # Initialize lineno tracker
-        self.lex.lineno = LineTracker(isa_desc_file)
+        # The generated files only depend on the flattened description and
+        # the Python code run while parsing it, which is checked by
+        # load_cache.
+        desc_digest = hashlib.sha1(isa_desc).hexdigest()
+        outputs = self.load_cache(desc_digest)
+
+        if outputs is None:
+            # Initialize lineno tracker
+            self.lex.lineno = LineTracker(isa_desc_file)
+
+            # Parse.
+            self.parse_string(isa_desc)
+
+            outputs = sorted((name, f.contents())
+                             for name, f in self.outputs.iteritems())
+            self.save_cache(desc_digest, outputs)
 
-        # Parse.
-        self.parse_string(isa_desc)
+        self.write_outputs(outputs)
 
         ISAParser.AlreadyGenerated[isa_desc_file] = None
 
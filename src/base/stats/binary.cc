@@ -0,0 +1,334 @@
+/*
+ * Copyright 2019 Alexander Fasching
+ *
+ * This program is free software: you can redistribute it and/or modify
+ * it under the terms of the GNU General Public License as published by
+ * the Free Software Foundation, either version 3 of the License, or
+ * (at your option) any later version.
+ *
+ * This program is distributed in the hope that it will be useful,
+ * but WITHOUT ANY WARRANTY; without even the implied warranty of
+ * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ * GNU General Public License for more details.
+ *
+ * You should have received a copy of the GNU General Public License
+ * along with this program. If not, see <http://www.gnu.org/licenses/>.
+ */
+
+#include "base/stats/binary.hh"
+
+#include <algorithm>
+#include <cmath>
+#include <cstring>
+#include <iostream>
+
+#include "base/logging.hh"
+#include "base/output.hh"
+#include "sim/byteswap.hh"
+
+using namespace std;
+
+namespace Stats {
+
+static const char binaryMagic[8] = {'g', 'e', 'm', '5', 's', 't', 'a', 't'};
+static const uint32_t binaryVersion = 1;
+
+template <typename T>
+static void
+writeLE(ostream &stream, T value)
+{
+    value = htole(value);
+    stream.write(reinterpret_cast<const char *>(&value), sizeof(value));
+}
+
+Binary::Binary()
+    : stream(NULL), rows(0)
+{
+}
+
+void
+Binary::open(std::ostream &_stream)
+{
+    if (stream)
+        panic("stream already set!");
+
+    stream = &_stream;
+    if (!valid())
+        fatal("Unable to open output stream for writing\n");
+}
+
+bool
+Binary::valid() const
+{
+    return stream != NULL && stream->good();
+}
+
+void
+Binary::begin()
+{
+    row.clear();
+}
+
+void
+Binary::end()
+{
+    if (rows == 0) {
+        writeHeader();
+    } else if (row.size() != names.size()) {
+        panic("Number of statistics changed from %d to %d between dumps",
+              names.size(), row.size());
+    }
+
+    for (Result value : row) {
+        uint64_t bits;
+        memcpy(&bits, &value, sizeof(bits));
+        writeLE(*stream, bits);
+    }
+    stream->flush();
+    ++rows;
+}
+
+void
+Binary::writeHeader()
+{
+    stream->write(binaryMagic, sizeof(binaryMagic));
+    writeLE(*stream, binaryVersion);
+    writeLE(*stream, (uint32_t)names.size());
+
+    uint64_t size = sizeof(binaryMagic) + 2 * sizeof(uint32_t);
+    for (const string &name : names) {
+        uint16_t length = min<size_t>(name.size(), UINT16_MAX);
+        writeLE(*stream, length);
+        stream->write(name.data(), length);
+        size += sizeof(length) + length;
+    }
+
+    // Align the rows, so they can be mapped as an array of doubles
+    static const char padding[8] = {};
+    stream->write(padding, (8 - size % 8) % 8);
+}
+
+bool
+Binary::noOutput(const Info &info)
+{
+    // Statistics with a zero prerequisite are still written, otherwise
+    // the columns could change between dumps.
+    return !info.flags.isSet(display);
+}
+
+void
+Binary::addValue(const string &name, Result value)
+{
+    if (rows == 0)
+        names.push_back(name);
+    row.push_back(value);
+}
+
+void
+Binary::addVector(const string &name, const string &separator,
+                  const std::vector<string> &subnames, const VResult &vec,
+                  Result total, bool withTotal, bool forceSubnames)
+{
+    size_type size = vec.size();
+    string base = name + separator;
+    bool havesub = !subnames.empty();
+
+    if (size == 1) {
+        if (forceSubnames)
+            addValue(base + (havesub ? subnames[0] : to_string(0)), vec[0]);
+        else
+            addValue(name, vec[0]);
+        return;
+    }
+
+    for (off_type i = 0; i < size; ++i) {
+        if (havesub && (i >= subnames.size() || subnames[i].empty()))
+            continue;
+        addValue(base + (havesub ? subnames[i] : to_string(i)), vec[i]);
+    }
+
+    if (withTotal)
+        addValue(base + "total", total);
+}
+
+void
+Binary::addDist(const string &name, const string &separator,
+                const DistData &data)
+{
+    string base = name + separator;
+
+    if (data.type == Dist || data.type == Hist) {
+        addValue(base + "bucket_size", data.bucket_size);
+        addValue(base + "min_bucket", data.min);
+        addValue(base + "max_bucket", data.max);
+    }
+
+    addValue(base + "samples", data.samples);
+    addValue(base + "mean", data.samples ? data.sum / data.samples : NAN);
+
+    if (data.type == Hist) {
+        addValue(base + "gmean",
+                 data.samples ? exp(data.logs / data.samples) : NAN);
+    }
+
+    Result stdev = NAN;
+    if (data.samples)
+        stdev = sqrt((data.samples * data.squares - data.sum * data.sum) /
+                     (data.samples * (data.samples - 1.0)));
+    addValue(base + "stdev", stdev);
+
+    if (data.type == Deviation)
+        return;
+
+    size_t size = data.cvec.size();
+
+    Result total = 0.0;
+    if (data.type == Dist)
+        total += data.underflow + data.overflow;
+    for (off_type i = 0; i < size; ++i)
+        total += data.cvec[i];
+
+    if (data.type == Dist)
+        addValue(base + "underflows", data.underflow);
+
+    // Buckets are numbered instead of named by their range, since
+    // histograms grow their buckets between dumps. Their ranges follow
+    // from the bucket_size and min_bucket columns of the same row.
+    for (off_type i = 0; i < size; ++i)
+        addValue(base + to_string(i), data.cvec[i]);
+
+    if (data.type == Dist) {
+        addValue(base + "overflows", data.overflow);
+        addValue(base + "min_value", data.min_val);
+        addValue(base + "max_value", data.max_val);
+    }
+
+    addValue(base + "total", total);
+}
+
+void
+Binary::visit(const ScalarInfo &info)
+{
+    if (noOutput(info))
+        return;
+
+    addValue(info.name, info.result());
+}
+
+void
+Binary::visit(const VectorInfo &info)
+{
+    if (noOutput(info))
+        return;
+
+    std::vector<string> subnames;
+    for (const string &subname : info.subnames) {
+        if (!subname.empty()) {
+            subnames = info.subnames;
+            subnames.resize(info.size());
+            break;
+        }
+    }
+
+    addVector(info.name, info.separatorString, subnames, info.result(),
+              info.total(), info.flags.isSet(::Stats::total), false);
+}
+
+void
+Binary::visit(const Vector2dInfo &info)
+{
+    if (noOutput(info))
+        return;
+
+    std::vector<string> subnames;
+    for (const string &subname : info.y_subnames) {
+        if (!subname.empty()) {
+            subnames = info.y_subnames;
+            break;
+        }
+    }
+
+    bool havesub = false;
+    for (const string &subname : info.subnames) {
+        if (!subname.empty())
+            havesub = true;
+    }
+
+    bool withTotal = info.flags.isSet(::Stats::total);
+    for (off_type i = 0; i < info.x; ++i) {
+        if (havesub && (i >= info.subnames.size() || info.subnames[i].empty()))
+            continue;
+
+        off_type iy = i * info.y;
+        VResult yvec(info.cvec.begin() + iy, info.cvec.begin() + iy + info.y);
+
+        Result total = 0.0;
+        for (Result value : yvec)
+            total += value;
+
+        string name = info.name + "_" +
+            (havesub ? info.subnames[i] : to_string(i));
+        addVector(name, info.separatorString, subnames, yvec, total,
+                  withTotal, true);
+    }
+
+    if (withTotal && info.x > 1) {
+        addVector(info.name, info.separatorString,
+                  std::vector<string>(1, "total"), VResult(1, info.total()),
+                  0.0, false, true);
+    }
+}
+
+void
+Binary::visit(const DistInfo &info)
+{
+    if (noOutput(info))
+        return;
+
+    addDist(info.name, info.separatorString, info.data);
+}
+
+void
+Binary::visit(const VectorDistInfo &info)
+{
+    if (noOutput(info))
+        return;
+
+    for (off_type i = 0; i < info.size(); ++i) {
+        string name = info.name + "_" +
+            (info.subnames[i].empty() ? to_string(i) : info.subnames[i]);
+        addDist(name, info.separatorString, info.data[i]);
+    }
+}
+
+void
+Binary::visit(const FormulaInfo &info)
+{
+    visit((const VectorInfo &)info);
+}
+
+void
+Binary::visit(const SparseHistInfo &info)
+{
+    if (noOutput(info))
+        return;
+
+    addValue(info.name + info.separatorString + "samples",
+             info.data.samples);
+}
+
+Output *
+initBinary(const string &filename)
+{
+    static Binary binary;
+    static bool connected = false;
+
+    if (!connected) {
+        binary.open(*simout.findOrCreate(filename, true)->stream());
+        connected = true;
+    }
+
+    return &binary;
+}
+
+} // namespace Stats
@@ -0,0 +1,102 @@
+/*
+ * Copyright 2019 Alexander Fasching
+ *
+ * This program is free software: you can redistribute it and/or modify
+ * it under the terms of the GNU General Public License as published by
+ * the Free Software Foundation, either version 3 of the License, or
+ * (at your option) any later version.
+ *
+ * This program is distributed in the hope that it will be useful,
+ * but WITHOUT ANY WARRANTY; without even the implied warranty of
+ * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ * GNU General Public License for more details.
+ *
+ * You should have received a copy of the GNU General Public License
+ * along with this program. If not, see <http://www.gnu.org/licenses/>.
+ */
+
+#ifndef __BASE_STATS_BINARY_HH__
+#define __BASE_STATS_BINARY_HH__
+
+#include <iosfwd>
+#include <string>
+#include <vector>
+
+#include "base/stats/info.hh"
+#include "base/stats/output.hh"
+#include "base/stats/types.hh"
+
+namespace Stats {
+
+/**
+ * Writes the statistics in a compact binary format with one column per
+ * value. The file starts with a header naming the columns, followed by one
+ * row of little endian doubles per dump:
+ *
+ *   char     magic[8]     "gem5stat"
+ *   uint32_t version      1
+ *   uint32_t columns
+ *   columns x { uint16_t length; char name[length]; }
+ *   zero padding to a multiple of 8 bytes
+ *   double   row[columns] for every dump
+ *
+ * Columns are named like the lines of the text output. Unlike there, every
+ * displayed statistic is written even if it's zero, so all rows have the
+ * same columns. The buckets of distributions and histograms are numbered
+ * from 0, since histograms double their bucket size when they grow. Bucket
+ * i of a dump covers the values from min_bucket + i * bucket_size of that
+ * dump. Sparse histograms only have their number of samples, since their
+ * buckets change between dumps.
+ */
+class Binary : public Output
+{
+  protected:
+    std::ostream *stream;
+
+    /** Column names, recorded during the first dump. */
+    std::vector<std::string> names;
+
+    /** Values of the current dump. */
+    std::vector<Result> row;
+
+    /** Number of rows written. */
+    uint64_t rows;
+
+  protected:
+    bool noOutput(const Info &info);
+
+    void addValue(const std::string &name, Result value);
+    void addVector(const std::string &name, const std::string &separator,
+                   const std::vector<std::string> &subnames,
+                   const VResult &vec, Result total, bool withTotal,
+                   bool forceSubnames);
+    void addDist(const std::string &name, const std::string &separator,
+                 const DistData &data);
+
+    void writeHeader();
+
+  public:
+    Binary();
+
+    void open(std::ostream &stream);
+
+    // Implement Visit
+    virtual void visit(const ScalarInfo &info);
+    virtual void visit(const VectorInfo &info);
+    virtual void visit(const DistInfo &info);
+    virtual void visit(const VectorDistInfo &info);
+    virtual void visit(const Vector2dInfo &info);
+    virtual void visit(const FormulaInfo &info);
+    virtual void visit(const SparseHistInfo &info);
+
+    // Implement Output
+    virtual bool valid() const;
+    virtual void begin();
+    virtual void end();
+};
+
+Output *initBinary(const std::string &filename);
+
+} // namespace Stats
+
+#endif // __BASE_STATS_BINARY_HH__
@@ -103,9 +103,17 @@ class LTAGE(BranchPredictor):
     minTagWidth = Param.Unsigned(7, "Minimum tag size in tag tables")
 
 
+class ExternalBPTransport(Enum): vals = ['socket', 'shm']
+
 class ExternalBP(BranchPredictor):
     type = 'ExternalBP'
     cxx_class = 'ExternalBP'
     cxx_header = "cpu/pred/external_bp.hh"
 
     socketName = Param.String("/tmp/gem5.socket", "Name of the socket")
+    protocol = Param.Unsigned(1, "Requested wire protocol version. Versions "
+                              "above 1 are negotiated with the predictor")
+    transport = Param.ExternalBPTransport('socket',
+        "Channel to the predictor. 'shm' uses ring buffers in a shared "
+        "memory file and always uses protocol version 2")
+    shmName = Param.String("", "Shared memory file for the 'shm' transport")
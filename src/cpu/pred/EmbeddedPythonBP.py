@@ -0,0 +1,82 @@
+#
+# Copyright 2019 Alexander Fasching
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+import ast
+import importlib
+import struct
+
+from m5.params import *
+from BranchPredictor import BranchPredictor
+
+# Calls are packed like the messages of the ExternalBP socket protocol
+_MSG_STRUCT = struct.Struct('=bhQQbb')
+
+_METH_UNCOND_BRANCH = 0
+_METH_BTB_UPDATE = 2
+_METH_UPDATE = 3
+_METH_SQUASH = 4
+
+class EmbeddedPythonBP(BranchPredictor):
+    type = 'EmbeddedPythonBP'
+    cxx_class = 'EmbeddedPythonBP'
+    cxx_header = "cpu/pred/embedded_bp.hh"
+
+    predictorClass = Param.String("Python class of the predictor, e.g. "
+                                  "'bpredict.GSharePredictor'. It has to "
+                                  "be importable by the simulator")
+    predictorArgs = Param.String("{}", "Keyword arguments of the predictor "
+                                 "as Python dictionary literal")
+    batchSize = Param.Unsigned(1, "Number of calls other than lookup "
+                               "passed to the predictor at once. Pending "
+                               "calls are always passed before a lookup")
+
+def _create_predictor(class_path, args):
+    """Instantiate the predictor of an EmbeddedPythonBP."""
+    module, _, name = class_path.rpartition('.')
+    cls = getattr(importlib.import_module(module), name)
+    return cls(**ast.literal_eval(args))
+
+def _dispatch(predictor, data):
+    """Pass a batch of packed calls to the predictor."""
+    for offset in range(0, len(data), _MSG_STRUCT.size):
+        meth, tid, addr, index, taken, squashed = \
+            _MSG_STRUCT.unpack_from(data, offset)
+        if meth == _METH_UPDATE:
+            predictor._base_update(tid, addr, taken, index, squashed)
+        elif meth == _METH_BTB_UPDATE:
+            predictor._base_btb_update(tid, addr, index)
+        elif meth == _METH_UNCOND_BRANCH:
+            predictor._base_uncond_branch(tid, addr, index)
+        elif meth == _METH_SQUASH:
+            predictor._base_squash(tid, index)
+        else:
+            raise ValueError('Unknown method %d' % meth)
+
+def _lookup(predictor, data, tid, addr, index):
+    """Pass the pending calls and look up a branch."""
+    if data:
+        _dispatch(predictor, data)
+    pred, _ = predictor._base_lookup(tid, addr, index)
+    return bool(pred)
+
+def _close(predictor, data):
+    """Pass the pending calls and finish the trace of the predictor."""
+    if data:
+        _dispatch(predictor, data)
+    close_trace = getattr(predictor, 'close_trace', None)
+    if close_trace is not None:
+        close_trace()
@@ -0,0 +1,183 @@
+/*
+ * Copyright 2019 Alexander Fasching
+ *
+ * This program is free software: you can redistribute it and/or modify
+ * it under the terms of the GNU General Public License as published by
+ * the Free Software Foundation, either version 3 of the License, or
+ * (at your option) any later version.
+ *
+ * This program is distributed in the hope that it will be useful,
+ * but WITHOUT ANY WARRANTY; without even the implied warranty of
+ * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ * GNU General Public License for more details.
+ *
+ * You should have received a copy of the GNU General Public License
+ * along with this program. If not, see <http://www.gnu.org/licenses/>.
+ */
+
+#include "cpu/pred/embedded_bp.hh"
+
+#include <algorithm>
+#include <cstring>
+
+#include "base/callback.hh"
+#include "base/logging.hh"
+#include "sim/core.hh"
+
+namespace py = pybind11;
+
+#define METH_UNCOND_BRANCH  0
+#define METH_BTB_UPDATE     2
+#define METH_UPDATE         3
+#define METH_SQUASH         4
+
+/* Layout of a packed call, the same as a message of the ExternalBP */
+struct __attribute__((packed)) EmbeddedBPCall {
+  int8_t method_id;
+  int16_t tid;
+  uint64_t branch_addr;
+  uint64_t bp_history_index;
+  int8_t taken;
+  int8_t squashed;
+};
+
+
+EmbeddedPythonBP::EmbeddedPythonBP(const EmbeddedPythonBPParams *params)
+    : BPredUnit(params),
+      pendingCalls(0),
+      batchSize(std::max<unsigned>(params->batchSize, 1)),
+      nextHistoryIndex(1)
+{
+  try {
+    helpers = py::module::import("m5.objects.EmbeddedPythonBP");
+    predictor = helpers.attr("_create_predictor")(params->predictorClass,
+                                                  params->predictorArgs);
+  } catch (py::error_already_set &e) {
+    fatal("Failed to create predictor %s: %s", params->predictorClass,
+          e.what());
+  }
+
+  pending.reserve(batchSize * sizeof(EmbeddedBPCall));
+
+  // Updates might still be pending when the simulation ends
+  registerExitCallback(
+      new MakeCallback<EmbeddedPythonBP, &EmbeddedPythonBP::close>(this));
+}
+
+
+void
+EmbeddedPythonBP::queueCall(int8_t method, ThreadID tid, Addr addr,
+                            uint64_t index, bool taken, bool squashed)
+{
+  EmbeddedBPCall call;
+  call.method_id = method;
+  call.tid = tid;
+  call.branch_addr = addr;
+  call.bp_history_index = index;
+  call.taken = taken;
+  call.squashed = squashed;
+
+  const char *data = reinterpret_cast<const char *>(&call);
+  pending.insert(pending.end(), data, data + sizeof(call));
+
+  if (++pendingCalls >= batchSize)
+    flushCalls();
+}
+
+
+void
+EmbeddedPythonBP::flushCalls()
+{
+  if (pending.empty())
+    return;
+
+  try {
+    helpers.attr("_dispatch")(predictor,
+                              py::bytes(pending.data(), pending.size()));
+  } catch (py::error_already_set &e) {
+    panic("Python predictor failed: %s", e.what());
+  }
+
+  pending.clear();
+  pendingCalls = 0;
+}
+
+
+void
+EmbeddedPythonBP::close()
+{
+  try {
+    helpers.attr("_close")(predictor,
+                           py::bytes(pending.data(), pending.size()));
+  } catch (py::error_already_set &e) {
+    warn("Python predictor failed to finish: %s", e.what());
+  }
+
+  pending.clear();
+  pendingCalls = 0;
+}
+
+
+void
+EmbeddedPythonBP::btbUpdate(ThreadID tid, Addr branch_addr,
+                            void * &bp_history)
+{
+  queueCall(METH_BTB_UPDATE, tid, branch_addr, (uint64_t) bp_history,
+            false, false);
+}
+
+
+bool
+EmbeddedPythonBP::lookup(ThreadID tid, Addr branch_addr, void * &bp_history)
+{
+  uint64_t index = nextHistoryIndex++;
+  bp_history = (void *) index;
+
+  // The pending calls are passed together with the lookup, so there's only
+  // one call into Python per lookup.
+  bool pred;
+  try {
+    py::object result = helpers.attr("_lookup")(
+        predictor, py::bytes(pending.data(), pending.size()), tid,
+        branch_addr, index);
+    pred = result.cast<bool>();
+  } catch (py::error_already_set &e) {
+    panic("Python predictor failed: %s", e.what());
+  }
+
+  pending.clear();
+  pendingCalls = 0;
+  return pred;
+}
+
+
+void
+EmbeddedPythonBP::update(ThreadID tid, Addr branch_addr, bool taken,
+                         void *bp_history, bool squashed)
+{
+  queueCall(METH_UPDATE, tid, branch_addr, (uint64_t) bp_history, taken,
+            squashed);
+}
+
+
+void
+EmbeddedPythonBP::uncondBranch(ThreadID tid, Addr pc, void *&bp_history)
+{
+  uint64_t index = nextHistoryIndex++;
+  bp_history = (void *) index;
+  queueCall(METH_UNCOND_BRANCH, tid, pc, index, false, false);
+}
+
+
+void
+EmbeddedPythonBP::squash(ThreadID tid, void *bp_history)
+{
+  queueCall(METH_SQUASH, tid, 0, (uint64_t) bp_history, false, false);
+}
+
+
+EmbeddedPythonBP*
+EmbeddedPythonBPParams::create()
+{
+    return new EmbeddedPythonBP(this);
+}
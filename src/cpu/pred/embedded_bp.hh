@@ -0,0 +1,83 @@
+/*
+ * Copyright 2019 Alexander Fasching
+ *
+ * This program is free software: you can redistribute it and/or modify
+ * it under the terms of the GNU General Public License as published by
+ * the Free Software Foundation, either version 3 of the License, or
+ * (at your option) any later version.
+ *
+ * This program is distributed in the hope that it will be useful,
+ * but WITHOUT ANY WARRANTY; without even the implied warranty of
+ * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ * GNU General Public License for more details.
+ *
+ * You should have received a copy of the GNU General Public License
+ * along with this program. If not, see <http://www.gnu.org/licenses/>.
+ */
+
+#ifndef __CPU_PRED_EMBEDDED_BP_HH__
+#define __CPU_PRED_EMBEDDED_BP_HH__
+
+#include <cstdint>
+#include <vector>
+
+#include "pybind11/pybind11.h"
+
+#include "base/compiler.hh"
+#include "base/types.hh"
+#include "cpu/pred/bpred_unit.hh"
+#include "params/EmbeddedPythonBP.hh"
+
+/**
+ * Implements a branch predictor that calls a predictor written in Python
+ * directly in the interpreter of the simulator. The predictor has the same
+ * interface as for the ExternalBP, but no messages are serialized and sent
+ * to another process.
+ *
+ * History indices are allocated by the simulator. Calls other than lookup
+ * are packed into a buffer, which is passed to Python when it holds
+ * batchSize calls or before the next lookup.
+ */
+class M5_LOCAL EmbeddedPythonBP : public BPredUnit
+{
+  public:
+    EmbeddedPythonBP(const EmbeddedPythonBPParams *params);
+
+    void uncondBranch(ThreadID tid, Addr pc, void * &bp_history);
+
+    bool lookup(ThreadID tid, Addr branch_addr, void * &bp_history);
+
+    void btbUpdate(ThreadID tid, Addr branch_addr, void * &bp_history);
+
+    void update(ThreadID tid, Addr branch_addr, bool taken, void *bp_history,
+                bool squashed);
+
+    void squash(ThreadID tid, void *bp_history);
+
+  private:
+    /** Append a call to the buffer and pass the buffer on if it's full. */
+    void queueCall(int8_t method, ThreadID tid, Addr addr, uint64_t index,
+                   bool taken, bool squashed);
+
+    /** Pass the pending calls to the predictor. */
+    void flushCalls();
+
+    /** Pass the pending calls and let the predictor finish at exit. */
+    void close();
+
+    /** Module with the Python helpers of the SimObject. */
+    pybind11::module helpers;
+
+    /** Instance of the Python predictor. */
+    pybind11::object predictor;
+
+    /** Packed calls not yet passed to the predictor. */
+    std::vector<char> pending;
+    unsigned pendingCalls;
+    unsigned batchSize;
+
+    /** Next history index handed out to the predictor. */
+    uint64_t nextHistoryIndex;
+};
+
+#endif // __CPU_PRED_EMBEDDED_BP_HH__
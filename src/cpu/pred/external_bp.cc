@@ -17,21 +17,88 @@
 
 #include "cpu/pred/external_bp.hh"
 
+#include <fcntl.h>
 #include <netdb.h>
+#include <sched.h>
+#include <sys/mman.h>
 #include <sys/socket.h>
+#include <sys/stat.h>
 #include <sys/types.h>
 #include <sys/un.h>
 #include <unistd.h>
 
+#ifdef __linux__
+#include <linux/futex.h>
+#include <sys/syscall.h>
+#endif
+
+#include <algorithm>
+#include <climits>
 #include <cstdio>
+#include <cstring>
+#include <ctime>
+
+#include "base/intmath.hh"
+#include "base/logging.hh"
 
 #define BUFSIZE 1024
 
+/* Size of the stdio buffer for the socket. Fire-and-forget messages of the
+ * batched protocol are accumulated in this buffer. */
+#define SEND_BUFSIZE 65536
+
 #define METH_UNCOND_BRANCH  0
 #define METH_LOOKUP         1
 #define METH_BTB_UPDATE     2
 #define METH_UPDATE         3
 #define METH_SQUASH         4
+#define METH_HELLO          5
+
+/* Version 1: Every message is flushed and every method except update and
+ *            squash blocks until the response is received.
+ * Version 2: History indices are allocated by the simulator, so only lookup
+ *            needs a response (a single byte with the prediction). All other
+ *            messages are buffered and sent together with the next lookup.
+ */
+#define PROTOCOL_VERSION    2
+
+/* Magic number and layout version of the shared memory file ("GBPR") */
+#define SHM_MAGIC           0x52504247
+#define SHM_VERSION         1
+
+/* Number of polls before a waiting side goes to sleep */
+#define SHM_SPIN_COUNT      4096
+
+/* Upper bound for a single sleep in nanoseconds. The Python side can't issue
+ * memory fences, so a wakeup might get lost and we poll again instead. */
+#define SHM_SLEEP_NS        1000000
+
+
+#ifdef __linux__
+static void
+futexWait(uint32_t *addr, uint32_t val)
+{
+    struct timespec timeout = { 0, SHM_SLEEP_NS };
+    syscall(SYS_futex, addr, FUTEX_WAIT, val, &timeout, NULL, 0);
+}
+
+static void
+futexWake(uint32_t *addr)
+{
+    syscall(SYS_futex, addr, FUTEX_WAKE, INT_MAX, NULL, NULL, 0);
+}
+#else
+static void
+futexWait(uint32_t *addr, uint32_t val)
+{
+    sched_yield();
+}
+
+static void
+futexWake(uint32_t *addr)
+{
+}
+#endif
 
 
 struct __attribute__((packed)) {
@@ -50,8 +117,23 @@ struct __attribute__((packed)) {
 
 
 ExternalBP::ExternalBP(const ExternalBPParams *params)
-    : BPredUnit(params)
+    : BPredUnit(params),
+      connfp(NULL),
+      shm(NULL),
+      shmSize(0),
+      reqEntries(NULL),
+      rspEntries(NULL),
+      protocolVersion(1),
+      nextHistoryIndex(1)
 {
+  if (params->transport == Enums::shm) {
+    // The shared memory transport has no handshake. It is always used with
+    // simulator allocated history indices.
+    openSharedMemory(params->shmName);
+    protocolVersion = 2;
+    return;
+  }
+
   struct sockaddr_un addr;
   memset(&addr, 0, sizeof(addr));
   addr.sun_family = AF_UNIX;
@@ -61,45 +143,208 @@ ExternalBP::ExternalBP(const ExternalBPParams *params)
   int connfd = socket(AF_UNIX, SOCK_STREAM, 0);
   assert(connect(connfd, (struct sockaddr *) &addr, sizeof(addr)) == 0);
   connfp = fdopen(connfd, "r+");
+  setvbuf(connfp, NULL, _IOFBF, SEND_BUFSIZE);
+
+  // Older predictors don't know the handshake, so only send it if a newer
+  // protocol was requested. The predictor answers with the version it wants
+  // to use, which is never higher than the requested one.
+  if (params->protocol > 1) {
+    msg_buffer.method_id = METH_HELLO;
+    msg_buffer.tid = 0;
+    msg_buffer.branch_addr = std::min<unsigned>(params->protocol,
+                                                PROTOCOL_VERSION);
+    msg_buffer.bp_history_index = 0;
+    sendMessage(true);
+    receiveResponse();
+    protocolVersion = rsp_buffer.pred;
+    fatal_if(protocolVersion < 1 || protocolVersion > PROTOCOL_VERSION,
+             "External predictor selected unknown protocol version %d",
+             protocolVersion);
+  }
+}
+
+
+ExternalBP::~ExternalBP()
+{
+  if (shm) {
+    __atomic_store_n(&shm->closed, 1, __ATOMIC_SEQ_CST);
+    wakeRing(shm->req);
+    munmap(shm, shmSize);
+    return;
+  }
+
+  fflush(connfp);
+  fclose(connfp);
+}
+
+
+void
+ExternalBP::openSharedMemory(const std::string &name)
+{
+  int fd = open(name.c_str(), O_RDWR);
+  fatal_if(fd < 0, "Can't open shared memory file %s", name);
+
+  struct stat st;
+  fatal_if(fstat(fd, &st) != 0, "Can't stat shared memory file %s", name);
+  shmSize = st.st_size;
+  fatal_if(shmSize < sizeof(ExternalBPShmHeader),
+           "Shared memory file %s is too small", name);
+
+  void *base = mmap(NULL, shmSize, PROT_READ | PROT_WRITE, MAP_SHARED, fd, 0);
+  close(fd);
+  fatal_if(base == MAP_FAILED, "Can't map shared memory file %s", name);
+
+  shm = (ExternalBPShmHeader *) base;
+  fatal_if(shm->magic != SHM_MAGIC || shm->version != SHM_VERSION,
+           "Shared memory file %s has an unknown format", name);
+  fatal_if(!isPowerOf2(shm->reqCapacity) || !isPowerOf2(shm->rspCapacity),
+           "Ring capacities in %s must be powers of two", name);
+  fatal_if(shm->reqEntrySize < sizeof(msg_buffer),
+           "Request entries in %s are too small", name);
+  fatal_if(shm->dataOffset + (uint64_t) shm->reqCapacity * shm->reqEntrySize
+           + shm->rspCapacity > shmSize,
+           "Shared memory file %s is too small", name);
+
+  reqEntries = (uint8_t *) base + shm->dataOffset;
+  rspEntries = reqEntries + (size_t) shm->reqCapacity * shm->reqEntrySize;
+}
+
+
+void
+ExternalBP::wakeRing(ExternalBPRing &ring)
+{
+  // Pairs with the fence in waitRing(). Either the consumer sees the new head
+  // or we see that it's waiting.
+  __atomic_thread_fence(__ATOMIC_SEQ_CST);
+  if (__atomic_load_n(&ring.waiters, __ATOMIC_RELAXED)) {
+    __atomic_fetch_add(&ring.seq, 1, __ATOMIC_SEQ_CST);
+    futexWake(&ring.seq);
+  }
+}
+
+
+void
+ExternalBP::waitRing(ExternalBPRing &ring)
+{
+  uint64_t tail = ring.tail;
+  for (int i = 0; i < SHM_SPIN_COUNT; i++) {
+    if (__atomic_load_n(&ring.head, __ATOMIC_ACQUIRE) != tail)
+      return;
+  }
+
+  while (true) {
+    __atomic_store_n(&ring.waiters, 1, __ATOMIC_RELAXED);
+    __atomic_thread_fence(__ATOMIC_SEQ_CST);
+    uint32_t seq = __atomic_load_n(&ring.seq, __ATOMIC_ACQUIRE);
+    if (__atomic_load_n(&ring.head, __ATOMIC_ACQUIRE) != tail)
+      break;
+    futexWait(&ring.seq, seq);
+  }
+  __atomic_store_n(&ring.waiters, 0, __ATOMIC_RELAXED);
+}
+
+
+void
+ExternalBP::sendMessage(bool flush)
+{
+  if (shm) {
+    // Wait for a free entry. The predictor is woken up first, because it
+    // might be sleeping while we fill the buffer.
+    uint64_t head = shm->req.head;
+    while (head - __atomic_load_n(&shm->req.tail, __ATOMIC_ACQUIRE)
+           >= shm->reqCapacity) {
+      wakeRing(shm->req);
+      sched_yield();
+    }
+
+    uint64_t slot = head & (shm->reqCapacity - 1);
+    memcpy(reqEntries + slot * shm->reqEntrySize, &msg_buffer,
+           sizeof(msg_buffer));
+    __atomic_store_n(&shm->req.head, head + 1, __ATOMIC_RELEASE);
+
+    // Messages without a response are only published. The predictor is
+    // woken up by the next message that needs a response.
+    if (flush)
+      wakeRing(shm->req);
+    return;
+  }
+
+  panic_if(fwrite(&msg_buffer, sizeof(msg_buffer), 1, connfp) != 1,
+           "Failed to send message to external predictor");
+  if (flush)
+    panic_if(fflush(connfp) != 0,
+             "Failed to send message to external predictor");
+}
+
+
+void
+ExternalBP::receiveResponse()
+{
+  panic_if(fread(&rsp_buffer, sizeof(rsp_buffer), 1, connfp) != 1,
+           "Failed to receive response from external predictor");
+}
+
+
+bool
+ExternalBP::receivePrediction()
+{
+  uint8_t pred;
+
+  if (shm) {
+    waitRing(shm->rsp);
+    uint64_t tail = shm->rsp.tail;
+    pred = rspEntries[tail & (shm->rspCapacity - 1)];
+    __atomic_store_n(&shm->rsp.tail, tail + 1, __ATOMIC_RELEASE);
+    return pred;
+  }
+
+  panic_if(fread(&pred, sizeof(pred), 1, connfp) != 1,
+           "Failed to receive response from external predictor");
+  return pred;
 }
 
 
 void
 ExternalBP::btbUpdate(ThreadID tid, Addr branch_addr, void * &bp_history)
 {
-  errno = 0;
   msg_buffer.method_id = METH_BTB_UPDATE;
   msg_buffer.tid = tid;
   msg_buffer.branch_addr = branch_addr;
   msg_buffer.bp_history_index = (uint64_t) bp_history;
 
-  fwrite(&msg_buffer, sizeof(msg_buffer), 1, connfp);
-  fflush(connfp);
+  if (protocolVersion > 1) {
+    // The history index doesn't change, so there's nothing to wait for.
+    sendMessage(false);
+    return;
+  }
 
-  assert(fread(&rsp_buffer, sizeof(rsp_buffer), 1, connfp) == 1);
+  sendMessage(true);
+  receiveResponse();
   bp_history = (void *) rsp_buffer.bp_history_index;
-  assert(errno == 0);
 }
 
 
 bool
 ExternalBP::lookup(ThreadID tid, Addr branch_addr, void * &bp_history)
 {
-  errno = 0;
   msg_buffer.method_id = METH_LOOKUP;
   msg_buffer.tid = tid;
   msg_buffer.branch_addr = branch_addr;
-  msg_buffer.bp_history_index = (uint64_t) bp_history;
 
-  fwrite(&msg_buffer, sizeof(msg_buffer), 1, connfp);
-  fflush(connfp);
+  if (protocolVersion > 1) {
+    msg_buffer.bp_history_index = nextHistoryIndex++;
+    bp_history = (void *) msg_buffer.bp_history_index;
+    sendMessage(true);
 
-  assert(fread(&rsp_buffer, sizeof(rsp_buffer), 1, connfp) == 1);
-  bp_history = (void *) rsp_buffer.bp_history_index;
-  bool pred = rsp_buffer.pred;
+    // Only the prediction is sent back.
+    return receivePrediction();
+  }
 
-  assert(errno == 0);
-  return pred;
+  msg_buffer.bp_history_index = (uint64_t) bp_history;
+  sendMessage(true);
+  receiveResponse();
+  bp_history = (void *) rsp_buffer.bp_history_index;
+  return rsp_buffer.pred;
 }
 
 
@@ -114,26 +359,28 @@ ExternalBP::update(ThreadID tid, Addr branch_addr, bool taken,
   msg_buffer.taken = taken;
   msg_buffer.squashed = squashed;
 
-  fwrite(&msg_buffer, sizeof(msg_buffer), 1, connfp);
-  fflush(connfp);
+  sendMessage(protocolVersion == 1);
 }
 
 
 void
 ExternalBP::uncondBranch(ThreadID tid, Addr pc, void *&bp_history)
 {
-  errno = 0;
   msg_buffer.method_id = METH_UNCOND_BRANCH;
   msg_buffer.tid = tid;
   msg_buffer.branch_addr = pc;
-  msg_buffer.bp_history_index = (uint64_t) bp_history;
 
-  fwrite(&msg_buffer, sizeof(msg_buffer), 1, connfp);
-  fflush(connfp);
+  if (protocolVersion > 1) {
+    msg_buffer.bp_history_index = nextHistoryIndex++;
+    bp_history = (void *) msg_buffer.bp_history_index;
+    sendMessage(false);
+    return;
+  }
 
-  assert(fread(&rsp_buffer, sizeof(rsp_buffer), 1, connfp) == 1);
+  msg_buffer.bp_history_index = (uint64_t) bp_history;
+  sendMessage(true);
+  receiveResponse();
   bp_history = (void *) rsp_buffer.bp_history_index;
-  assert(errno == 0);
 }
 
 void
@@ -143,8 +390,7 @@ ExternalBP::squash(ThreadID tid, void * bp_history)
   msg_buffer.tid = tid;
   msg_buffer.bp_history_index = (uint64_t) bp_history;
 
-  fwrite(&msg_buffer, sizeof(msg_buffer), 1, connfp);
-  fflush(connfp);
+  sendMessage(protocolVersion == 1);
 }
 
 
@@ -19,11 +19,47 @@
 #define __CPU_PRED_EXTERNAL_PRED_HH__
 
 #include <cstdio>
+#include <string>
 
 #include "base/types.hh"
 #include "cpu/pred/bpred_unit.hh"
 #include "params/ExternalBP.hh"
 
+/**
+ * Control block of a single-producer single-consumer ring in shared memory.
+ * Head and tail are free-running counters on separate cache lines. The
+ * consumer sets waiters before sleeping on the futex word seq.
+ */
+struct ExternalBPRing
+{
+    uint64_t head;
+    uint8_t pad0[56];
+    uint64_t tail;
+    uint8_t pad1[56];
+    uint32_t seq;
+    uint32_t waiters;
+    uint8_t pad2[56];
+    uint8_t pad3[64];
+};
+
+/**
+ * Header of the shared memory file. The request ring entries start at
+ * dataOffset, followed by the entries of the response ring.
+ */
+struct ExternalBPShmHeader
+{
+    uint32_t magic;
+    uint32_t version;
+    uint32_t reqCapacity;
+    uint32_t rspCapacity;
+    uint32_t reqEntrySize;
+    uint32_t dataOffset;
+    uint32_t closed;
+    uint8_t pad[36];
+    ExternalBPRing req;
+    ExternalBPRing rsp;
+};
+
 /**
  * Implements a branch predictor that accesses an external predictor written in
  * Python.
@@ -36,6 +72,8 @@ class ExternalBP : public BPredUnit
      */
     ExternalBP(const ExternalBPParams *params);
 
+    ~ExternalBP();
+
     virtual void uncondBranch(ThreadID tid, Addr pc, void * &bp_history);
 
     /**
@@ -67,7 +105,37 @@ class ExternalBP : public BPredUnit
     void squash(ThreadID tid, void *bp_history);
 
   private:
+    /** Write the message buffer to the socket. */
+    void sendMessage(bool flush);
+
+    /** Read a full response into the response buffer. */
+    void receiveResponse();
+
+    /** Read the single byte prediction of a lookup. */
+    bool receivePrediction();
+
+    /** Map the shared memory file created by the predictor. */
+    void openSharedMemory(const std::string &name);
+
+    /** Wake the consumer of a ring if it is sleeping. */
+    void wakeRing(ExternalBPRing &ring);
+
+    /** Spin and then sleep until the ring is not empty. */
+    void waitRing(ExternalBPRing &ring);
+
     FILE *connfp;
+
+    /** Shared memory file, if the shm transport is used. */
+    ExternalBPShmHeader *shm;
+    size_t shmSize;
+    uint8_t *reqEntries;
+    uint8_t *rspEntries;
+
+    /** Protocol version negotiated with the external predictor. */
+    unsigned protocolVersion;
+
+    /** Next history index handed out if the simulator allocates them. */
+    uint64_t nextHistoryIndex;
 };
 
 #endif // __CPU_PRED_EXTERNAL_PRED_HH__
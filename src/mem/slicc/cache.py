@@ -0,0 +1,139 @@
+# Copyright 2019 Alexander Fasching
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+import cPickle
+import hashlib
+import os
+import tempfile
+from cStringIO import StringIO
+
+def digest(data):
+    return hashlib.sha1(data).hexdigest()
+
+def _code_digest():
+    '''Digest of the SLICC sources, so changes to the AST classes or the
+    grammar invalidate all parsed files'''
+    h = hashlib.sha1()
+    base = os.path.dirname(os.path.abspath(__file__))
+    for root, dirs, files in os.walk(base):
+        dirs.sort()
+        for name in sorted(files):
+            if name.endswith('.py'):
+                h.update(name)
+                with open(os.path.join(root, name), 'rb') as f:
+                    h.update(f.read())
+    return h.hexdigest()
+
+class CacheEntry(object):
+    '''The AST of a parsed file, with the digests of all files it includes
+    and the protocol it declares, if any'''
+    def __init__(self, ast, deps, protocol):
+        self.ast = ast
+        self.deps = deps
+        self.protocol = protocol
+
+class ParseCache(object):
+    '''Cache of parsed SLICC files, keyed by the path and the digest of
+    their contents, and stored in a pickle file.
+
+    The ASTs reference the SLICC object which parsed them.  That reference
+    is replaced by a placeholder when they are pickled and set to the SLICC
+    object using the cache when they are loaded again.'''
+
+    # Opened caches by path, since SCons creates a SLICC object for the
+    # emitter and another one for the action
+    _opened = {}
+
+    def __init__(self, path):
+        self.path = path
+        self.code = _code_digest()
+        self.entries = {}
+        self.dirty = False
+
+        try:
+            with open(path, 'rb') as f:
+                code, entries = cPickle.load(f)
+            if code == self.code:
+                self.entries = entries
+        except (IOError, EOFError, ValueError, TypeError,
+                cPickle.UnpicklingError):
+            pass
+
+    @classmethod
+    def open(cls, path):
+        path = os.path.abspath(path)
+        if path not in cls._opened:
+            cls._opened[path] = cls(path)
+        return cls._opened[path]
+
+    def lookup(self, slicc, source, data):
+        '''Return the CacheEntry of a file with a fresh copy of its AST, or
+        None if it wasn't parsed or one of its includes changed'''
+        key = (os.path.abspath(source), digest(data), slicc.verbose)
+        cached = self.entries.get(key)
+        if cached is None:
+            return None
+
+        pickled, deps, protocol = cached
+        for dep, dep_digest in deps:
+            try:
+                with open(dep, 'rb') as f:
+                    if digest(f.read()) != dep_digest:
+                        return None
+            except IOError:
+                return None
+
+        unpickler = cPickle.Unpickler(StringIO(pickled))
+        unpickler.persistent_load = lambda pid: slicc
+        return CacheEntry(unpickler.load(), deps, protocol)
+
+    def add(self, slicc, source, data, entry):
+        path = os.path.abspath(source)
+        data_digest = digest(data)
+
+        # Keep one version of every file
+        for key in self.entries.keys():
+            if key[0] == path and key[1] != data_digest:
+                del self.entries[key]
+
+        f = StringIO()
+        pickler = cPickle.Pickler(f, cPickle.HIGHEST_PROTOCOL)
+        pickler.persistent_id = lambda obj: 'slicc' if obj is slicc else None
+        pickler.dump(entry.ast)
+
+        key = (path, data_digest, slicc.verbose)
+        self.entries[key] = (f.getvalue(), entry.deps, entry.protocol)
+        self.dirty = True
+
+    def save(self):
+        if not self.dirty:
+            return
+
+        # Several builds may share the cache, so replace it atomically
+        directory = os.path.dirname(self.path)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        fd, tmp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                cPickle.dump((self.code, self.entries), f,
+                             cPickle.HIGHEST_PROTOCOL)
+            os.rename(tmp, self.path)
+        except:
+            os.unlink(tmp)
+            raise
+        self.dirty = False
+
+__all__ = [ 'ParseCache', 'CacheEntry', 'digest' ]
@@ -73,6 +73,8 @@ def main(args=None):
                       help="print traceback on error")
     parser.add_option("-q", "--quiet",
                       help="don't print messages")
+    parser.add_option("--cache",
+                      help="cache the parsed files in this file")
     opts,files = parser.parse_args(args=args)
 
     if len(files) != 1:
@@ -91,8 +93,9 @@ def main(args=None):
     output("Parsing...")
 
     protocol_base = os.path.join(os.path.dirname(__file__), '..', 'protocol')
-    slicc = SLICC(slicc_file, protocol_base, verbose=True, debug=opts.debug,
-                  traceback=opts.tb)
+    slicc_kwargs = { 'debug' : True } if opts.debug else {}
+    slicc = SLICC(slicc_file, protocol_base, verbose=True,
+                  traceback=opts.tb, cache_file=opts.cache, **slicc_kwargs)
 
 
     if opts.print_files:
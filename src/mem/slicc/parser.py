@@ -37,16 +37,41 @@ from m5.util.grammar import Grammar, ParseError
 
 import slicc.ast as ast
 import slicc.util as util
+from slicc.cache import CacheEntry, ParseCache, digest
 from slicc.symbols import SymbolTable
 
+class slicc_code_formatter(code_formatter):
+    '''Code formatter which leaves files alone if their contents didn't
+    change, so their timestamps don't cause the C++ code to be rebuilt'''
+    def write(self, *args):
+        path = os.path.join(*args)
+        data = str(self)
+        try:
+            with open(path, 'r') as f:
+                if f.read() == data:
+                    return
+        except IOError:
+            pass
+
+        with open(path, 'w') as f:
+            f.write(data)
+
 class SLICC(Grammar):
-    def __init__(self, filename, base_dir, verbose=False, traceback=False, **kwargs):
+    def __init__(self, filename, base_dir, verbose=False, traceback=False,
+                 cache_file=None, **kwargs):
         self.protocol = None
         self.traceback = traceback
         self.verbose = verbose
         self.symtab = SymbolTable(self)
         self.base_dir = base_dir
 
+        # Parsed files are cached unless the parser is debugged
+        self.cache = None
+        if cache_file is not None and not kwargs:
+            self.cache = ParseCache.open(cache_file)
+        # Included files of the files being parsed, with their digests
+        self.included = []
+
         try:
             self.decl_list = self.parse_file(filename, **kwargs)
         except ParseError, e:
@@ -54,12 +79,47 @@ class SLICC(Grammar):
                 sys.exit(str(e))
             raise
 
+        if self.cache is not None:
+            self.cache.save()
+
+    def parse_file(self, filename, **kwargs):
+        if self.cache is None:
+            return super(SLICC, self).parse_file(filename, **kwargs)
+
+        with open(filename, 'r') as f:
+            data = f.read()
+
+        entry = self.cache.lookup(self, filename, data)
+        if entry is None:
+            protocol = self.protocol
+            self.included.append([])
+            decls = self.parse_string(data, filename, **kwargs)
+            deps = self.included.pop()
+            if self.protocol == protocol:
+                protocol = None
+            else:
+                protocol = self.protocol
+            entry = CacheEntry(decls, deps, protocol)
+            self.cache.add(self, filename, data, entry)
+        elif entry.protocol is not None:
+            if self.protocol:
+                raise ParseError("Protocol can only be set once! Error in "
+                                 "%s\n" % filename)
+            self.protocol = entry.protocol
+
+        if self.included:
+            self.included[-1].append((os.path.abspath(filename),
+                                      digest(data)))
+            self.included[-1].extend(entry.deps)
+
+        return entry.ast
+
     def currentLocation(self):
         return util.Location(self.current_source, self.current_line,
                              no_warning=not self.verbose)
 
     def codeFormatter(self, *args, **kwargs):
-        code = code_formatter(*args, **kwargs)
+        code = slicc_code_formatter(*args, **kwargs)
         code['protocol'] = self.protocol
         return code
 
@@ -82,7 +82,8 @@ class CodeImporter(object):
             del sys.modules[fullname]
             raise
 
-        return mod
+        # Modules like m5.objects may replace themselves in sys.modules
+        return sys.modules[fullname]
 
 # Create an importer and add it to the meta_path so future imports can
 # use it.  There's currently nothing in the importer, but calls to
@@ -69,6 +69,10 @@ from m5.params import ParamDesc, VectorParamDesc, \
 from m5.proxy import *
 from m5.proxy import isproxy
 
+# Names of the parameters of each SimObject class with a given type, see
+# SimObject._find_params_of_type()
+_params_of_type = {}
+
 #####################################################################
 #
 # M5 Python Configuration Utility
@@ -554,6 +558,7 @@ class MetaSimObject(type):
         assert(not hasattr(pdesc, 'name'))
         pdesc.name = name
         cls._params[name] = pdesc
+        _params_of_type.clear()
         if hasattr(pdesc, 'default'):
             cls._set_param(name, pdesc.default, pdesc)
 
@@ -1118,6 +1123,7 @@ class SimObject(object):
         # Do children before parameter values so that children that
         # are also param values get cloned properly.
         self._children = {}
+        self._children_of_type = {}
         for key,val in ancestor._children.iteritems():
             self.add_child(key, val(_memo=memo_dict))
 
@@ -1287,6 +1293,7 @@ class SimObject(object):
         child = self._children[name]
         child.clear_parent(self)
         del self._children[name]
+        self._children_of_type = {}
 
     # Add a new child to this object.
     def add_child(self, name, child):
@@ -1303,6 +1310,7 @@ class SimObject(object):
         child.set_parent(self, name)
         if not isNullPointer(child):
             self._children[name] = child
+            self._children_of_type = {}
 
     # Take SimObject-valued parameters that haven't been explicitly
     # assigned as children and make them children of the object that
@@ -1340,31 +1348,51 @@ class SimObject(object):
     def ini_str(self):
         return self.path()
 
+    # Proxies like Parent.any are resolved at the same ancestors for
+    # many objects, so the children and parameters of each type are
+    # only searched once.  The children are cached per object until
+    # they change, the parameters per class.
+    def _find_children_of_type(self, ptype):
+        children = self._children_of_type.get(ptype)
+        if children is None:
+            children = [ child for child in self._children.itervalues()
+                         if isinstance(child, ptype) ]
+            self._children_of_type[ptype] = children
+        return children
+
+    def _find_params_of_type(self, ptype):
+        key = (self.__class__, ptype)
+        pnames = _params_of_type.get(key)
+        if pnames is None:
+            pnames = [ pname for pname,pdesc in self._params.iteritems()
+                       if issubclass(pdesc.ptype, ptype) ]
+            _params_of_type[key] = pnames
+        return pnames
+
     def find_any(self, ptype):
         if isinstance(self, ptype):
             return self, True
 
         found_obj = None
-        for child in self._children.itervalues():
+        for child in self._find_children_of_type(ptype):
             visited = False
             if hasattr(child, '_visited'):
               visited = getattr(child, '_visited')
 
-            if isinstance(child, ptype) and not visited:
+            if not visited:
                 if found_obj != None and child != found_obj:
                     raise AttributeError, \
                           'parent.any matched more than one: %s %s' % \
                           (found_obj.path, child.path)
                 found_obj = child
         # search param space
-        for pname,pdesc in self._params.iteritems():
-            if issubclass(pdesc.ptype, ptype):
-                match_obj = self._values[pname]
-                if found_obj != None and found_obj != match_obj:
-                    raise AttributeError, \
-                          'parent.any matched more than one: %s and %s' % \
-                          (found_obj.path, match_obj.path)
-                found_obj = match_obj
+        for pname in self._find_params_of_type(ptype):
+            match_obj = self._values[pname]
+            if found_obj != None and found_obj != match_obj:
+                raise AttributeError, \
+                      'parent.any matched more than one: %s and %s' % \
+                      (found_obj.path, match_obj.path)
+            found_obj = match_obj
         return found_obj, found_obj != None
 
     def find_all(self, ptype):
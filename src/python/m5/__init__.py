@@ -42,6 +42,11 @@ except ImportError:
     in_gem5 = False
 
 if in_gem5:
+    import sys
+    import startup
+    if startup.requested(sys.argv):
+        startup.enable()
+
     import SimObject
     import core
     import objects
@@ -40,6 +40,7 @@
 
 from __future__ import print_function
 
+import atexit
 import code
 import datetime
 import os
@@ -137,6 +138,9 @@ def parse_options():
         help="Ignore EXPR sim objects")
     option("--remote-gdb-port", type='int', default=7000,
         help="Remote gdb base port (set to 0 to disable listening)")
+    option("--profile-startup", metavar="FILE", default=None,
+        help="Write the time spent importing modules, running the script " \
+             "and instantiating the SimObjects to FILE in JSON format")
 
     # Help options
     group("Help Options")
@@ -199,6 +203,8 @@ def main(*args):
     import defines
     import event
     import info
+    import objects
+    import startup
     import stats
     import trace
 
@@ -284,6 +290,7 @@ def main(*args):
 
     if options.list_sim_objects:
         import SimObject
+        objects.load_all_modules()
         done = True
         print("SimObjects:")
         objects = SimObject.allClasses.keys()
@@ -412,6 +419,13 @@ def main(*args):
     scope = { '__file__' : filename,
               '__name__' : '__m5_main__' }
 
+    # The profile is written at exit, since scripts often end the
+    # simulation with sys.exit()
+    if options.profile_startup:
+        atexit.register(startup.dump,
+                        os.path.join(options.outdir, options.profile_startup))
+    startup.mark('script')
+
     # if pdb was requested, execfile the thing under pdb, otherwise,
     # just do the execfile normally
     if options.pdb:
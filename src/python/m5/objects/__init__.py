@@ -26,6 +26,9 @@
 #
 # Authors: Nathan Binkert
 
+import sys as _sys
+from types import ModuleType as _ModuleType
+
 from m5.internal import params
 from m5.SimObject import *
 
@@ -34,6 +37,72 @@ try:
 except NameError:
     modules = { }
 
-for module in modules.iterkeys():
-    if module.startswith('m5.objects.'):
-        exec "from %s import *" % module
+class _LazyObjects(_ModuleType):
+    """The m5.objects package, which only imports the modules defining the
+    SimObjects when they are used.  Looking up a name imports the module
+    of the same name first and then the others, until one defines it.
+    Like before, the public names of every imported module are added to
+    the package.  'from m5.objects import *' and dir() import all
+    modules."""
+
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            if name == '__all__':
+                self.load_all_modules()
+                return [ n for n in self.__dict__ if not n.startswith('_') ]
+            raise AttributeError(name)
+
+        if name in self._unloaded:
+            self.load_module(name)
+        while name not in self.__dict__ and self._unloaded:
+            self.load_module(self._unloaded[0])
+
+        try:
+            return self.__dict__[name]
+        except KeyError:
+            raise AttributeError("'module' object has no attribute '%s'" %
+                                 name)
+
+    def __dir__(self):
+        self.load_all_modules()
+        return sorted(self.__dict__)
+
+    def __getattribute__(self, name):
+        value = _ModuleType.__getattribute__(self, name)
+        # Modules imported by other modules are set in the package before
+        # their names are added
+        if isinstance(value, _ModuleType) and \
+                value.__name__ == '%s.%s' % (self.__name__, name):
+            self.load_module(name)
+            value = self.__dict__[name]
+        return value
+
+    def _add_module(self, modname, module):
+        if modname in self._unloaded:
+            self._unloaded.remove(modname)
+
+        names = getattr(module, '__all__', None)
+        if names is None:
+            names = [ n for n in module.__dict__ if not n.startswith('_') ]
+        for n in names:
+            self.__dict__[n] = getattr(module, n)
+
+    def load_module(self, modname):
+        if modname in self._unloaded:
+            fullname = '%s.%s' % (self.__name__, modname)
+            __import__(fullname)
+            self._add_module(modname, _sys.modules[fullname])
+
+    def load_all_modules(self):
+        while self._unloaded:
+            self.load_module(self._unloaded[0])
+
+_objects = _LazyObjects(__name__, __doc__)
+_objects.__dict__.update(globals())
+# Python clears the globals of a module when it's freed, but the methods
+# above still need them
+_objects.__dict__['_package'] = _sys.modules[__name__]
+_objects.__dict__['_unloaded'] = sorted(
+    module[len(__name__) + 1:] for module in modules
+    if module.startswith(__name__ + '.'))
+_sys.modules[__name__] = _objects
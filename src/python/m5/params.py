@@ -175,7 +175,12 @@ class ParamDesc(object):
 
     def __getattr__(self, attr):
         if attr == 'ptype':
-            ptype = SimObject.allClasses[self.ptype_str]
+            ptype = SimObject.allClasses.get(self.ptype_str)
+            if ptype is None:
+                # m5.objects imports the module defining the class on
+                # demand
+                from m5 import objects
+                ptype = getattr(objects, self.ptype_str)
             assert isSimObjectClass(ptype)
             self.ptype = ptype
             return ptype
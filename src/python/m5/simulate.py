@@ -45,6 +45,7 @@ from __future__ import print_function
 import atexit
 import os
 import sys
+import time
 
 # import the wrapped C++ functions
 import _m5.drain
@@ -53,11 +54,12 @@ from _m5.stats import updateEvents as updateStatEvents
 
 import stats
 import SimObject
+import startup
 import ticks
 import objects
 from m5.util.dot_writer import do_dot, do_dvfs_dot
 
-from util import fatal
+from util import fatal, inform
 from util import attrdict
 
 # define a MaxTick parameter, unsigned 64 bit
@@ -71,6 +73,21 @@ _memory_modes = {
 
 _drain_manager = _m5.drain.DrainManager.instance()
 
+# Wall clock time of the phases of the last instantiate() as a list of
+# (phase, seconds) pairs
+instantiate_times = []
+
+class _PhaseTimer(object):
+    """Append the time since the previous phase to a list of times"""
+    def __init__(self, times):
+        self.times = times
+        self.last = time.time()
+
+    def __call__(self, phase):
+        now = time.time()
+        self.times.append((phase, now - self.last))
+        self.last = now
+
 # The final hook to generate .ini files.  Called from the user script
 # once the config is built.
 def instantiate(ckpt_dir=None):
@@ -81,20 +98,30 @@ def instantiate(ckpt_dir=None):
     if not root:
         fatal("Need to instantiate Root() before calling instantiate()")
 
+    startup.mark('instantiate')
+    del instantiate_times[:]
+    phase_done = _PhaseTimer(instantiate_times)
+
     # we need to fix the global frequency
     ticks.fixGlobalFrequency()
 
     # Make sure SimObject-valued params are in the configuration
     # hierarchy so we catch them with future descendants() walks
     for obj in root.descendants(): obj.adoptOrphanParams()
+    phase_done('adoptOrphanParams')
+
+    # The hierarchy doesn't change anymore, so walk it only once
+    descendants = list(root.descendants())
+    phase_done('descendants')
 
     # Unproxy in sorted order for determinism
-    for obj in root.descendants(): obj.unproxyParams()
+    for obj in descendants: obj.unproxyParams()
+    phase_done('unproxyParams')
 
     if options.dump_config:
         ini_file = file(os.path.join(options.outdir, options.dump_config), 'w')
         # Print ini sections in sorted order for easier diffing
-        for obj in sorted(root.descendants(), key=lambda o: o.path()):
+        for obj in sorted(descendants, key=lambda o: o.path()):
             obj.print_ini(ini_file)
         ini_file.close()
 
@@ -109,25 +136,32 @@ def instantiate(ckpt_dir=None):
             pass
 
     do_dot(root, options.outdir, options.dot_config)
+    phase_done('dumpConfig')
 
     # Initialize the global statistics
     stats.initSimStats()
 
     # Create the C++ sim objects and connect ports
-    for obj in root.descendants(): obj.createCCObject()
-    for obj in root.descendants(): obj.connectPorts()
+    for obj in descendants: obj.createCCObject()
+    phase_done('createCCObject')
+    for obj in descendants: obj.connectPorts()
+    phase_done('connectPorts')
 
     # Do a second pass to finish initializing the sim objects
-    for obj in root.descendants(): obj.init()
+    for obj in descendants: obj.init()
+    phase_done('init')
 
     # Do a third pass to initialize statistics
-    for obj in root.descendants(): obj.regStats()
+    for obj in descendants: obj.regStats()
+    phase_done('regStats')
 
     # Do a fourth pass to initialize probe points
-    for obj in root.descendants(): obj.regProbePoints()
+    for obj in descendants: obj.regProbePoints()
+    phase_done('regProbePoints')
 
     # Do a fifth pass to connect probe listeners
-    for obj in root.descendants(): obj.regProbeListeners()
+    for obj in descendants: obj.regProbeListeners()
+    phase_done('regProbeListeners')
 
     # We want to generate the DVFS diagram for the system. This can only be
     # done once all of the CPP objects have been created and initialised so
@@ -143,19 +177,28 @@ def instantiate(ckpt_dir=None):
         _drain_manager.preCheckpointRestore()
         ckpt = _m5.core.getCheckpoint(ckpt_dir)
         _m5.core.unserializeGlobals(ckpt);
-        for obj in root.descendants(): obj.loadState(ckpt)
+        for obj in descendants: obj.loadState(ckpt)
+        phase_done('loadState')
     else:
-        for obj in root.descendants(): obj.initState()
+        for obj in descendants: obj.initState()
+        phase_done('initState')
 
     # Check to see if any of the stat events are in the past after resuming from
     # a checkpoint, If so, this call will shift them to be at a valid time.
     updateStatEvents()
 
+    if options.verbose > 0:
+        total = sum(seconds for phase, seconds in instantiate_times)
+        inform("Instantiated %d objects in %.3f s", len(descendants), total)
+        for phase, seconds in instantiate_times:
+            inform("  %-20s %.3f s", phase, seconds)
+
 need_startup = True
 def simulate(*args, **kwargs):
     global need_startup
 
     if need_startup:
+        startup.mark('simulate')
         root = objects.Root.getInstance()
         for obj in root.descendants(): obj.startup()
         need_startup = False
@@ -0,0 +1,128 @@
+#
+# Copyright 2019 Alexander Fasching
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+# Profile of the startup of gem5, written with --profile-startup.  The
+# import hook has to be installed before m5 imports its own modules, so
+# m5/__init__.py enables it if the option is on the command line, before
+# the options are parsed.
+
+import __builtin__
+import sys
+import time
+
+start_time = time.time()
+
+# Imports which loaded new modules, as (name, modules, start, total,
+# self_time) tuples.  start is relative to start_time, total includes the
+# time of nested imports and self_time doesn't.
+import_times = []
+
+# Times of events like the start of the config script, relative to
+# start_time
+event_times = []
+
+_builtin_import = __builtin__.__import__
+_known_modules = set()
+# Nested time and loaded modules of the imports in progress
+_import_stack = []
+
+def _claim_modules(modules):
+    """Add the modules loaded since the last call to a list"""
+    if len(sys.modules) != len(_known_modules):
+        new_modules = set(sys.modules) - _known_modules
+        _known_modules.update(new_modules)
+        # Skip the None entries of failed implicit relative imports
+        modules.extend(name for name in new_modules
+                       if sys.modules.get(name) is not None)
+
+def _timed_import(name, *args, **kwargs):
+    # A module is in sys.modules while its code runs, so modules which
+    # appeared since the last import belong to the enclosing import
+    if _import_stack:
+        _claim_modules(_import_stack[-1][1])
+    else:
+        _claim_modules([])
+
+    start = time.time()
+    _import_stack.append([0.0, []])
+    try:
+        return _builtin_import(name, *args, **kwargs)
+    finally:
+        total = time.time() - start
+        _claim_modules(_import_stack[-1][1])
+        nested, modules = _import_stack.pop()
+        if _import_stack:
+            _import_stack[-1][0] += total
+
+        if modules:
+            import_times.append((name, sorted(modules), start - start_time,
+                                 total, total - nested))
+
+def requested(argv):
+    for arg in argv:
+        if arg == '--profile-startup' or \
+                arg.startswith('--profile-startup='):
+            return True
+    return False
+
+def enable():
+    _known_modules.clear()
+    _known_modules.update(sys.modules)
+    __builtin__.__import__ = _timed_import
+
+def disable():
+    __builtin__.__import__ = _builtin_import
+
+def enabled():
+    return __builtin__.__import__ is _timed_import
+
+def mark(event):
+    """Record the time of an event, if the profile is enabled"""
+    if enabled():
+        event_times.append((event, time.time() - start_time))
+
+def dump(filename):
+    """Write the profile to filename in JSON format.  The time of the config
+    script is taken until now, so this is called at exit."""
+    disable()
+
+    import json
+    from m5.simulate import instantiate_times
+
+    script_time = None
+    for event, t in event_times:
+        if event == 'script':
+            script_time = time.time() - start_time - t
+
+    profile = {
+        'imports' : [ { 'name' : name,
+                        'modules' : modules,
+                        'start' : start,
+                        'total' : total,
+                        'self' : self_time }
+                      for name, modules, start, total, self_time
+                      in import_times ],
+        'import_total' : sum(entry[4] for entry in import_times),
+        'events' : [ { 'event' : event, 'time' : t }
+                     for event, t in event_times ],
+        'script' : script_time,
+        'instantiate' : [ { 'phase' : phase, 'time' : t }
+                          for phase, t in instantiate_times ],
+    }
+
+    with open(filename, 'w') as f:
+        json.dump(profile, f, indent=4)
@@ -115,11 +115,27 @@ def _textFactory(fn, desc=True):
 
     return _m5.stats.initText(fn, desc)
 
+@_url_factory
+def _binaryFactory(fn):
+    """Output stats in binary format.
+
+    Binary stat files start with a table of the column names, followed
+    by one row of little endian doubles per dump. They are much
+    smaller than text files for runs with many dumps and can be loaded
+    without parsing every value.
+
+    Example: binary://stats.bin
+
+    """
+
+    return _m5.stats.initBinary(fn)
+
 factories = {
     # Default to the text factory if we're given a naked path
     "" : _textFactory,
     "file" : _textFactory,
     "text" : _textFactory,
+    "binary" : _binaryFactory,
 }
 
 def addStatVisitor(url):
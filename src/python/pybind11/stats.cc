@@ -45,6 +45,7 @@
 #include "pybind11/stl.h"
 
 #include "base/statistics.hh"
+#include "base/stats/binary.hh"
 #include "base/stats/text.hh"
 #include "sim/stat_control.hh"
 #include "sim/stat_register.hh"
@@ -77,6 +78,8 @@ pybind_init_stats(py::module &m_native)
     m
         .def("initSimStats", &Stats::initSimStats)
         .def("initText", &Stats::initText, py::return_value_policy::reference)
+        .def("initBinary", &Stats::initBinary,
+             py::return_value_policy::reference)
         .def("registerPythonStatsHandlers",
              &Stats::registerPythonStatsHandlers)
         .def("schedStatEvent", &Stats::schedStatEvent)
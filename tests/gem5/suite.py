@@ -45,7 +45,9 @@ def gem5_verify_config(name,
                        fixtures=[],
                        valid_isas=constants.supported_isas,
                        valid_variants=constants.supported_variants,
-                       length=constants.supported_lengths[0]):
+                       length=constants.supported_lengths[0],
+                       cores=1,
+                       memory=0):
     '''
     Helper class to generate common gem5 tests using verifiers.
 
@@ -70,6 +72,12 @@ def gem5_verify_config(name,
 
     :param valid_variants: An iterable with the variant levels that
         this test can be ran for. (E.g. opt, debug)
+
+    :param cores: Number of cores the gem5 run keeps busy, used to schedule
+        the suites when running tests in parallel.
+
+    :param memory: Memory in MiB the gem5 run needs at most. (0 if it's not
+        worth considering.)
     '''
     fixtures = list(fixtures)
     testsuites = []
@@ -117,7 +125,9 @@ def gem5_verify_config(name,
                 name=_name,
                 fixtures=_fixtures,
                 tags=tags,
-                tests=tests))
+                tests=tests,
+                cores=cores,
+                memory=memory))
     return testsuites
 
 def _create_test_run_gem5(config, config_args, gem5_args):
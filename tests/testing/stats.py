@@ -0,0 +1,392 @@
+#!/usr/bin/env python2
+#
+# Copyright 2019 Alexander Fasching
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""Parser and comparator for gem5 text stat files.
+
+This is an in-process replacement for the Perl tests/diff-out script,
+following its rules: a stat fails if its value changed by more than its
+tolerance, or if it's missing from the new file. New stats are reported
+but don't fail the comparison. Parsed files are cached, so comparing the
+outputs of many tests against the same reference only reads it once.
+"""
+
+from __future__ import print_function
+
+from collections import OrderedDict
+import math
+import os
+import re
+
+__all__ = [
+    "StatDiff",
+    "parse_stats",
+    "diff_stats",
+    "diff_stat_files",
+]
+
+# Statistics which relate to simulator performance, not correctness
+ignored_stats = frozenset([
+    "host_seconds",
+    "host_tick_rate",
+    "host_inst_rate",
+    "host_op_rate",
+    "host_mem_usage",
+])
+
+# Key statistics, which are always displayed. Names match anywhere in the
+# stat name, so per-thread variants are included.
+key_stats = (
+    "ipc",
+    "committedInsts",
+    "committedOps",
+    "sim_insts",
+    "sim_ops",
+    "sim_ticks",
+    "host_inst_rate",
+    "host_mem_usage",
+)
+
+_key_stat_re = re.compile("|".join(key_stats))
+
+# The string printed for a division by zero
+_divbyzero = "<err: divide by zero>"
+
+_number_re = re.compile(r"\s*([-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)")
+_special_re = re.compile(r"\s*([-+]?)(inf|nan)", re.IGNORECASE)
+_float_fmt_re = re.compile(r"%(\+?)(\d*)(?:\.\d+)?f\Z")
+_dist_value_re = re.compile(r"^(\S+(?:.*\S)?)\s+(\d+)\s+\d+\.\d+%")
+_memory_re = re.compile(r"^Memory usage: (\d+) KBytes")
+
+# Parsed files by path, with the modification time and size they had
+_cache = {}
+
+def _parse_lines(lines, ignore_dists=False):
+    stats = OrderedDict()
+    in_dist = None
+
+    for line in lines:
+        if not line.strip():
+            continue
+        if "End Simulation Statistics" in line:
+            break
+
+        comment = line.find("#")
+        if comment >= 0:
+            line = line[:comment].rstrip(" ")
+        line = line.rstrip("\n")
+
+        memory = _memory_re.match(line)
+        if memory:
+            stat, value = "memory usage", memory.group(1)
+        elif in_dist is not None:
+            if line.find(".end_dist") >= 0:
+                in_dist = None
+                continue
+            if ignore_dists:
+                continue
+            if ".min_value" in line or ".max_value" in line:
+                stat, value = _split_stat(line)
+            else:
+                match = _dist_value_re.match(line)
+                if match is None:
+                    continue
+                stat = in_dist + "::" + match.group(1)
+                value = match.group(2)
+        else:
+            start = line.find(".start_dist")
+            if start >= 0:
+                in_dist = stat = line[:start]
+                value = "0"
+            else:
+                stat, value = _split_stat(line)
+
+        if stat is not None:
+            stats[stat] = value
+
+    return stats
+
+def _split_stat(line):
+    fields = line.split(None, 1)
+    if not fields or line[0].isspace():
+        return None, None
+    if len(fields) == 1:
+        # Lines without a value don't match in diff-out either
+        return None, None
+    return fields[0], fields[1].rstrip()
+
+def parse_stats(fname, ignore_dists=False):
+    """Parse the first dump of a gem5 text stat file.
+
+    Values are kept as strings, so unchanged stats compare exactly like
+    diff-out does. Parsed files are cached until they are modified.
+
+    Arguments:
+      fname -- Path to the stat file.
+      ignore_dists -- Skip the buckets of distributions.
+
+    Returns an ordered dictionary mapping stat names to values.
+    """
+
+    st = os.stat(fname)
+    key = (os.path.abspath(fname), ignore_dists)
+    cached = _cache.get(key)
+    if cached is not None and cached[0] == (st.st_mtime, st.st_size):
+        return cached[1]
+
+    with open(fname, "r") as f:
+        stats = _parse_lines(f, ignore_dists=ignore_dists)
+    _cache[key] = ((st.st_mtime, st.st_size), stats)
+    return stats
+
+def _number(value):
+    """Convert the leading number of a value like Perl does, including
+    infinities and NaNs.  Values which don't start with a number are 0."""
+
+    match = _number_re.match(value)
+    if match is not None:
+        return float(match.group(1))
+    match = _special_re.match(value)
+    if match is not None:
+        return float(match.group(1) + match.group(2))
+    return 0.0
+
+def _format_float(fmt, value):
+    """Format a float with a %f format like Perl, which prints infinities
+    as Inf and NaNs as NaN without a sign."""
+
+    if not (math.isinf(value) or math.isnan(value)):
+        return fmt % value
+
+    sign, width = _float_fmt_re.match(fmt).groups()
+    if math.isnan(value):
+        text = "NaN"
+    elif value < 0:
+        text = "-Inf"
+    else:
+        text = sign + "Inf"
+    return text.rjust(int(width or 0))
+
+def _pct_diff(old, new):
+    if old == 0:
+        return 0.0 if new == 0 else 9999.0
+    return 100.0 * (new - old) / old
+
+def _digits(value):
+    point = value.rfind(".")
+    return 0 if point < 0 else len(value) - point - 1
+
+def _value_line(stat, old_value, new_value, fmt, pct):
+    return "  %-30s %s %s %s  %s%%" % (
+        stat, _format_float(fmt, old_value), _format_float(fmt, new_value),
+        _format_float(fmt, new_value - old_value),
+        _format_float("%+7.2f", pct))
+
+def _compile_tolerances(tolerances):
+    if not tolerances:
+        return ()
+    if hasattr(tolerances, "items"):
+        tolerances = tolerances.items()
+    return tuple((re.compile(r"(?:%s)\Z" % pattern), float(pct))
+                 for pattern, pct in tolerances)
+
+class StatDiff(object):
+    """Result of comparing two sets of stats.
+
+    Attributes:
+      errors -- (stat, ref, new, pct_change) tuples of the stats which
+                changed by more than the display threshold, sorted by
+                the magnitude of the change.
+      unquantified -- (stat, ref, new) tuples of changed stats which
+                      are divisions by zero in one of the files.
+      key_stats -- (stat, ref, new) tuples of the key statistics.
+      missing -- (stat, ref) tuples of stats missing in the new file.
+      added -- (stat, new) tuples of stats only in the new file.
+      max_error -- Largest change in percent of a stat which isn't
+                   ignored and not within its tolerance.
+    """
+
+    STATUS_OK = 0
+    STATUS_NEW_STATS = 1
+    STATUS_FAILED = 2
+
+    def __init__(self, threshold=0):
+        self.threshold = threshold
+        self.errors = []
+        self.unquantified = []
+        self.key_stats = []
+        self.missing = []
+        self.added = []
+        self.max_error = 0.0
+
+    @property
+    def status(self):
+        """Exit status of diff-out for this comparison."""
+
+        if self.missing or self.max_error != 0.0:
+            return StatDiff.STATUS_FAILED
+        elif self.added:
+            return StatDiff.STATUS_NEW_STATS
+        else:
+            return StatDiff.STATUS_OK
+
+    def format(self, max_errors=20):
+        """Format the comparison like diff-out.
+
+        Arguments:
+          max_errors -- Number of errors to print, 0 for all.
+        """
+
+        lines = []
+        for stat, ref, new in self.unquantified:
+            lines.append("%s: %s --> %s" % (stat, ref, new))
+
+        lines.append("Maximum error magnitude: %s%%" %
+                     _format_float("%+f", self.max_error))
+        lines.append("")
+        lines.append("  %-30s %10s %10s %10s   %7s" % (
+            " ", "Reference", "New Value", "Abs Diff", "Pct Chg"))
+        lines.append("Key statistics:")
+        lines.append("")
+        for stat, ref, new in self.key_stats:
+            old_value, new_value = _number(ref), _number(new)
+            fmt = "%%10.%df" % _digits(ref)
+            lines.append(_value_line(stat, old_value, new_value, fmt,
+                                     _pct_diff(old_value, new_value)))
+
+        lines.append("")
+        lines.append("Differences > %d%%:" % self.threshold)
+        lines.append("")
+        for count, (stat, ref, new, pct) in enumerate(self.errors, 1):
+            fmt = "%%10.%df" % max(_digits(ref), _digits(new))
+            lines.append(_value_line(stat, _number(ref), _number(new), fmt,
+                                     pct))
+            if max_errors > 0 and count >= max_errors:
+                lines.append("[... showing top %i errors only, additional "
+                             "errors omitted ...]" % max_errors)
+                break
+
+        if self.missing:
+            lines.append("")
+            lines.append("Missing %i reference statistics:" %
+                         len(self.missing))
+            lines.append("")
+            for stat, ref in self.missing:
+                lines.append("  %-50s    %s" % (stat, ref))
+
+        if self.added:
+            lines.append("")
+            lines.append("Found %i new statistics:" % len(self.added))
+            lines.append("")
+            for stat, new in self.added:
+                lines.append("  %-50s    %s" % (stat, new))
+
+        return "\n".join(lines) + "\n"
+
+def diff_stats(ref, new, tolerances=None, threshold=0):
+    """Compare two dictionaries of stats returned by parse_stats.
+
+    Arguments:
+      ref -- Reference stats.
+      new -- Stats of the new run.
+      tolerances -- Dictionary or sequence of pairs mapping regular
+                    expressions, which have to match the full stat name,
+                    to the change in percent allowed for these stats. The
+                    first matching expression applies, all other stats
+                    have to match exactly.
+      threshold -- Don't report changes up to this percentage. They still
+                   fail the comparison unless a tolerance allows them.
+
+    Returns a StatDiff.
+    """
+
+    tolerances = _compile_tolerances(tolerances)
+    diff = StatDiff(threshold=threshold)
+
+    for stat in sorted(ref):
+        ref_value = ref[stat]
+        new_value = new.get(stat)
+        if new_value is None:
+            diff.missing.append((stat, ref_value))
+            continue
+
+        if _key_stat_re.search(stat):
+            diff.key_stats.append((stat, ref_value, new_value))
+
+        if stat in ignored_stats or ref_value == new_value:
+            continue
+
+        if _divbyzero in (ref_value, new_value):
+            # No point in trying to quantify the error
+            diff.unquantified.append((stat, ref_value, new_value))
+            continue
+
+        pct = _pct_diff(_number(ref_value), _number(new_value))
+        if abs(pct) > threshold:
+            diff.errors.append((stat, ref_value, new_value, pct))
+
+        tolerance = 0.0
+        for pattern, pct_allowed in tolerances:
+            if pattern.match(stat):
+                tolerance = pct_allowed
+                break
+        if abs(pct) > tolerance:
+            diff.max_error = max(diff.max_error, abs(pct))
+
+    diff.added = [ (stat, new[stat]) for stat in sorted(new)
+                   if stat not in ref ]
+    diff.errors.sort(key=lambda e: abs(e[3]), reverse=True)
+
+    return diff
+
+def diff_stat_files(ref_file, new_file, ignore_dists=False, **kwargs):
+    """Compare two stat files, see diff_stats for the arguments."""
+
+    return diff_stats(parse_stats(ref_file, ignore_dists=ignore_dists),
+                      parse_stats(new_file, ignore_dists=ignore_dists),
+                      **kwargs)
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Compare the stats of gem5 runs against a reference.")
+    parser.add_argument("-d", action="store_true", dest="ignore_dists",
+                        help="Ignore distributions")
+    parser.add_argument("-n", type=int, default=20, dest="max_errors",
+                        help="Print top N errors (default 20, 0 for all)")
+    parser.add_argument("-t", type=float, default=0, dest="threshold",
+                        help="Ignore errors below this percentage")
+    parser.add_argument("ref", help="Reference stat file")
+    parser.add_argument("new", nargs="+", help="Stat files to compare")
+    args = parser.parse_args()
+
+    status = StatDiff.STATUS_OK
+    for new in args.new:
+        if len(args.new) > 1:
+            print("===== %s =====" % new)
+        diff = diff_stat_files(args.ref, new,
+                               ignore_dists=args.ignore_dists,
+                               threshold=args.threshold)
+        print(diff.format(max_errors=args.max_errors), end="")
+        status = max(status, diff.status)
+
+    return status
+
+if __name__ == "__main__":
+    import sys
+    sys.exit(main())
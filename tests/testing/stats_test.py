@@ -0,0 +1,133 @@
+#!/usr/bin/env python2
+#
+# Copyright 2019 Alexander Fasching
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+# Compare pairs of stat files with tests/diff-out and with stats.py, and
+# check that both give the same exit status and maximum error.
+
+from __future__ import print_function
+
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+
+from stats import StatDiff, diff_stat_files
+
+diff_out = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        os.pardir, "diff-out")
+
+reference = """
+---------- Begin Simulation Statistics ----------
+sim_ticks                                  1000000   # Simulated ticks
+host_seconds                                  0.50   # Host time
+system.cpu.ipc                            2.500000   # IPC
+system.cpu.cpi                            0.400000   # CPI
+system.cpu.misses                              100   # Misses
+system.cpu.rate                      <err: divide by zero>   # Rate
+system.cpu.lat::samples                         10   # Latency
+system.cpu.lat::0-3                              7     70.00%     70.00%
+system.cpu.lat::4-7                              3     30.00%    100.00%
+system.cpu.lat::total                           10   # Latency
+
+---------- End Simulation Statistics   ----------
+"""
+
+# (description, replacements, diff-out options)
+cases = [
+    ("unchanged", {}, []),
+    ("number to inf", {"system.cpu.ipc": "inf"}, []),
+    ("number to -inf", {"system.cpu.ipc": "-inf"}, []),
+    ("number to nan", {"system.cpu.ipc": "nan"}, []),
+    ("number to text", {"system.cpu.cpi": "bogus"}, []),
+    ("divide by zero", {"system.cpu.ipc": "<err: divide by zero>"}, []),
+    ("from divide by zero", {"system.cpu.rate": "5"}, []),
+    ("small change", {"system.cpu.misses": "101"}, []),
+    ("below threshold", {"system.cpu.misses": "101"}, ["-t", "5"]),
+    ("ignored stat", {"host_seconds": "0.75"}, []),
+    ("missing stat", {"system.cpu.misses": None}, []),
+    ("new stat", {"system.cpu.hits": "5"}, []),
+    ("bucket change", {"system.cpu.lat::0-3": "6     60.00%     60.00%"},
+     []),
+]
+
+def write_stats(path, replacements):
+    lines = []
+    for line in reference.splitlines(True):
+        fields = line.split(None, 1)
+        if fields and fields[0] in replacements:
+            value = replacements[fields[0]]
+            if value is None:
+                continue
+            line = "%-40s %10s\n" % (fields[0], value)
+        lines.append(line)
+
+    added = [ stat for stat in replacements
+              if stat not in reference and replacements[stat] is not None ]
+    end = lines.index("---------- End Simulation Statistics   ----------\n")
+    lines[end:end] = [ "%-40s %10s\n" % (stat, replacements[stat])
+                       for stat in added ]
+
+    with open(path, "w") as f:
+        f.writelines(lines)
+
+def run_diff_out(ref, new, options):
+    proc = subprocess.Popen(["perl", diff_out] + options + [ref, new],
+                            stdout=subprocess.PIPE)
+    output = proc.communicate()[0]
+    max_error = re.search(r"^Maximum error magnitude: (.*)%$", output,
+                          re.MULTILINE).group(1)
+    return proc.returncode, max_error
+
+def run_stats(ref, new, options, **kwargs):
+    threshold = float(options[1]) if options else 0
+    diff = diff_stat_files(ref, new, threshold=threshold, **kwargs)
+    max_error = re.search(r"^Maximum error magnitude: (.*)%$",
+                          diff.format(), re.MULTILINE).group(1)
+    return diff.status, max_error
+
+tmpdir = tempfile.mkdtemp()
+try:
+    ref = os.path.join(tmpdir, "ref.txt")
+    new = os.path.join(tmpdir, "new.txt")
+    write_stats(ref, {})
+
+    for description, replacements, options in cases:
+        write_stats(new, replacements)
+        expected = run_diff_out(ref, new, options)
+        result = run_stats(ref, new, options)
+        assert result == expected, (description, result, expected)
+        print("%-20s status %d, max error %s%%" % ((description, ) + result))
+
+    # diff-out has no tolerances: they only allow the changes of the
+    # matching stats up to the given percentage
+    tolerances = { r"system\.cpu\.misses" : 2 }
+    cases = [
+        ({"system.cpu.misses": "101"}, StatDiff.STATUS_OK),
+        ({"system.cpu.misses": "110"}, StatDiff.STATUS_FAILED),
+        ({"system.cpu.misses": "inf"}, StatDiff.STATUS_FAILED),
+        ({"system.cpu.misses": None}, StatDiff.STATUS_FAILED),
+        ({"system.cpu.ipc": "2.51"}, StatDiff.STATUS_FAILED),
+    ]
+    for replacements, status in cases:
+        write_stats(new, replacements)
+        result = run_stats(ref, new, [], tolerances=tolerances)[0]
+        assert result == status, (replacements, result, status)
+    print("tolerances ok")
+finally:
+    shutil.rmtree(tmpdir)
@@ -49,6 +49,7 @@ import traceback
 
 from results import UnitResult
 from helpers import *
+from stats import StatDiff, diff_stat_files
 
 _test_base = os.path.join(os.path.dirname(__file__), "..")
 
@@ -262,34 +263,30 @@ class DiffOutFile(TestUnit):
                            % (fname, fname))
 
 class DiffStatFile(TestUnit):
-    """Test unit comparing two gem5 stat files."""
+    """Test unit comparing two gem5 stat files.
 
-    def __init__(self, **kwargs):
+    The files are compared in-process using the rules of the
+    tests/diff-out script. Stats matching a regular expression in
+    tolerances may differ by the given percentage.
+    """
+
+    def __init__(self, tolerances=None, **kwargs):
         super(DiffStatFile, self).__init__("stat_diff", **kwargs)
 
-        self.stat_diff = os.path.join(_test_base, "diff-out")
+        self.tolerances = tolerances
 
     def _run(self):
-        STATUS_OK = 0
-        STATUS_NEW_STATS = 1
-        STATUS_FAILED = 2
-
         stats = "stats.txt"
 
-        cmd = [
-            self.stat_diff,
-            self.ref_file(stats), self.out_file(stats),
-        ]
-        with ProcessHelper(cmd,
-                           stdout=subprocess.PIPE,
-                           stderr=subprocess.PIPE) as p:
-            status, stdout, stderr = p.call()
+        ref = self.ref_file(stats)
+        out = self.out_file(stats)
+        if not os.path.exists(out):
+            return self.error("%s doesn't exist in output directory" % stats)
 
-        if status in (STATUS_OK, STATUS_NEW_STATS):
-            return self.ok(stdout=stdout, stderr=stderr)
-        elif status == STATUS_FAILED:
-            return self.failure("Statistics mismatch",
-                                stdout=stdout, stderr=stderr)
+        diff = diff_stat_files(ref, out, tolerances=self.tolerances)
+        stdout = diff.format()
+
+        if diff.status in (StatDiff.STATUS_OK, StatDiff.STATUS_NEW_STATS):
+            return self.ok(stdout=stdout)
         else:
-            return self.error("diff-out returned an error: %i" % status,
-                              stdout=stdout, stderr=stderr)
+            return self.failure("Statistics mismatch", stdout=stdout)
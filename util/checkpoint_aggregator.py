@@ -31,9 +31,17 @@
 
 from ConfigParser import ConfigParser
 import gzip
+import multiprocessing
+import shutil
 
 import sys, re, os
 
+PAGE_SIZE = 1 << 12
+ZERO_PAGE = "\0" * PAGE_SIZE
+
+# Number of pages copied at once
+BLOCK_PAGES = 1 << 10
+
 class myCP(ConfigParser):
     def __init__(self):
         ConfigParser.__init__(self)
@@ -41,20 +49,63 @@ class myCP(ConfigParser):
     def optionxform(self, optionstr):
         return optionstr
 
-def aggregate(output_dir, cpts, no_compress, memory_size):
+def _copyPages(src, dst, pages, compress):
+    """
+    Copy the first pages of the compressed memory image src. With
+    compress, dst is a new gzip file, otherwise dst is (file name,
+    first page) of an existing file, whose zero pages are not written.
+    Return the number of zero pages.
+    """
+    gf = gzip.open(src, "rb")
+    if compress:
+        out = gzip.open(dst, "wb")
+    else:
+        dst, start = dst
+        out = open(dst, "r+b")
+        out.seek(start * PAGE_SIZE)
+
+    zero_pages = 0
+    x = 0
+    while x < pages:
+        count = min(BLOCK_PAGES, pages - x)
+        block = gf.read(count * PAGE_SIZE)
+        if compress:
+            out.write(block)
+        else:
+            # Seek over the zero pages, so the file stays sparse
+            for offset in xrange(0, len(block), PAGE_SIZE):
+                page = block[offset:offset + PAGE_SIZE]
+                if page == ZERO_PAGE:
+                    out.seek(PAGE_SIZE, 1)
+                    zero_pages += 1
+                else:
+                    out.write(page)
+        x += count
+
+    out.close()
+    gf.close()
+    return zero_pages
+
+def _copyPagesStar(args):
+    return _copyPages(*args)
+
+def aggregate(output_dir, cpts, no_compress, memory_size, jobs=1):
+    """
+    Combine the checkpoints into one. The memory images are copied by
+    jobs worker processes. Uncompressed memory images are written as
+    page aligned sparse files, without writing the zero pages.
+    """
     merged_config = None
     page_ptr = 0
+    copies = []
 
     output_path = output_dir
     if not os.path.isdir(output_path):
         os.system("mkdir -p " + output_path)
 
-    agg_mem_file = open(output_path + "/system.physmem.store0.pmem", "wb+")
+    agg_mem_path = output_path + "/system.physmem.store0.pmem"
     agg_config_file = open(output_path + "/m5.cpt", "wb+")
 
-    if not no_compress:
-        merged_mem = gzip.GzipFile(fileobj= agg_mem_file, mode="wb")
-
     max_curtick = 0
     num_digits = len(str(len(cpts)-1))
 
@@ -96,37 +147,64 @@ def aggregate(output_dir, cpts, no_compress, memory_size):
 
         ### memory stuff
         pages = int(config.get("system", "pagePtr"))
-        page_ptr = page_ptr + pages
         print "pages to be read: ", pages
 
-        f = open(cpts[i] + "/system.physmem.store0.pmem", "rb")
-        gf = gzip.GzipFile(fileobj=f, mode="rb")
-
-        x = 0
-        while x < pages:
-            bytesRead = gf.read(1 << 12)
-            if not no_compress:
-                merged_mem.write(bytesRead)
-            else:
-                agg_mem_file.write(bytesRead)
-            x += 1
-
-        gf.close()
-        f.close()
+        # Compressed images are written to one part per checkpoint and
+        # concatenated, uncompressed ones directly to their pages.
+        src = cpts[i] + "/system.physmem.store0.pmem"
+        if not no_compress:
+            dst = "%s.%d" % (agg_mem_path, i)
+        else:
+            dst = (agg_mem_path, page_ptr)
+        copies.append((src, dst, pages, not no_compress))
+        page_ptr = page_ptr + pages
 
     merged_config.add_section("system")
     merged_config.set("system", "pagePtr", page_ptr)
     merged_config.set("system", "nextPID", len(cpts))
 
     file_size = page_ptr * 4 * 1024
-    dummy_data = "".zfill(4096)
+    dummy_pages = 0
     while file_size < memory_size:
-        if not no_compress:
-            merged_mem.write(dummy_data)
-        else:
-            agg_mem_file.write(dummy_data)
         file_size += 4 * 1024
-        page_ptr += 1
+        dummy_pages += 1
+    page_ptr += dummy_pages
+
+    # Allocate the whole file first, so the workers can write their pages
+    # in any order.
+    agg_mem_file = open(agg_mem_path, "wb+")
+    if no_compress:
+        agg_mem_file.truncate(page_ptr * PAGE_SIZE)
+
+    if jobs > 1:
+        pool = multiprocessing.Pool(jobs)
+        zero_pages = pool.map(_copyPagesStar, copies, chunksize=1)
+        pool.close()
+        pool.join()
+    else:
+        zero_pages = map(_copyPagesStar, copies)
+
+    if not no_compress:
+        # A file of concatenated gzip members is still a valid gzip file
+        for src, dst, pages, compress in copies:
+            with open(dst, "rb") as part:
+                shutil.copyfileobj(part, agg_mem_file, 1 << 20)
+            os.remove(dst)
+
+        merged_mem = gzip.GzipFile(fileobj=agg_mem_file, mode="wb")
+        dummy_data = "".zfill(4096)
+        for x in xrange(dummy_pages):
+            merged_mem.write(dummy_data)
+        merged_mem.close()
+    else:
+        # The dummy pages have to be filled with the same data as before
+        dummy_data = "".zfill(4096) * BLOCK_PAGES
+        agg_mem_file.seek((page_ptr - dummy_pages) * PAGE_SIZE)
+        for x in xrange(0, dummy_pages, BLOCK_PAGES):
+            count = min(BLOCK_PAGES, dummy_pages - x)
+            agg_mem_file.write(dummy_data[:count * PAGE_SIZE])
+        print "zero pages skipped: ", sum(zero_pages)
+    agg_mem_file.close()
 
     print "WARNING: "
     print "Make sure the simulation using this checkpoint has at least ",
@@ -138,12 +216,6 @@ def aggregate(output_dir, cpts, no_compress, memory_size):
 
     merged_config.write(agg_config_file)
 
-    if not no_compress:
-        merged_mem.close()
-        agg_mem_file.close()
-    else:
-        agg_mem_file.close()
-
 if __name__ == "__main__":
     from argparse import ArgumentParser
     parser = ArgumentParser("usage: %prog [options] <directory names which "\
@@ -153,6 +225,8 @@ if __name__ == "__main__":
     parser.add_argument("-c", "--no-compress", action="store_true")
     parser.add_argument("--cpts", nargs='+')
     parser.add_argument("--memory-size", action="store", type=int)
+    parser.add_argument("-j", "--jobs", action="store", type=int, default=1,
+                        help="Number of processes copying memory images")
 
     # Assume x86 ISA.  Any other ISAs would need extra stuff in this script
     # to appropriately parse their page tables and understand page sizes.
@@ -163,4 +237,4 @@ if __name__ == "__main__":
                      "need to be combined.")
 
     aggregate(options.output_dir, options.cpts, options.no_compress,
-              options.memory_size)
+              options.memory_size, options.jobs)
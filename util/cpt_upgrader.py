@@ -72,8 +72,16 @@
 # upgrader. This can be especially valuable when maintaining private
 # upgraders in private branches.
 
+# Checkpoints are opened lazily: the file is only scanned for the section
+# headers, and a section is parsed when an upgrader accesses it. Sections
+# that weren't modified are copied to the new file unchanged. Checkpoints
+# whose version tags are already current are skipped after reading the
+# Globals section. With -j, a directory of checkpoints is processed by a
+# pool of worker processes, which share the upgraders loaded once.
+
 
 import ConfigParser
+import StringIO
 import glob, types, sys, os
 import os.path as osp
 
@@ -86,11 +94,200 @@ def verboseprint(*args):
         print arg,
     print
 
+class LazyCheckpoint(object):
+    """Subset of the ConfigParser interface for checkpoint files, which
+    only parses the sections that are accessed.  Other ConfigParser methods
+    parse the whole file."""
+
+    def __init__(self, path):
+        self.path = path
+        self._cpt = ConfigParser.SafeConfigParser()
+        # gem5 is case sensitive with paramaters
+        self._cpt.optionxform = str
+
+        # Section names in file order, the byte ranges of the sections in
+        # the file, and the sections that have been parsed or modified
+        self._order = []
+        self._spans = {}
+        self._loaded = set()
+        self._dirty = set()
+        self._preamble = None
+
+        offset = 0
+        name = None
+        start = 0
+        with open(path, 'rb') as f:
+            for line in f:
+                if line.startswith('['):
+                    end = line.find(']')
+                    if end > 0:
+                        self._add_span(name, start, offset)
+                        name = line[1:end]
+                        start = offset
+                offset += len(line)
+        self._add_span(name, start, offset)
+
+    def _add_span(self, name, start, end):
+        if name is None:
+            self._preamble = (start, end)
+        elif name in self._spans:
+            # ConfigParser merges repeated sections
+            self._spans[name].append((start, end))
+        else:
+            self._order.append(name)
+            self._spans[name] = [(start, end)]
+
+    def _read(self, spans):
+        with open(self.path, 'rb') as f:
+            for start, end in spans:
+                f.seek(start)
+                yield f.read(end - start)
+
+    def _load(self, section):
+        if section in self._loaded or section not in self._spans:
+            return
+        self._loaded.add(section)
+        text = ''.join(self._read(self._spans[section]))
+
+        # Reading into self._cpt would post-process all sections read so
+        # far every time, so the section is read by its own parser
+        cpt = ConfigParser.SafeConfigParser()
+        cpt.optionxform = str
+        cpt.readfp(StringIO.StringIO(text), self.path)
+        self._cpt._sections.update(cpt._sections)
+
+    def _load_all(self):
+        for section in self._order:
+            self._load(section)
+        self._cpt._sections = self._cpt._dict(
+            (section, self._cpt._sections[section])
+            for section in self._order)
+
+    def sections(self):
+        return list(self._order)
+
+    def has_section(self, section):
+        return section in self._spans
+
+    def add_section(self, section):
+        self._load(section)
+        self._cpt.add_section(section)
+        self._order.append(section)
+        self._spans[section] = []
+        self._loaded.add(section)
+        self._dirty.add(section)
+
+    def remove_section(self, section):
+        if section not in self._spans:
+            return False
+        self._load(section)
+        self._cpt.remove_section(section)
+        self._order.remove(section)
+        del self._spans[section]
+        self._dirty.discard(section)
+        return True
+
+    def options(self, section):
+        self._load(section)
+        return self._cpt.options(section)
+
+    def has_option(self, section, option):
+        self._load(section)
+        return self._cpt.has_option(section, option)
+
+    def get(self, section, option, *args, **kwargs):
+        self._load(section)
+        return self._cpt.get(section, option, *args, **kwargs)
+
+    def getint(self, section, option):
+        self._load(section)
+        return self._cpt.getint(section, option)
+
+    def items(self, section, *args, **kwargs):
+        self._load(section)
+        return self._cpt.items(section, *args, **kwargs)
+
+    def set(self, section, option, value=None):
+        self._load(section)
+        self._cpt.set(section, option, value)
+        self._dirty.add(section)
+
+    def remove_option(self, section, option):
+        self._load(section)
+        self._dirty.add(section)
+        return self._cpt.remove_option(section, option)
+
+    def __getattr__(self, attr):
+        # Fall back to a fully parsed checkpoint for other methods
+        if attr.startswith('_'):
+            raise AttributeError(attr)
+        self._load_all()
+        self._dirty.update(self._order)
+        return getattr(self._cpt, attr)
+
+    def write(self, f):
+        """Write the checkpoint.  Sections that weren't modified are copied
+        from the original file."""
+        # The last two characters written.  A copied section may end
+        # without a newline or blank line if it was at the end of the file,
+        # so the next section header has to be separated from it.
+        tail = ['']
+        def write(data):
+            if data:
+                f.write(data)
+                tail[0] = (tail[0] + data)[-2:]
+
+        def separate():
+            if tail[0] and not tail[0].endswith('\n\n'):
+                write('\n' if tail[0].endswith('\n') else '\n\n')
+
+        if self._preamble:
+            for data in self._read([self._preamble]):
+                write(data)
+
+        for section in self._order:
+            if section not in self._dirty:
+                for data in self._read(self._spans[section]):
+                    separate()
+                    write(data)
+                continue
+
+            separate()
+            write("[%s]\n" % section)
+            for key, value in self._cpt._sections[section].items():
+                if key == "__name__":
+                    continue
+                if value is not None or \
+                        self._cpt._optcre == self._cpt.OPTCRE:
+                    key = " = ".join((key, str(value).replace('\n', '\n\t')))
+                write("%s\n" % key)
+            write("\n")
+
+def read_version_tags(path):
+    """Return the version tags of a checkpoint without reading more than the
+    Globals section, or None if they are not there."""
+    in_globals = False
+    with open(path, 'r') as f:
+        for line in f:
+            if line.startswith('['):
+                if in_globals:
+                    break
+                in_globals = line.strip() == '[Globals]'
+            elif in_globals:
+                key, sep, value = line.partition('=')
+                if not sep or ':' in key:
+                    key, sep, value = line.partition(':')
+                if sep and key.strip() == 'version_tags':
+                    return set(value.split())
+    return None
+
 class Upgrader:
     tag_set = set()
     untag_set = set() # tags to remove by downgrading
     by_tag = {}
     legacy = {}
+    # all tags in an order respecting the dependences, set by load_all
+    order = []
     def __init__(self, filename):
         self.filename = filename
         execfile(filename, {}, self.__dict__)
@@ -184,26 +381,58 @@ class Upgrader:
                           "nonexistent tag '%s'" % (tag, dep)
                     sys.exit(1)
 
+        Upgrader.order = Upgrader.sort_tags()
+
+    @staticmethod
+    def sort_tags():
+        """Sort the tags topologically, so every tag comes after the tags it
+        depends on and the upgrades are applied in a fixed order.  Cycles
+        are left to process_file to report."""
+        order = []
+        visited = set()
+        def visit(tag, path):
+            if tag in visited or tag in path:
+                return
+            path.add(tag)
+            for dep in Upgrader.by_tag[tag].depends:
+                visit(dep, path)
+            path.remove(tag)
+            visited.add(tag)
+            order.append(tag)
+
+        for tag in sorted(Upgrader.by_tag):
+            visit(tag, set())
+        return order
+
+    @staticmethod
+    def is_current(tags):
+        return Upgrader.tag_set <= tags and not (Upgrader.untag_set & tags)
+
+def warn_unknown_tags(tags):
+    # If the current checkpoint has a tag we don't know about, we have
+    # a divergence that (in general) must be addressed by (e.g.) merging
+    # simulator support for its changes.
+    unknown_tags = tags - (Upgrader.tag_set | Upgrader.untag_set)
+    if unknown_tags:
+        print "warning: upgrade script does not recognize the following "\
+              "tags in this checkpoint:", ' '.join(unknown_tags)
+
 def process_file(path, **kwargs):
     if not osp.isfile(path):
         import errno
-        raise IOError(ennro.ENOENT, "No such file", path)
+        raise IOError(errno.ENOENT, "No such file", path)
 
     verboseprint("Processing file %s...." % path)
 
-    if kwargs.get('backup', True):
-        import shutil
-        shutil.copyfile(path, path + '.bak')
-
-    cpt = ConfigParser.SafeConfigParser()
-
-    # gem5 is case sensitive with paramaters
-    cpt.optionxform = str
+    # Skip current checkpoints before parsing the whole file
+    tags = read_version_tags(path)
+    if tags is not None and Upgrader.is_current(tags):
+        verboseprint("has tags", ' '.join(tags))
+        warn_unknown_tags(tags)
+        verboseprint("...nothing to do")
+        return
 
-    # Read the current data
-    cpt_file = file(path, 'r')
-    cpt.readfp(cpt_file)
-    cpt_file.close()
+    cpt = LazyCheckpoint(path)
 
     change = False
 
@@ -227,19 +456,14 @@ def process_file(path, **kwargs):
         exit(1)
 
     verboseprint("has tags", ' '.join(tags))
-    # If the current checkpoint has a tag we don't know about, we have
-    # a divergence that (in general) must be addressed by (e.g.) merging
-    # simulator support for its changes.
-    unknown_tags = tags - (Upgrader.tag_set | Upgrader.untag_set)
-    if unknown_tags:
-        print "warning: upgrade script does not recognize the following "\
-              "tags in this checkpoint:", ' '.join(unknown_tags)
+    warn_unknown_tags(tags)
 
     # Apply migrations for tags not in checkpoint and tags present for which
     # downgraders are present, respecting dependences
     to_apply = (Upgrader.tag_set - tags) | (Upgrader.untag_set & tags)
     while to_apply:
-        ready = set([ t for t in to_apply if Upgrader.get(t).ready(tags) ])
+        ready = [ t for t in Upgrader.order
+                  if t in to_apply and Upgrader.get(t).ready(tags) ]
         if not ready:
             print "could not apply these upgrades:", ' '.join(to_apply)
             print "update dependences impossible to resolve; aborting"
@@ -249,7 +473,7 @@ def process_file(path, **kwargs):
             Upgrader.get(tag).update(cpt, tags)
             change = True
 
-        to_apply -= ready
+        to_apply -= set(ready)
 
     if not change:
         verboseprint("...nothing to do")
@@ -257,9 +481,54 @@ def process_file(path, **kwargs):
 
     cpt.set('Globals', 'version_tags', ' '.join(tags))
 
-    # Write the old data back
+    # Write the new data to a temporary file first, which replaces the
+    # checkpoint once it's complete.  The old file becomes the backup.
     verboseprint("...completed")
-    cpt.write(file(path, 'w'))
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        cpt.write(f)
+    if kwargs.get('backup', True):
+        os.rename(path, path + '.bak')
+    os.rename(tmp_path, path)
+
+def _process_file_job(args):
+    path, kwargs = args
+    try:
+        process_file(path, **kwargs)
+        return True
+    except SystemExit as e:
+        return not e.code
+    except Exception:
+        import traceback
+        print "error processing %s:" % path
+        traceback.print_exc()
+        return False
+
+def process_files(paths, jobs=1, **kwargs):
+    """Process a list of checkpoints, using a pool of jobs processes.  The
+    upgraders have to be loaded before.  Returns False if any of the
+    checkpoints failed."""
+    work = [ (path, kwargs) for path in paths ]
+    if jobs <= 1 or len(paths) <= 1:
+        results = map(_process_file_job, work)
+    else:
+        import multiprocessing
+        # The workers are forked, so they inherit the loaded upgraders
+        pool = multiprocessing.Pool(jobs)
+        try:
+            results = pool.map(_process_file_job, work, chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+    return all(results)
+
+def find_checkpoints(path):
+    paths = []
+    for root, dirs, files in os.walk(path):
+        dirs.sort()
+        if 'm5.cpt' in files:
+            paths.append(osp.join(root, 'm5.cpt'))
+    return paths
 
 if __name__ == '__main__':
     from optparse import OptionParser, SUPPRESS_HELP
@@ -272,6 +541,9 @@ if __name__ == '__main__':
                       help="Do no backup each checkpoint before modifying it")
     parser.add_option("-v", "--verbose", action="store_true",
                       help="Print out debugging information as")
+    parser.add_option("-j", "--jobs", type="int", default=1,
+                      help="Number of checkpoints to process in parallel "\
+                           "when recursing")
     parser.add_option("--get-cc-file", action="store_true",
                       # used during build; generate src/sim/tags.cc and exit
                       help=SUPPRESS_HELP)
@@ -305,13 +577,12 @@ if __name__ == '__main__':
     elif osp.isdir(path):
         cpt_file = osp.join(path, 'm5.cpt')
         if options.recurse:
-            # Visit very file and see if it matches
-            for root,dirs,files in os.walk(path):
-                for name in files:
-                    if name == 'm5.cpt':
-                        process_file(osp.join(root,name), **vars(options))
-                for dir in dirs:
-                    pass
+            # Collect every checkpoint first, so they can be processed in
+            # parallel
+            kwargs = vars(options)
+            jobs = kwargs.pop('jobs')
+            if not process_files(find_checkpoints(path), jobs, **kwargs):
+                sys.exit(1)
         # Maybe someone passed a cpt.XXXXXXX directory and not m5.cpt
         elif osp.isfile(cpt_file):
             process_file(cpt_file, **vars(options))
@@ -0,0 +1,93 @@
+#!/usr/bin/env python2
+#
+# Copyright 2019 Alexander Fasching
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+# Upgrade a small legacy checkpoint with the lazily parsed checkpoints of
+# cpt_upgrader.py and with a fully parsed ConfigParser like before, and
+# check that both results contain the same sections and options.
+
+import ConfigParser
+import os
+import shutil
+import tempfile
+
+import cpt_upgrader
+
+# The last section doesn't end with a newline, so the sections added by the
+# upgraders have to be separated from it
+legacy_cpt = """\
+[Globals]
+curTick=0
+
+[root]
+isa=x86
+cpt_ver=2
+
+[system.cpu.xc.0]
+instCnt=0
+intRegs=1 2 3 4
+floatRegs.i=0 0
+
+[system.physmem]
+range_size=1024"""
+
+class EagerCheckpoint(ConfigParser.SafeConfigParser):
+    """Checkpoint parsed completely, like cpt_upgrader.py did before"""
+    def __init__(self, path):
+        ConfigParser.SafeConfigParser.__init__(self)
+        self.optionxform = str
+        self.read(path)
+
+def read(path):
+    cpt = ConfigParser.SafeConfigParser()
+    cpt.optionxform = str
+    cpt.read(path)
+    return [ (section, sorted(cpt.items(section)))
+             for section in cpt.sections() ]
+
+def upgrade(path, checkpoint_class):
+    lazy_class = cpt_upgrader.LazyCheckpoint
+    cpt_upgrader.LazyCheckpoint = checkpoint_class
+    try:
+        cpt_upgrader.process_file(path, backup=False)
+    finally:
+        cpt_upgrader.LazyCheckpoint = lazy_class
+
+cpt_upgrader.Upgrader.load_all()
+
+tmpdir = tempfile.mkdtemp()
+try:
+    paths = {}
+    for name, checkpoint_class in (('eager', EagerCheckpoint),
+                                   ('lazy', cpt_upgrader.LazyCheckpoint)):
+        paths[name] = os.path.join(tmpdir, name + '.cpt')
+        with open(paths[name], 'w') as f:
+            f.write(legacy_cpt)
+        upgrade(paths[name], checkpoint_class)
+
+    expected, upgraded = read(paths['eager']), read(paths['lazy'])
+    assert upgraded == expected, (upgraded, expected)
+
+    # Every section header starts a line after a blank one
+    with open(paths['lazy']) as f:
+        text = f.read()
+    for section, items in upgraded[1:]:
+        assert '\n\n[%s]\n' % section in text, section
+
+    print text
+finally:
+    shutil.rmtree(tmpdir)
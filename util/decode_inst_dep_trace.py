@@ -88,7 +88,13 @@
 # 7,35666,1,COMP,3000::,4
 # 8,35670,1,STORE,1748748,4,74,0:,6,3:,7
 # 9,35670,1,COMP,500::,7
+#
+# With --numpy, the records are written to an .npz file instead,
+# with one array per field. The repeated dependencies of all records are
+# concatenated into rob_dep and reg_dep, and the dependencies of record i
+# are rob_dep[rob_dep_offsets[i]:rob_dep_offsets[i + 1]].
 
+import argparse
 import protolib
 import sys
 
@@ -109,52 +115,95 @@ except:
         print "Failed to import proto definitions"
         exit(-1)
 
-def main():
-    if len(sys.argv) != 3:
-        print "Usage: ", sys.argv[0], " <protobuf input> <ASCII output>"
-        exit(-1)
+# Fields of the exported arrays. Optional fields that are not set in a
+# record have the same defaults as in the ASCII output.
+RECORD_FIELDS = [('seq_num', 'u8'), ('pc', 'u8'), ('weight', 'u4'),
+                 ('type', 'u1'), ('p_addr', 'u8'), ('size', 'u4'),
+                 ('flags', 'u4'), ('comp_delay', 'u8')]
 
-    # Open the file on read mode
-    proto_in = protolib.openFileRd(sys.argv[1])
+# Number of records parsed at once by a worker process
+BATCH_SIZE = 1 << 16
 
-    try:
-        ascii_out = open(sys.argv[2], 'w')
-    except IOError:
-        print "Failed to open ", sys.argv[2], " for writing"
-        exit(-1)
+def recordArrays(buffers):
+    """
+    Parse a list of serialized records. Return a NumPy structured array
+    with the fields in RECORD_FIELDS, the concatenated order and
+    register dependencies and the number of dependencies per record.
+    """
+    import numpy as np
 
-    # Read the magic number in 4-byte Little Endian
-    magic_number = proto_in.read(4)
+    packet = inst_dep_record_pb2.InstDepRecord()
+    rows = []
+    rob_deps = []
+    rob_counts = []
+    reg_deps = []
+    reg_counts = []
+    for buf in buffers:
+        packet.ParseFromString(buf)
+        weight = packet.weight if packet.HasField('weight') else 1
+        rows.append((packet.seq_num, packet.pc, weight, packet.type,
+                     packet.p_addr, packet.size, packet.flags,
+                     packet.comp_delay))
+        rob_deps.extend(packet.rob_dep)
+        rob_counts.append(len(packet.rob_dep))
+        reg_deps.extend(packet.reg_dep)
+        reg_counts.append(len(packet.reg_dep))
 
-    if magic_number != "gem5":
-        print "Unrecognized file"
-        exit(-1)
+    return (np.array(rows, dtype=RECORD_FIELDS),
+            np.array(rob_deps, dtype='u8'), np.array(rob_counts, dtype='u8'),
+            np.array(reg_deps, dtype='u8'), np.array(reg_counts, dtype='u8'))
 
-    print "Parsing packet header"
+def _offsets(counts):
+    import numpy as np
 
-    # Add the packet header
-    header = inst_dep_record_pb2.InstDepRecordHeader()
-    protolib.decodeMessage(proto_in, header)
+    offsets = np.zeros(len(counts) + 1, dtype='u8')
+    np.cumsum(counts, out=offsets[1:])
+    return offsets
 
-    print "Object id:", header.obj_id
-    print "Tick frequency:", header.tick_freq
+def exportNumpy(proto_in, out_name, jobs):
+    """
+    Write the records to an .npz file with one array per
+    field. With more than one job, batches of records are parsed in
+    parallel by a pool of processes.
+    """
+    import numpy as np
 
-    print "Parsing packets"
+    batches = protolib.iterBufferBatches(proto_in, BATCH_SIZE)
+    if jobs > 1:
+        import multiprocessing
+        pool = multiprocessing.Pool(jobs)
+        parts = list(pool.imap(recordArrays, batches))
+        pool.close()
+        pool.join()
+    else:
+        parts = [recordArrays(batch) for batch in batches]
 
-    print "Creating enum value,name lookup from proto"
-    enumNames = {}
-    desc = inst_dep_record_pb2.InstDepRecord.DESCRIPTOR
-    for namestr, valdesc in desc.enum_values_by_name.items():
-        print '\t', valdesc.number, namestr
-        enumNames[valdesc.number] = namestr
+    if not parts:
+        parts = [recordArrays([])]
+    records, rob_deps, rob_counts, reg_deps, reg_counts = \
+        [np.concatenate(arrays) for arrays in zip(*parts)]
+
+    columns = dict((name, records[name]) for name, _ in RECORD_FIELDS)
+    columns['rob_dep'] = rob_deps
+    columns['rob_dep_offsets'] = _offsets(rob_counts)
+    columns['reg_dep'] = reg_deps
+    columns['reg_dep_offsets'] = _offsets(reg_counts)
+    np.savez(out_name, **columns)
 
+    return (len(records), np.count_nonzero(reg_counts),
+            np.count_nonzero(rob_counts))
+
+def exportAscii(proto_in, ascii_out, enumNames):
+    """
+    Write one line per record to the ASCII output.
+    """
     num_packets = 0
     num_regdeps = 0
     num_robdeps = 0
     packet = inst_dep_record_pb2.InstDepRecord()
 
     # Decode the packet messages until we hit the end of the file
-    while protolib.decodeMessage(proto_in, packet):
+    for packet in protolib.iterMessages(proto_in, packet):
         num_packets += 1
 
         # Write to file the seq num
@@ -205,12 +254,71 @@ def main():
         # New line
         ascii_out.write('\n')
 
+    return num_packets, num_regdeps, num_robdeps
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Dump a protobuf instruction dependency trace to ASCII "
+        "or NumPy format")
+    parser.add_argument("input", help="protobuf input")
+    parser.add_argument("output", help="ASCII or .npz output")
+    parser.add_argument("--numpy", action="store_true",
+                        help="write an .npz file with one array "
+                        "per field instead of ASCII")
+    parser.add_argument("-j", "--jobs", type=int, default=1,
+                        help="number of processes parsing records for the "
+                        "NumPy output")
+    args = parser.parse_args()
+
+    # Open the file on read mode
+    proto_in = protolib.openFileRd(args.input)
+
+    ascii_out = None
+    if not args.numpy:
+        try:
+            ascii_out = open(args.output, 'w')
+        except IOError:
+            print "Failed to open ", args.output, " for writing"
+            exit(-1)
+
+    # Read the magic number in 4-byte Little Endian
+    magic_number = proto_in.read(4)
+
+    if magic_number != "gem5":
+        print "Unrecognized file"
+        exit(-1)
+
+    print "Parsing packet header"
+
+    # Add the packet header
+    header = inst_dep_record_pb2.InstDepRecordHeader()
+    protolib.decodeMessage(proto_in, header)
+
+    print "Object id:", header.obj_id
+    print "Tick frequency:", header.tick_freq
+
+    print "Parsing packets"
+
+    print "Creating enum value,name lookup from proto"
+    enumNames = {}
+    desc = inst_dep_record_pb2.InstDepRecord.DESCRIPTOR
+    for namestr, valdesc in desc.enum_values_by_name.items():
+        print '\t', valdesc.number, namestr
+        enumNames[valdesc.number] = namestr
+
+    if args.numpy:
+        num_packets, num_regdeps, num_robdeps = \
+            exportNumpy(proto_in, args.output, args.jobs)
+    else:
+        num_packets, num_regdeps, num_robdeps = \
+            exportAscii(proto_in, ascii_out, enumNames)
+        ascii_out.close()
+
     print "Parsed packets:", num_packets
     print "Packets with at least 1 reg dep:", num_regdeps
     print "Packets with at least 1 rob dep:", num_robdeps
 
     # We're done
-    ascii_out.close()
     proto_in.close()
 
 if __name__ == "__main__":
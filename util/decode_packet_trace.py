@@ -38,8 +38,9 @@
 # Authors: Andreas Hansson
 
 # This script is used to dump protobuf packet traces to ASCII
-# format.
+# format, or to a NumPy .npz file with one array per field.
 
+import argparse
 import os
 import protolib
 import subprocess
@@ -50,25 +51,112 @@ util_dir = os.path.dirname(os.path.realpath(__file__))
 subprocess.check_call(['make', '--quiet', '-C', util_dir, 'packet_pb2.py'])
 import packet_pb2
 
+# Fields of the exported arrays. Optional fields that are not set in a
+# packet are 0.
+PACKET_FIELDS = [('tick', 'u8'), ('cmd', 'u4'), ('addr', 'u8'),
+                 ('size', 'u4'), ('flags', 'u4'), ('pkt_id', 'u8'),
+                 ('pc', 'u8')]
+
+# Number of packets parsed at once by a worker process
+BATCH_SIZE = 1 << 16
+
+def packetArray(buffers):
+    """
+    Parse a list of serialized packets into a NumPy structured array
+    with the fields in PACKET_FIELDS.
+    """
+    import numpy as np
+
+    packet = packet_pb2.Packet()
+    rows = []
+    for buf in buffers:
+        packet.ParseFromString(buf)
+        rows.append((packet.tick, packet.cmd, packet.addr, packet.size,
+                     packet.flags, packet.pkt_id, packet.pc))
+    return np.array(rows, dtype=PACKET_FIELDS)
+
+def exportNumpy(proto_in, out_name, jobs):
+    """
+    Write the packets to an .npz file with one array per
+    field. With more than one job, batches of packets are parsed in
+    parallel by a pool of processes.
+    """
+    import numpy as np
+
+    batches = protolib.iterBufferBatches(proto_in, BATCH_SIZE)
+    if jobs > 1:
+        import multiprocessing
+        pool = multiprocessing.Pool(jobs)
+        arrays = list(pool.imap(packetArray, batches))
+        pool.close()
+        pool.join()
+    else:
+        arrays = [packetArray(batch) for batch in batches]
+
+    if arrays:
+        packets = np.concatenate(arrays)
+    else:
+        packets = np.zeros(0, dtype=PACKET_FIELDS)
+
+    np.savez(out_name, **dict((name, packets[name])
+                              for name, _ in PACKET_FIELDS))
+    return len(packets)
+
+def exportAscii(proto_in, ascii_out):
+    """
+    Write one line per packet to the ASCII output.
+    """
+    num_packets = 0
+
+    # Decode the packet messages until we hit the end of the file
+    for packet in protolib.iterMessages(proto_in, packet_pb2.Packet()):
+        num_packets += 1
+        # ReadReq is 1 and WriteReq is 4 in src/mem/packet.hh Command enum
+        cmd = 'r' if packet.cmd == 1 else ('w' if packet.cmd == 4 else 'u')
+        if packet.HasField('pkt_id'):
+            ascii_out.write('%s,' % (packet.pkt_id))
+        if packet.HasField('flags'):
+            ascii_out.write('%s,%s,%s,%s,%s' % (cmd, packet.addr, packet.size,
+                            packet.flags, packet.tick))
+        else:
+            ascii_out.write('%s,%s,%s,%s' % (cmd, packet.addr, packet.size,
+                                           packet.tick))
+        if packet.HasField('pc'):
+            ascii_out.write(',%s\n' % (packet.pc))
+        else:
+            ascii_out.write('\n')
+
+    return num_packets
+
 def main():
-    if len(sys.argv) != 3:
-        print "Usage: ", sys.argv[0], " <protobuf input> <ASCII output>"
-        exit(-1)
+    parser = argparse.ArgumentParser(
+        description="Dump a protobuf packet trace to ASCII or NumPy format")
+    parser.add_argument("input", help="protobuf input")
+    parser.add_argument("output", help="ASCII or .npz output")
+    parser.add_argument("--numpy", action="store_true",
+                        help="write an .npz file with one array "
+                        "per field instead of ASCII")
+    parser.add_argument("-j", "--jobs", type=int, default=1,
+                        help="number of processes parsing packets for the "
+                        "NumPy output")
+    args = parser.parse_args()
 
     # Open the file in read mode
-    proto_in = protolib.openFileRd(sys.argv[1])
+    proto_in = protolib.openFileRd(args.input)
 
-    try:
-        ascii_out = open(sys.argv[2], 'w')
-    except IOError:
-        print "Failed to open ", sys.argv[2], " for writing"
-        exit(-1)
+    ascii_out = None
+    if not args.numpy:
+        try:
+            ascii_out = open(args.output, 'w')
+        except IOError:
+            print "Failed to open ", args.output, " for writing"
+            exit(-1)
 
     # Read the magic number in 4-byte Little Endian
     magic_number = proto_in.read(4)
 
     if magic_number != "gem5":
-        print "Unrecognized file", sys.argv[1]
+        print "Unrecognized file", args.input
         exit(-1)
 
     print "Parsing packet header"
@@ -85,31 +173,15 @@ def main():
 
     print "Parsing packets"
 
-    num_packets = 0
-    packet = packet_pb2.Packet()
-
-    # Decode the packet messages until we hit the end of the file
-    while protolib.decodeMessage(proto_in, packet):
-        num_packets += 1
-        # ReadReq is 1 and WriteReq is 4 in src/mem/packet.hh Command enum
-        cmd = 'r' if packet.cmd == 1 else ('w' if packet.cmd == 4 else 'u')
-        if packet.HasField('pkt_id'):
-            ascii_out.write('%s,' % (packet.pkt_id))
-        if packet.HasField('flags'):
-            ascii_out.write('%s,%s,%s,%s,%s' % (cmd, packet.addr, packet.size,
-                            packet.flags, packet.tick))
-        else:
-            ascii_out.write('%s,%s,%s,%s' % (cmd, packet.addr, packet.size,
-                                           packet.tick))
-        if packet.HasField('pc'):
-            ascii_out.write(',%s\n' % (packet.pc))
-        else:
-            ascii_out.write('\n')
+    if args.numpy:
+        num_packets = exportNumpy(proto_in, args.output, args.jobs)
+    else:
+        num_packets = exportAscii(proto_in, ascii_out)
+        ascii_out.close()
 
     print "Parsed packets:", num_packets
 
     # We're done
-    ascii_out.close()
     proto_in.close()
 
 if __name__ == "__main__":
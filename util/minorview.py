@@ -67,13 +67,23 @@ if __name__ == '__main__':
         help='time of first event to load from file')
     parser.add_argument('--end-time', metavar='time', type=int, default=None,
         help='time of last event to load from file')
+    parser.add_argument('--index', action='store_true', default=False,
+        help='load events lazily through an index of the event file, '
+            + 'which is built on the first use (default: load all events)')
+    parser.add_argument('--window-lines', metavar='lines', type=int,
+        default=20000,
+        help='lines of the event file per indexed window (default: 20000)')
+    parser.add_argument('--max-windows', metavar='count', type=int,
+        default=16,
+        help='number of indexed windows kept in memory (default: 16)')
     parser.add_argument('--mini-views', action='store_true', default=False,
         help='show tiny views of the next 10 time steps')
     parser.add_argument('eventFile', metavar='event-file', default='ev')
 
     args = parser.parse_args(sys.argv[1:])
 
-    model = BlobModel(unitNamePrefix=args.prefix)
+    model = BlobModel(unitNamePrefix=args.prefix, indexEvents=args.index,
+        indexWindowLines=args.window_lines, maxWindows=args.max_windows)
 
     if args.picture and os.access(args.picture, os.O_RDONLY):
         model.load_picture(args.picture)
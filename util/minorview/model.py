@@ -43,6 +43,9 @@ import re
 import blobs
 from time import time as wall_time
 import os
+import bisect
+import collections
+import cPickle as pickle
 
 id_parts = "TSPLFE"
 
@@ -537,9 +540,160 @@ class BlobEvent(object):
             map(find_inst, blocks)
         return sorted(ret)
 
+# Matches every event file line with a time, unit and optional line type
+match_line_re = re.compile(
+    '^\s*(\d+):\s*([\w\.]+):\s*(Minor\w+:)?\s*(.*)$')
+
+# Matches just the time of an event file line
+match_time_re = re.compile('^\s*(\d+):')
+
+class EventParser(object):
+    """Parser adding the events of event file lines to a model,
+    accumulating comments to be attached to MinorTrace events when the
+    time changes"""
+    def __init__(self, model, lastTimeLines={}, progress=False):
+        self.model = model
+        # A negative time will *always* be different from an event time
+        self.time = -1
+        self.comments = []
+        # Last MinorTrace line data of each unit
+        self.lastTimeLines = dict(lastTimeLines)
+        self.minorTraceLineCount = 0
+        if progress:
+            self.nextProgressPrintEventCount = 1000
+        else:
+            self.nextProgressPrintEventCount = None
+
+    def update_comments(self):
+        """Add the accumulated comments to an existing event, if there is
+        one at the current time, or create a new, correctly-timed, event
+        from the last event and attach the comments to that"""
+        model = self.model
+        time = self.time
+        for commentUnit, commentRest in self.comments:
+            event = model.find_loaded_event(commentUnit, time)
+            # Find an event to which this comment can be attached
+            if event is None:
+                # No older event, make a new empty one
+                event = BlobEvent(commentUnit, time, {})
+                model.add_unit_event(event)
+            elif event.time != time:
+                # Copy the old event and make a new one with the right
+                #   time and comment
+                newEvent = BlobEvent(commentUnit, time, event.pairs)
+                newEvent.visuals = dict(event.visuals)
+                event = newEvent
+                model.add_unit_event(event)
+            event.comments.append(commentRest)
+        self.comments = []
+
+    def parse_line(self, l):
+        """Parse a single line of an event file"""
+        match = match_line_re.match(l)
+        if match is None:
+            return
+
+        model = self.model
+        event_time, unit, line_type, rest = match.groups()
+        event_time = int(event_time)
+
+        unit = re.sub('^' + model.unitNamePrefix + '\.?(.*)$',
+            '\\1', unit)
+
+        # When the time changes, resolve comments
+        if event_time != self.time:
+            if (self.nextProgressPrintEventCount is not None and
+                model.numEvents > self.nextProgressPrintEventCount):
+                print ('Parsed to time: %d' % event_time)
+                self.nextProgressPrintEventCount = model.numEvents + 1000
+            self.update_comments()
+            self.time = event_time
+
+        if line_type is None:
+            # Treat this line as just a 'comment'
+            self.comments.append((unit, rest))
+        elif line_type == 'MinorTrace:':
+            self.minorTraceLineCount += 1
+
+            # Only insert this event if it's not the same as
+            #   the last event we saw for this unit
+            if self.lastTimeLines.get(unit, None) != rest:
+                model.add_unit_event(
+                    model.make_trace_event(unit, event_time, rest))
+                self.lastTimeLines[unit] = rest
+        elif line_type == 'MinorInst:':
+            model.add_minor_inst(rest)
+        elif line_type == 'MinorLine:':
+            model.add_minor_line(rest)
+
+class EventWindow(object):
+    """Events, instructions and lines loaded from one window of an
+    indexed event file"""
+    def __init__(self, units):
+        self.unitEvents = dict((unit, []) for unit in units)
+        self.insts = {}
+        self.lines = {}
+
+class EventIndex(object):
+    """Index of an event file splitting it into windows of whole time
+    steps.  For each window, windows holds its start time, its file
+    offset and the time, MinorTrace line data and comments of the last
+    event of each unit before it.  times holds the times of all events"""
+    version = 1
+
+    def __init__(self, file, model):
+        self.key = self.make_key(file, model)
+        self.units = sorted(model.unitEvents.keys())
+        self.windows = []
+        self.startTimes = []
+        self.times = []
+        self.numEvents = 0
+        self.lastTime = 0
+
+    @classmethod
+    def make_key(cls, file, model):
+        """Values which have to match for an index to be reused"""
+        st = os.stat(file)
+        return (cls.version, st.st_size, st.st_mtime, model.unitNamePrefix,
+            sorted(model.unitEvents.keys()), model.indexWindowLines)
+
+    def add_window(self, startTime, offset, lastEvents):
+        self.windows.append((startTime, offset, lastEvents))
+        self.startTimes.append(startTime)
+
+    @classmethod
+    def load(cls, filename, file, model):
+        """Load an index, returning None if it's missing or out of date"""
+        try:
+            with open(filename, 'rb') as f:
+                state = pickle.load(f)
+        except (IOError, EOFError, pickle.UnpicklingError):
+            return None
+
+        if not isinstance(state, dict) or \
+            state.get('key') != cls.make_key(file, model):
+            print 'Index', filename, 'is out of date'
+            return None
+
+        index = cls.__new__(cls)
+        index.__dict__.update(state)
+        return index
+
+    def save(self, filename):
+        """Save the index, which is just skipped if the file can't be
+        written"""
+        tmpname = filename + '.tmp'
+        try:
+            with open(tmpname, 'wb') as f:
+                pickle.dump(self.__dict__, f, pickle.HIGHEST_PROTOCOL)
+            os.rename(tmpname, filename)
+        except (IOError, OSError) as e:
+            print 'Can\'t write index', filename + ':', e
+
 class BlobModel(object):
     """Model bringing together blob definitions and parsed events"""
-    def __init__(self, unitNamePrefix=''):
+    def __init__(self, unitNamePrefix='', indexEvents=False,
+        indexWindowLines=20000, maxWindows=16):
         self.blobs = []
         self.unitNameToBlobs = {}
         self.unitEvents = {}
@@ -547,6 +701,14 @@ class BlobModel(object):
         self.picSize = Point(20,10)
         self.lastTime = 0
         self.unitNamePrefix = unitNamePrefix
+        # Load events lazily through an index of the event file, keeping
+        #   at most maxWindows windows of indexWindowLines lines loaded
+        self.indexEvents = indexEvents
+        self.indexWindowLines = indexWindowLines
+        self.maxWindows = maxWindows
+        self.eventIndex = None
+        self.eventFile = None
+        self.windows = collections.OrderedDict()
 
     def clear_events(self):
         """Drop all events and times"""
@@ -648,8 +810,32 @@ class BlobModel(object):
                 return None
         return None
 
+    def make_trace_event(self, unit, time, rest):
+        """Make an event from the data of a MinorTrace line"""
+        event = BlobEvent(unit, time, {})
+        pairs = parse.parse_pairs(rest)
+        event.pairs = pairs
+
+        # Try to decode the colour data for this event
+        blobs = self.unitNameToBlobs.get(unit, [])
+        for blob in blobs:
+            if blob.visualDecoder is not None:
+                event.visuals[blob.picChar] = (
+                    blob.visualDecoder(pairs))
+
+        return event
+
     def find_unit_event_by_time(self, unit, time):
         """Find the last event for the given unit at time <= time"""
+        if self.eventIndex is not None:
+            if len(self.eventIndex.windows) == 0:
+                return None
+            self.find_window(time)
+        return self.find_loaded_event(unit, time)
+
+    def find_loaded_event(self, unit, time):
+        """Find the last event for the given unit at time <= time in the
+        currently loaded events"""
         if unit in self.unitEvents:
             events = self.unitEvents[unit]
             ret = self.find_event_bisection(unit, time, events,
@@ -662,11 +848,7 @@ class BlobModel(object):
     def find_time_index(self, time):
         """Find a time index close to the given time (where
         times[return] <= time and times[return+1] > time"""
-        ret = 0
-        lastIndex = len(self.times) - 1
-        while ret < lastIndex and self.times[ret + 1] <= time:
-            ret += 1
-        return ret
+        return max(bisect.bisect_right(self.times, time) - 1, 0)
 
     def add_minor_inst(self, rest):
         """Parse and add a MinorInst line to the model"""
@@ -721,38 +903,13 @@ class BlobModel(object):
 
     def load_events(self, file, startTime=0, endTime=None):
         """Load an event file and add everything to this model"""
-        def update_comments(comments, time):
-            # Add a list of comments to an existing event, if there is one at
-            #   the given time, or create a new, correctly-timed, event from
-            #   the last event and attach the comments to that
-            for commentUnit, commentRest in comments:
-                event = self.find_unit_event_by_time(commentUnit, time)
-                # Find an event to which this comment can be attached
-                if event is None:
-                    # No older event, make a new empty one
-                    event = BlobEvent(commentUnit, time, {})
-                    self.add_unit_event(event)
-                elif event.time != time:
-                    # Copy the old event and make a new one with the right
-                    #   time and comment
-                    newEvent = BlobEvent(commentUnit, time, event.pairs)
-                    newEvent.visuals = dict(event.visuals)
-                    event = newEvent
-                    self.add_unit_event(event)
-                event.comments.append(commentRest)
+        if self.indexEvents:
+            self.open_indexed_events(file, startTime, endTime)
+            return
 
+        self.close_indexed_events()
         self.clear_events()
 
-        # A negative time will *always* be different from an event time
-        time = -1
-        time_events = {}
-        last_time_lines = {}
-        minor_trace_line_count = 0
-        comments = []
-
-        default_colour = [[colours.unknownColour]]
-        next_progress_print_event_count = 1000
-
         if not os.access(file, os.R_OK):
             print 'Can\'t open file', file
             exit(1)
@@ -777,73 +934,216 @@ class BlobModel(object):
             else:
                 l = f.readline()
 
-        match_line_re = re.compile(
-            '^\s*(\d+):\s*([\w\.]+):\s*(Minor\w+:)?\s*(.*)$')
+        parser = EventParser(self, progress=True)
 
         # Parse each line of the events file, accumulating comments to be
         #   attached to MinorTrace events when the time changes
         reached_end_time = False
         while not reached_end_time and l:
-            match = match_line_re.match(l)
-            if match is not None:
-                event_time, unit, line_type, rest = match.groups()
-                event_time = int(event_time)
-
-                unit = re.sub('^' + self.unitNamePrefix + '\.?(.*)$',
-                    '\\1', unit)
-
-                # When the time changes, resolve comments
-                if event_time != time:
-                    if self.numEvents > next_progress_print_event_count:
-                        print ('Parsed to time: %d' % event_time)
-                        next_progress_print_event_count = (
-                            self.numEvents + 1000)
-                    update_comments(comments, time)
-                    comments = []
-                    time = event_time
-
-                if line_type is None:
-                    # Treat this line as just a 'comment'
-                    comments.append((unit, rest))
-                elif line_type == 'MinorTrace:':
-                    minor_trace_line_count += 1
-
-                    # Only insert this event if it's not the same as
-                    #   the last event we saw for this unit
-                    if last_time_lines.get(unit, None) != rest:
-                        event = BlobEvent(unit, event_time, {})
-                        pairs = parse.parse_pairs(rest)
-                        event.pairs = pairs
-
-                        # Try to decode the colour data for this event
-                        blobs = self.unitNameToBlobs.get(unit, [])
-                        for blob in blobs:
-                            if blob.visualDecoder is not None:
-                                event.visuals[blob.picChar] = (
-                                    blob.visualDecoder(pairs))
-
-                        self.add_unit_event(event)
-                        last_time_lines[unit] = rest
-                elif line_type == 'MinorInst:':
-                    self.add_minor_inst(rest)
-                elif line_type == 'MinorLine:':
-                    self.add_minor_line(rest)
-
-            if endTime is not None and time > endTime:
+            parser.parse_line(l)
+
+            if endTime is not None and parser.time > endTime:
                 reached_end_time = True
 
             l = f.readline()
 
-        update_comments(comments, time)
+        parser.update_comments()
         self.extract_times()
         f.close()
 
         end_wall_time = wall_time()
 
-        print 'Total events:', minor_trace_line_count, 'unique events:', \
+        print 'Total events:', parser.minorTraceLineCount, 'unique events:', \
             self.numEvents
         print 'Time to parse:', end_wall_time - start_wall_time
 
+    def open_indexed_events(self, file, startTime=0, endTime=None):
+        """Open an event file through its index.  Only the times are read
+        from the index, events are loaded on demand by
+        find_unit_event_by_time in windows of about indexWindowLines
+        lines.  The index is built by parsing the whole file once and
+        stored in file + '.idx'"""
+        self.close_indexed_events()
+        self.clear_events()
+
+        if not os.access(file, os.R_OK):
+            print 'Can\'t open file', file
+            exit(1)
+        else:
+            print 'Opening file', file
+
+        start_wall_time = wall_time()
+
+        index = EventIndex.load(file + '.idx', file, self)
+        if index is None:
+            index = self.build_event_index(file)
+            index.save(file + '.idx')
+
+        self.eventIndex = index
+        self.eventFile = open(file, 'rb')
+        self.lastTime = index.lastTime
+        self.numEvents = index.numEvents
+
+        # Restrict the times to the selected range, the events are still
+        #   loaded from the whole file
+        first = bisect.bisect_left(index.times, startTime)
+        if endTime is None:
+            last = len(index.times)
+        else:
+            last = bisect.bisect_right(index.times, endTime)
+        self.times = index.times[first:last]
+
+        end_wall_time = wall_time()
+
+        print 'Unique events:', self.numEvents, 'windows:', \
+            len(index.windows)
+        print 'Time to open:', end_wall_time - start_wall_time
+
+    def close_indexed_events(self):
+        """Drop the index and all loaded windows"""
+        if self.eventFile is not None:
+            self.eventFile.close()
+        self.eventIndex = None
+        self.eventFile = None
+        self.windows = collections.OrderedDict()
+
+    def find_window(self, time):
+        """Make the loaded window containing the given time the current
+        one, loading it if necessary and evicting the least recently used
+        window if too many are loaded"""
+        index = max(bisect.bisect_right(self.eventIndex.startTimes, time) - 1,
+            0)
+
+        window = self.windows.pop(index, None)
+        if window is None:
+            window = self.load_window(index)
+            if len(self.windows) >= self.maxWindows:
+                self.windows.popitem(last=False)
+        self.windows[index] = window
+
+        self.unitEvents = window.unitEvents
+        self.insts = window.insts
+        self.lines = window.lines
+
+    def load_window(self, index):
+        """Parse the events of one window of the indexed event file"""
+        windows = self.eventIndex.windows
+        startTime, offset, lastEvents = windows[index]
+        if index + 1 < len(windows):
+            endOffset = windows[index + 1][1]
+        else:
+            endOffset = os.fstat(self.eventFile.fileno()).st_size
+
+        # Loading events mustn't change the totals from the index
+        numEvents = self.numEvents
+        lastTime = self.lastTime
+
+        window = EventWindow(self.eventIndex.units)
+        self.unitEvents = window.unitEvents
+        self.insts = window.insts
+        self.lines = window.lines
+
+        # Instructions and lines are usually defined shortly before their
+        #   events, so take their definitions from the previous window too
+        if index > 0:
+            prevOffset = windows[index - 1][1]
+            self.eventFile.seek(prevOffset)
+            for l in self.eventFile.read(offset - prevOffset).splitlines():
+                match = match_line_re.match(l)
+                if match is not None:
+                    line_type, rest = match.group(3, 4)
+                    if line_type == 'MinorInst:':
+                        self.add_minor_inst(rest)
+                    elif line_type == 'MinorLine:':
+                        self.add_minor_line(rest)
+
+        # Start with the last event of every unit before the window
+        lastTimeLines = {}
+        for unit, (time, rest, comments) in lastEvents.iteritems():
+            if rest is None:
+                event = BlobEvent(unit, time, {})
+            else:
+                event = self.make_trace_event(unit, time, rest)
+                lastTimeLines[unit] = rest
+            event.comments = list(comments)
+            self.add_unit_event(event)
+
+        parser = EventParser(self, lastTimeLines)
+        self.eventFile.seek(offset)
+        for l in self.eventFile.read(endOffset - offset).splitlines():
+            parser.parse_line(l)
+        parser.update_comments()
+
+        self.numEvents = numEvents
+        self.lastTime = lastTime
+        return window
+
+    def build_event_index(self, file):
+        """Parse a whole event file to build its index.  Only the events
+        of the current window are kept, at every window boundary they are
+        dropped except for the last event of each unit"""
+        print 'Indexing file', file
+
+        index = EventIndex(file, self)
+        window = EventWindow(index.units)
+        self.unitEvents = window.unitEvents
+        self.insts = window.insts
+        self.lines = window.lines
+
+        def add_window_times(startTime):
+            times = set()
+            for events in self.unitEvents.itervalues():
+                for event in events:
+                    if event.time >= startTime:
+                        times.add(event.time)
+            index.times.extend(sorted(times))
+
+        parser = EventParser(self, progress=True)
+        startTime = None
+        windowLineCount = 0
+        offset = 0
+
+        f = open(file, 'rb')
+        for l in f:
+            match = match_time_re.match(l)
+            if match is not None:
+                time = int(match.group(1))
+                # Windows only start when the time changes, so all the
+                #   comments of a time step are in the same window
+                if time != parser.time and (startTime is None or
+                    windowLineCount >= self.indexWindowLines):
+                    parser.update_comments()
+                    if startTime is not None:
+                        add_window_times(startTime)
+
+                    lastEvents = {}
+                    for unit, events in self.unitEvents.iteritems():
+                        if len(events) > 0:
+                            event = events[-1]
+                            lastEvents[unit] = (event.time,
+                                parser.lastTimeLines.get(unit, None),
+                                event.comments)
+                            del events[:-1]
+                    self.insts.clear()
+                    self.lines.clear()
+
+                    index.add_window(time, offset, lastEvents)
+                    startTime = time
+                    windowLineCount = 0
+
+            parser.parse_line(l)
+            windowLineCount += 1
+            offset += len(l)
+        f.close()
+
+        parser.update_comments()
+        if startTime is not None:
+            add_window_times(startTime)
+
+        index.numEvents = self.numEvents
+        index.lastTime = self.lastTime
+        return index
+
     def add_blob_picture(self, offset, pic, nameDict):
         """Add a parsed ASCII-art pipeline markup to the model"""
         pic_width = 0
@@ -39,19 +39,22 @@
 
 # Pipeline activity viewer for the O3 CPU model.
 
+import heapq
+import itertools
 import optparse
 import os
+import struct
 import sys
-import copy
 
-# Temporary storage for instructions. The queue is filled in out-of-order
-# until it reaches 'max_threshold' number of instructions. It is then
-# sorted out and instructions are printed out until their number drops to
-# 'min_threshold'.
+# Temporary storage for instructions. The queue is a heap ordered by
+# sequence number and is filled in out-of-order until it reaches
+# 'max_threshold' number of instructions. Instructions are then popped
+# and printed out until their number drops to 'min_threshold'.
 # It is assumed that the instructions are not out of order for more then
 # 'min_threshold' places - otherwise they will appear out of order.
 insts = {
-    'queue': [] ,         # Instructions to print.
+    'queue': [] ,         # Heap of (seq. number, count, instruction) to print.
+    'count': itertools.count(), # Keeps the order of equal seq. numbers.
     'max_threshold':2000, # Instructions are sorted out and printed when
                           # their number reaches this threshold.
     'min_threshold':1000, # Printing stops when this number is reached.
@@ -67,8 +70,82 @@ insts = {
     'only_committed':0,   # Set if only committed instructions are printed.
 }
 
+# Index of a trace, stored next to it in TRACE_FILE.idx. The trace is split
+# into blocks of 'INDEX_BLOCK' lines. Every entry holds the offset of a block
+# and the largest tick and fetch seq. number up to the end of the block. Both
+# never decrease, so the first block reaching a start tick or seq. number is
+# found by a binary search in the index file.
+INDEX_MAGIC = 'O3PVIDX1'
+INDEX_HEADER = struct.Struct('<8sQQ')   # magic, trace size, trace mtime
+INDEX_ENTRY = struct.Struct('<QQQ')     # offset, max. tick, max. seq. number
+INDEX_BLOCK = 4096
+
+def index_valid(trace_name, index_name):
+    """Check if the index exists and belongs to the current trace."""
+    if not os.path.exists(index_name):
+        return False
+    st = os.stat(trace_name)
+    with open(index_name, 'rb') as index:
+        header = index.read(INDEX_HEADER.size)
+    if len(header) != INDEX_HEADER.size:
+        return False
+    return INDEX_HEADER.unpack(header) == (INDEX_MAGIC, st.st_size,
+                                           int(st.st_mtime))
+
+def build_index(trace_name, index_name):
+    """Scan the whole trace once and write its index."""
+    st = os.stat(trace_name)
+    max_tick = 0
+    max_sn = 0
+    offset = 0
+    block_offset = 0
+    tmp_name = index_name + '.tmp'
+    with open(trace_name, 'rb') as trace, open(tmp_name, 'wb') as index:
+        index.write(INDEX_HEADER.pack(INDEX_MAGIC, st.st_size,
+                                      int(st.st_mtime)))
+        for lineno, line in enumerate(trace):
+            if lineno % INDEX_BLOCK == 0 and lineno > 0:
+                index.write(INDEX_ENTRY.pack(block_offset, max_tick, max_sn))
+                block_offset = offset
+            offset += len(line)
+
+            fields = line.split(':')
+            if fields[0] != 'O3PipeView': continue
+            max_tick = max(max_tick, int(fields[2]))
+            if fields[1] == 'fetch':
+                max_sn = max(max_sn, int(fields[5]))
+        if offset > block_offset:
+            index.write(INDEX_ENTRY.pack(block_offset, max_tick, max_sn))
+    os.rename(tmp_name, index_name)
+
+def find_offset(index_name, start_tick, start_sn):
+    """Return the offset of the block with the first line at or after the
+    start tick, or with the first fetch at or after the start seq.
+    number. Return None if there is no such line."""
+    key = 1 if start_tick != 0 else 2
+    start = start_tick if start_tick != 0 else start_sn
+    with open(index_name, 'rb') as index:
+        index.seek(0, os.SEEK_END)
+        entries = (index.tell() - INDEX_HEADER.size) / INDEX_ENTRY.size
+
+        def entry(i):
+            index.seek(INDEX_HEADER.size + i * INDEX_ENTRY.size)
+            return INDEX_ENTRY.unpack(index.read(INDEX_ENTRY.size))
+
+        lo, hi = 0, entries
+        while lo < hi:
+            mid = (lo + hi) / 2
+            if entry(mid)[key] < start:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo == entries:
+            return None
+        return entry(lo)[0]
+
 def process_trace(trace, outfile, cycle_time, width, color, timestamps,
-                  committed_only, store_completions, start_tick, stop_tick, start_sn, stop_sn):
+                  committed_only, store_completions, start_tick, stop_tick, start_sn, stop_sn,
+                  index_name=None):
     global insts
 
     insts['sn_start'] = start_sn
@@ -80,6 +157,12 @@ def process_trace(trace, outfile, cycle_time, width, color, timestamps,
     line = None
     fields = None
 
+    # Jump to the block with the first line to be processed
+    if index_name and (start_tick != 0 or start_sn != 0):
+        offset = find_offset(index_name, start_tick, start_sn)
+        if offset is None: return
+        trace.seek(offset)
+
     # Skip lines up to the starting tick
     if start_tick != 0:
         while True:
@@ -131,7 +214,7 @@ def process_trace(trace, outfile, cycle_time, width, color, timestamps,
             if fields[1] == 'fetch':
                 if ((stop_tick > 0 and int(fields[2]) > stop_tick+insts['tick_drift']) or
                     (stop_sn > 0 and int(fields[5]) > (stop_sn+insts['max_threshold']))):
-                    print_insts(outfile, cycle_time, width, color, timestamps, 0)
+                    print_insts(outfile, cycle_time, width, color, timestamps, store_completions, 0)
                     return
                 (curr_inst['pc'], curr_inst['upc']) = fields[3:5]
                 curr_inst['sn'] = int(fields[5])
@@ -150,25 +233,20 @@ def process_trace(trace, outfile, cycle_time, width, color, timestamps,
         fields = line.split(':')
 
 
-#Sorts out instructions according to sequence number
-def compare_by_sn(a, b):
-    return cmp(a['sn'], b['sn'])
-
 # Puts new instruction into the print queue.
-# Sorts out and prints instructions when their number reaches threshold value
+# Prints the oldest instructions when their number reaches threshold value
 def queue_inst(outfile, inst, cycle_time, width, color, timestamps, store_completions):
     global insts
-    l_copy = copy.deepcopy(inst)
-    insts['queue'].append(l_copy)
+    heapq.heappush(insts['queue'],
+                   (inst['sn'], next(insts['count']), dict(inst)))
     if len(insts['queue']) > insts['max_threshold']:
         print_insts(outfile, cycle_time, width, color, timestamps, store_completions, insts['min_threshold'])
 
-# Sorts out and prints instructions in print queue
+# Prints instructions in print queue in order of their seq. number
 def print_insts(outfile, cycle_time, width, color, timestamps, store_completions, lower_threshold):
     global insts
-    insts['queue'].sort(compare_by_sn)
     while len(insts['queue']) > lower_threshold:
-        print_item=insts['queue'].pop(0)
+        print_item = heapq.heappop(insts['queue'])[2]
         # As the instructions are processed out of order the main loop starts
         # earlier then specified by start_sn/tick and finishes later then what
         # is defined in stop_sn/tick.
@@ -347,6 +425,12 @@ def main():
         '--store_completions',
         action='store_true', default=False,
         help="additionally display store completion ticks (default: '%default')")
+    parser.add_option(
+        '--index',
+        action='store_true', default=False,
+        help="jump to the start of the range using an index of the trace in "
+        "TRACE_FILE.idx, which is built if it's missing or outdated "
+        "(default: '%default')")
     (options, args) = parser.parse_args()
     if len(args) != 1:
         parser.error('incorrect number of arguments')
@@ -359,6 +443,12 @@ def main():
     if not inst_range:
         parser.error('invalid range')
         sys.exit(1)
+    index_name = None
+    if options.index:
+        index_name = args[0] + '.idx'
+        if not index_valid(args[0], index_name):
+            print 'Building index... ',
+            build_index(args[0], index_name)
     # Process trace
     print 'Processing trace... ',
     with open(args[0], 'r') as trace:
@@ -366,7 +456,7 @@ def main():
             process_trace(trace, out, options.cycle_time, options.width,
                           options.color, options.timestamps,
                           options.only_committed, options.store_completions,
-                          *(tick_range + inst_range))
+                          *(tick_range + inst_range), index_name=index_name)
     print 'done!'
 
 
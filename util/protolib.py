@@ -74,6 +74,9 @@
 import gzip
 import struct
 
+# Number of bytes read from the file at once by the bulk decoders
+BUFFER_SIZE = 1 << 22
+
 def openFileRd(in_file):
     """
     This opens the file passed as argument for reading using an appropriate
@@ -143,6 +146,86 @@ def decodeMessage(in_file, message):
     except IOError:
         return False
 
+def _DecodeVarint32Buffer(buf, pos):
+    """
+    Decode a Varint32 starting at pos in the string buf, in the same way
+    as _DecodeVarint32. Return the value and the position following
+    it, or (None, pos) if buf ends before the varint.
+    """
+    result = 0
+    shift = 0
+    start = pos
+    end = len(buf)
+    while pos < end:
+        b = ord(buf[pos])
+        result |= ((b & 0x7f) << shift)
+        pos += 1
+        if not (b & 0x80):
+            if result > 0x7fffffffffffffff:
+                result -= (1 << 64)
+                result |= ~0xffffffff
+            else:
+                result &= 0xffffffff
+            return (result, pos)
+        shift += 7
+        if shift >= 64:
+            raise IOError('Too many bytes when decoding varint.')
+    return (None, start)
+
+def iterMessageBuffers(in_file, buffer_size=BUFFER_SIZE):
+    """
+    Iterate over the serialized messages from the current position of
+    the file to its end. The file is read in large chunks and every
+    chunk is split into as many messages as possible, which is much
+    faster than decodeMessage for long traces. A truncated message at
+    the end of the file is ignored.
+    """
+    buf = ''
+    while True:
+        chunk = in_file.read(buffer_size)
+        if not chunk:
+            return
+        buf += chunk
+
+        pos = 0
+        end = len(buf)
+        while pos < end:
+            size, start = _DecodeVarint32Buffer(buf, pos)
+            if size is None or start + size > end:
+                break
+            if size == 0:
+                return
+            pos = start + size
+            yield buf[start:pos]
+
+        # Keep the incomplete message for the next chunk
+        buf = buf[pos:]
+
+def iterBufferBatches(in_file, batch_size, buffer_size=BUFFER_SIZE):
+    """
+    Group the serialized messages of the file into lists of at most
+    batch_size messages, for example to parse them in several
+    processes.
+    """
+    batch = []
+    for buf in iterMessageBuffers(in_file, buffer_size):
+        batch.append(buf)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def iterMessages(in_file, message, buffer_size=BUFFER_SIZE):
+    """
+    Decode the messages from the current position of the file to its
+    end into message and yield it after each one. The same message
+    object is reused, so copy it to keep it around.
+    """
+    for buf in iterMessageBuffers(in_file, buffer_size):
+        message.ParseFromString(buf)
+        yield message
+
 def _EncodeVarint32(out_file, value):
   """
   The encoding of the Varint32 is copied from